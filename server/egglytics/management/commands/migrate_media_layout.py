@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from egglytics.views import storage
+from egglytics.views.models import ImageDetails, ProcessingJob
+
+# Jobs that read or write the file of an image, its file is not moved while one is queued or running
+FILE_JOB_KINDS = ("RECALIBRATE", "BUILD_DERIVATIVES")
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves images stored flat in MEDIA_ROOT/uploads to the sharded layout (see egglytics/views/storage.py). "
+        "Safe to run while the server is up and to interrupt, each file is moved on its own."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=0, help="Stop after this many files (0 moves all).")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the files to move.")
+
+    def handle(self, *args, **options):
+        # Images still being processed or recalibrated are left for the next run, their file is being written
+        file_paths = (
+            ImageDetails.objects
+            .filter(is_processed=True)
+            .values_list("file_path", flat=True)
+            .distinct()
+            .order_by("file_path")
+        )
+        flat = [file_path for file_path in file_paths.iterator() if not storage.is_sharded(file_path)]
+        if options["limit"]:
+            flat = flat[:options["limit"]]
+
+        if options["dry_run"]:
+            self.stdout.write(f"{len(flat)} files to move.")
+            return
+
+        moved = 0
+        missing = 0
+        busy = 0
+        for file_path in flat:
+            if self.in_use(file_path):
+                busy += 1
+                self.stderr.write(f"Being processed, left for the next run: {file_path}")
+                continue
+
+            new_file_path = storage.relocate(file_path)
+            if new_file_path is None:
+                missing += 1
+                self.stderr.write(f"Missing on disk, left as is: {file_path}")
+                continue
+
+            # One UPDATE switches every record sharing the file at once, the old file stays readable until then.
+            # A recalibration marks its image unprocessed before reading file_path, so either it started
+            # first and its record is not moved, or it reads the new path.
+            updated = ImageDetails.objects.filter(file_path=file_path, is_processed=True).update(
+                file_path=new_file_path, last_update=timezone.now()
+            )
+
+            if not updated:
+                # The records moved on meanwhile (deleted or recalibrated), drop the copy
+                storage.remove_stored_file(new_file_path)
+            elif not ImageDetails.objects.filter(file_path=file_path).exists():
+                storage.remove_stored_file(file_path)
+            else:
+                # A record started a recalibration in between, it keeps the old file (moved on the next run)
+                self.stderr.write(f"Still in use, old file kept: {file_path}")
+            moved += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} files, {missing} missing, {busy} being processed."))
+
+    def in_use(self, file_path):
+        """
+        Whether a record of a file is being processed or has a job queued or running that reads or writes it.
+        """
+        images = ImageDetails.objects.filter(file_path=file_path)
+        if images.filter(is_processed=False).exists():
+            return True
+        return ProcessingJob.objects.filter(
+            kind__in=FILE_JOB_KINDS,
+            status__in=("PENDING", "RUNNING"),
+            payload__image_id__in=list(images.values_list("image_id", flat=True)),
+        ).exists()
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from egglytics.views.jobs import start_workers
+
+
+class Command(BaseCommand):
+    help = "Runs background processing workers without serving HTTP (see egglytics/views/jobs.py)."
+
+    def handle(self, *args, **options):
+        start_workers()
+        self.stdout.write("Workers running, press CTRL+C to stop.")
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping workers, unfinished jobs are resumed by the next worker.")
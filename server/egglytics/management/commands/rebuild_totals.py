@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from egglytics.views import totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the running totals of the view page (see egglytics/views/totals.py) from the batches and images, "
+        "reporting every row that drifted. Safe to run while the server is up."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Only report the drift, exit with an error if there is any.")
+
+    def handle(self, *args, **options):
+        drift = totals.rebuild_totals(check=options["check"])
+
+        for scope, key, stored, computed in drift:
+            label = f"{scope} {key}".strip()
+            self.stdout.write(
+                f"{label}: stored {dict(zip(totals.TOTAL_FIELDS, stored))}, "
+                f"computed {dict(zip(totals.TOTAL_FIELDS, computed))}"
+            )
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Totals are up to date."))
+        elif options["check"]:
+            raise CommandError(f"{len(drift)} rows drifted, run without --check to rebuild them.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(drift)} drifted rows."))
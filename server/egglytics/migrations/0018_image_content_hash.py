@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('egglytics', '0017_processingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagedetails',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='imagedetails',
+            name='file_path',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('egglytics', '0018_image_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagedetails',
+            name='packed_point_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='imagedetails',
+            name='packed_points',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
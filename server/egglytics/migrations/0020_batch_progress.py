@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('egglytics', '0019_packed_points'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batchdetails',
+            name='images_failed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='batchdetails',
+            name='images_processed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='batchdetails',
+            name='processing_started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
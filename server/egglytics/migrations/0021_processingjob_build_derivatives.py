@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('egglytics', '0020_batch_progress'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='processingjob',
+            name='kind',
+            field=models.CharField(choices=[('PROCESS_BATCH', 'Process Batch'), ('RECALIBRATE', 'Recalibrate'), ('BUILD_DERIVATIVES', 'Build Derivatives')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:37
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('egglytics', '0021_processingjob_build_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('upload_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('batch_name', models.CharField(max_length=255)),
+                ('owner', models.CharField(default='Incognito', max_length=150)),
+                ('files', models.JSONField(default=list)),
+                ('chunk_size', models.IntegerField()),
+                ('status', models.CharField(choices=[('OPEN', 'Open'), ('FINALIZED', 'Finalized')], default='OPEN', max_length=10)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('last_update', models.DateTimeField(auto_now=True)),
+                ('batch', models.ForeignKey(blank=True, db_column='batch_id', null=True, on_delete=django.db.models.deletion.SET_NULL, to='egglytics.batchdetails')),
+            ],
+            options={
+                'db_table': 'upload_sessions',
+            },
+        ),
+        migrations.CreateModel(
+            name='UploadChunk',
+            fields=[
+                ('chunk_id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('file_index', models.IntegerField()),
+                ('chunk_index', models.IntegerField()),
+                ('size', models.IntegerField()),
+                ('checksum', models.CharField(max_length=80)),
+                ('session', models.ForeignKey(db_column='upload_id', on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='egglytics.uploadsession')),
+            ],
+            options={
+                'db_table': 'upload_chunks',
+                'unique_together': {('session', 'file_index', 'chunk_index')},
+            },
+        ),
+    ]
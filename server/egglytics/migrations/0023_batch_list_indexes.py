@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('egglytics', '0022_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='batchdetails',
+            index=models.Index(fields=['date_updated', 'id'], name='batch_date_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='batchdetails',
+            index=models.Index(fields=['batch_name', 'id'], name='batch_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='batchdetails',
+            index=models.Index(fields=['owner', 'id'], name='batch_owner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='batchdetails',
+            index=models.Index(fields=['total_images', 'id'], name='batch_total_images_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='batchdetails',
+            index=models.Index(fields=['total_eggs', 'id'], name='batch_total_eggs_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='batchdetails',
+            index=models.Index(fields=['is_complete', 'has_fail_present', 'id'], name='batch_status_idx'),
+        ),
+    ]
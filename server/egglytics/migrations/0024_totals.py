@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:43
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_totals(apps, schema_editor):
+    # Same sums as totals.compute_totals, for the batches uploaded before the table existed
+    BatchDetails = apps.get_model("egglytics", "BatchDetails")
+    ImageDetails = apps.get_model("egglytics", "ImageDetails")
+    Totals = apps.get_model("egglytics", "Totals")
+
+    rows = []
+    summary = BatchDetails.objects.aggregate(batches=Count("id"), images=Sum("total_images"), eggs=Sum("total_eggs"))
+    rows.append(Totals(scope="all", key="", batches=summary["batches"], images=summary["images"] or 0, eggs=summary["eggs"] or 0))
+    for row in BatchDetails.objects.values("owner").annotate(batches=Count("id"), images=Sum("total_images"), eggs=Sum("total_eggs")):
+        rows.append(Totals(scope="owner", key=row["owner"], batches=row["batches"], images=row["images"] or 0, eggs=row["eggs"] or 0))
+    for row in ImageDetails.objects.values("model_used").annotate(images=Count("image_id"), eggs=Sum("total_eggs")):
+        rows.append(Totals(scope="model", key=row["model_used"], images=row["images"], eggs=row["eggs"] or 0))
+    Totals.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('egglytics', '0023_batch_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Totals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('all', 'All'), ('owner', 'Owner'), ('model', 'Model')], max_length=10)),
+                ('key', models.CharField(blank=True, default='', max_length=255)),
+                ('batches', models.BigIntegerField(default=0)),
+                ('images', models.BigIntegerField(default=0)),
+                ('eggs', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'totals',
+                'unique_together': {('scope', 'key')},
+            },
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
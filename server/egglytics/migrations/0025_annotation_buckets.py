@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:52
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('egglytics', '0024_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='annotationpoints',
+            name='bucket',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('x'), '/', models.Value(32)), '*', models.Value(65536)), '+', django.db.models.expressions.CombinedExpression(models.F('y'), '/', models.Value(32))), output_field=models.IntegerField()),
+        ),
+        migrations.AddField(
+            model_name='annotationrect',
+            name='bucket',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('x_init'), '/', models.Value(32)), '*', models.Value(65536)), '+', django.db.models.expressions.CombinedExpression(models.F('y_init'), '/', models.Value(32))), output_field=models.IntegerField()),
+        ),
+        migrations.AddIndex(
+            model_name='annotationpoints',
+            index=models.Index(fields=['image', 'bucket'], name='annotation_point_bucket_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='annotationrect',
+            index=models.Index(fields=['image', 'bucket'], name='annotation_rect_bucket_idx'),
+        ),
+    ]
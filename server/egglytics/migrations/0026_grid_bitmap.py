@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:59
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def grids_to_bitmaps(apps, schema_editor):
+    # Same layout as grids.pack_cells: bit row * cols + col, least significant bit of each byte first
+    ImageDetails = apps.get_model("egglytics", "ImageDetails")
+    VerifiedGrids = apps.get_model("egglytics", "VerifiedGrids")
+
+    cells = defaultdict(list)
+    for image_id, x, y in VerifiedGrids.objects.values_list("image_id", "x", "y").iterator():
+        cells[image_id].append((x, y))
+
+    for image_id, image_cells in cells.items():
+        cols = max(x for x, _ in image_cells) + 1
+        rows = max(y for _, y in image_cells) + 1
+        bitmap = bytearray((cols * rows + 7) // 8)
+        for x, y in image_cells:
+            bit = y * cols + x
+            bitmap[bit // 8] |= 1 << (bit % 8)
+        ImageDetails.objects.filter(image_id=image_id).update(grid_bitmap=bytes(bitmap), grid_cols=cols, grid_rows=rows)
+
+
+def bitmaps_to_grids(apps, schema_editor):
+    ImageDetails = apps.get_model("egglytics", "ImageDetails")
+    VerifiedGrids = apps.get_model("egglytics", "VerifiedGrids")
+
+    images = ImageDetails.objects.filter(grid_bitmap__isnull=False).values_list("image_id", "grid_bitmap", "grid_cols", "grid_rows")
+    for image_id, bitmap, cols, rows in images.iterator():
+        bitmap = bytes(bitmap)
+        VerifiedGrids.objects.bulk_create([
+            VerifiedGrids(image_id=image_id, x=bit % cols, y=bit // cols)
+            for bit in range(cols * rows)
+            if bitmap[bit // 8] >> (bit % 8) & 1
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('egglytics', '0025_annotation_buckets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagedetails',
+            name='grid_bitmap',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='imagedetails',
+            name='grid_cols',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='imagedetails',
+            name='grid_rows',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(grids_to_bitmaps, bitmaps_to_grids),
+    ]
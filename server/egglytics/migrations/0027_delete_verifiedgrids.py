@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:59
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # Separate from 0026, the cells are copied and committed before their table is dropped
+    dependencies = [
+        ('egglytics', '0026_grid_bitmap'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='VerifiedGrids',
+        ),
+    ]
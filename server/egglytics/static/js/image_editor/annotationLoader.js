@@ -0,0 +1,251 @@
+//
+//
+//
+// VIEWPORT ANNOTATION LOADING
+//
+//
+//
+
+import { editQueue } from './api.js';
+import { imageToViewportCoordinates, viewportToPixelCoordinates } from './viewer.js';
+
+// Milliseconds the viewer must stay still before the annotations of the view are requested
+const LOAD_DELAY = 150;
+
+// Part of the view added on every side of the requested box, small pans need no request
+const LOAD_MARGIN = 0.25;
+
+// First bytes of the binary answer, see VIEW_FORMAT_MAGIC in editor.py
+const VIEW_FORMAT_MAGIC = "EGV1";
+
+// Int32 values of the header after the magic: box (4), cell, the two counts and the four section lengths
+const VIEW_HEADER_LENGTH = 11;
+
+// Int32 values per row of each section, in the order of the answer
+const VIEW_SECTIONS = [
+    ["points", 2],
+    ["point_clusters", 3],
+    ["rects", 5],
+    ["rect_clusters", 3],
+];
+
+/**
+ * AnnotationLoader
+ * ----------------
+ * Loads the annotations of the part of the image in view.
+ *
+ * Responsibilities:
+ * - Request /editor/<image_id>/annotations/ for the box in view
+ *   (plus a margin) once the viewer stops moving
+ * - Skip the request when the new view lies inside a box that
+ *   was loaded completely (without clusters)
+ * - Drop the answer of a request overtaken by a newer one
+ * - Keep the annotation counts of the whole image
+ *
+ * The editor page carries no annotations, so it opens at once even
+ * for images with tens of thousands of eggs. A crowded box comes back
+ * as clusters (see editor.annotations_in_view) until the user zooms in.
+ *
+ * Queued edits are sent before each request, so the answer
+ * already contains them.
+ *
+ * The answer is requested in the binary layout (format=bin): a
+ * small header followed by int32 sections, read as typed arrays
+ * without parsing (see decodeView). It is several times smaller
+ * than the JSON answer and much faster to read for dense images.
+ *
+ * Workflow:
+ * Viewer Settles → Box In View → Flush Edits → Request → onLoad(data)
+ */
+export class AnnotationLoader {
+    /**
+     * Creates a new AnnotationLoader instance.
+     *
+     * @param {Object} viewer - OpenSeadragon viewer instance.
+     * @param {number|string} imageId - Identifier of the image.
+     * @param {Function} onLoad - Called with the answer of the server.
+     */
+    constructor(viewer, imageId, onLoad) {
+        this.viewer = viewer;
+        this.imageId = imageId;
+        this.onLoad = onLoad;
+        this.loaded = null;         // { box, complete } of the last answer
+        this.controller = null;     // AbortController of the request in flight
+        this.timer = null;
+        this.counts = { points: 0, rects: 0 };
+    }
+
+    /**
+     * Loads the view now and again whenever the viewer settles.
+     */
+    start() {
+        const schedule = () => {
+            clearTimeout(this.timer);
+            this.timer = setTimeout(() => this.load(), LOAD_DELAY);
+        };
+        this.viewer.addHandler("animation-finish", schedule);
+        this.viewer.addHandler("resize", schedule);
+        this.load();
+    }
+
+    /**
+     * Forgets the loaded box, the next load always requests.
+     */
+    invalidate() {
+        this.loaded = null;
+    }
+
+    /**
+     * Requests the annotations of the view, unless they are loaded already.
+     */
+    async load() {
+        const tiledImage = this.viewer.world.getItemAt(0);
+        if (!tiledImage) return;
+
+        const view = this.viewBox(tiledImage);
+        if (this.loaded && this.loaded.complete && contains(this.loaded.box, view)) return;
+
+        const size = tiledImage.getContentSize();
+        const marginX = (view[2] - view[0]) * LOAD_MARGIN;
+        const marginY = (view[3] - view[1]) * LOAD_MARGIN;
+        const box = [
+            Math.max(0, Math.floor(view[0] - marginX)),
+            Math.max(0, Math.floor(view[1] - marginY)),
+            Math.min(size.x, Math.ceil(view[2] + marginX)),
+            Math.min(size.y, Math.ceil(view[3] + marginY)),
+        ];
+        const zoom = tiledImage.viewportToImageZoom(this.viewer.viewport.getZoom(true));
+
+        if (this.controller) this.controller.abort();
+        const controller = new AbortController();
+        this.controller = controller;
+
+        try {
+            await editQueue(this.imageId).flush();
+
+            const params = new URLSearchParams({
+                x1: box[0], y1: box[1], x2: box[2], y2: box[3], zoom, format: "bin",
+            });
+            const response = await fetch(`/editor/${this.imageId}/annotations/?${params}`, {
+                signal: controller.signal,
+            });
+            if (!response.ok) throw new Error(`Server error: ${response.status}`);
+            const data = decodeView(await response.arrayBuffer());
+            if (controller !== this.controller) return;
+
+            this.loaded = {
+                box: data.box,
+                complete: data.point_clusters.length === 0 && data.rect_clusters.length === 0,
+            };
+            this.counts = { points: data.point_count, rects: data.rect_count };
+            this.onLoad(data);
+
+        } catch (err) {
+            if (err.name !== "AbortError") console.error("Annotations could not be loaded:", err);
+        } finally {
+            if (controller === this.controller) this.controller = null;
+        }
+    }
+
+    /**
+     * Box of the image in view, in image pixels.
+     * @returns {Array<number>} [x1, y1, x2, y2]
+     */
+    viewBox(tiledImage) {
+        const rect = tiledImage.viewportToImageRectangle(this.viewer.viewport.getBounds(true));
+        return [rect.x, rect.y, rect.x + rect.width, rect.y + rect.height];
+    }
+}
+
+/**
+ * Reads the binary answer of /editor/<image_id>/annotations/.
+ *
+ * Points and rects stay flat Int32Array views of the answer,
+ * the managers read them directly (loadPackedPoints, loadPackedRects).
+ * Clusters are few and become { x, y, count } objects.
+ *
+ * @param {ArrayBuffer} buffer - Body of the answer.
+ * @returns {Object} { box, cell, point_count, rect_count,
+ *                     points, point_clusters, rects, rect_clusters }
+ */
+export function decodeView(buffer) {
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== VIEW_FORMAT_MAGIC) throw new Error("Unknown annotation format");
+
+    // The server writes little-endian int32, like the typed arrays of every browser platform
+    const header = new Int32Array(buffer, 4, VIEW_HEADER_LENGTH);
+    const data = {
+        box: Array.from(header.subarray(0, 4)),
+        cell: header[4],
+        point_count: header[5],
+        rect_count: header[6],
+    };
+
+    let offset = 4 + VIEW_HEADER_LENGTH * 4;
+    VIEW_SECTIONS.forEach(([name, width], i) => {
+        const length = header[7 + i] * width;
+        data[name] = new Int32Array(buffer, offset, length);
+        offset += length * 4;
+    });
+
+    data.point_clusters = unpackClusters(data.point_clusters);
+    data.rect_clusters = unpackClusters(data.rect_clusters);
+    return data;
+}
+
+/**
+ * Turns flat x, y, count triples into cluster objects.
+ */
+function unpackClusters(values) {
+    const clusters = [];
+    for (let i = 0; i < values.length; i += 3) {
+        clusters.push({ x: values[i], y: values[i + 1], count: values[i + 2] });
+    }
+    return clusters;
+}
+
+/**
+ * Whether box a contains box b, both [x1, y1, x2, y2].
+ */
+function contains(a, b) {
+    return a[0] <= b[0] && a[1] <= b[1] && a[2] >= b[2] && a[3] >= b[3];
+}
+
+/**
+ * Draws clusters of annotations on the canvas overlay.
+ *
+ * Each cluster is a disc at the mean position of its annotations,
+ * growing with their number, labelled with the count.
+ *
+ * @param {Object} viewer - OpenSeadragon viewer instance.
+ * @param {HTMLCanvasElement} canvas - Canvas overlay.
+ * @param {Array<Object>} clusters - { x, y, count } in image space.
+ * @param {string} color - Fill color of the discs.
+ */
+export function drawClusters(viewer, canvas, clusters, color) {
+    const ctx = canvas.getContext("2d");
+
+    ctx.font = "bold 11px sans-serif";
+    ctx.textAlign = "center";
+    ctx.textBaseline = "middle";
+
+    for (const c of clusters) {
+        const vp = imageToViewportCoordinates(viewer, c.x, c.y);
+        const pixel = viewportToPixelCoordinates(viewer, vp, true);
+        const radius = Math.min(24, 8 + 3 * Math.log2(c.count));
+
+        ctx.globalAlpha = 0.7;
+        ctx.fillStyle = color;
+        ctx.beginPath();
+        ctx.arc(pixel.x, pixel.y, radius, 0, Math.PI * 2);
+        ctx.fill();
+
+        ctx.globalAlpha = 1;
+        ctx.strokeStyle = "white";
+        ctx.lineWidth = 2;
+        ctx.stroke();
+
+        ctx.fillStyle = "black";
+        ctx.fillText(String(c.count), pixel.x, pixel.y);
+    }
+}
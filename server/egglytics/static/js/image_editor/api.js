@@ -25,8 +25,16 @@
  * Annotation Types Supported:
  * - Point annotations (single coordinate markers)
  * - Rectangle annotations (bounding box regions)
+ * - Polygon annotations
  * - Grid interaction states
  *
+ * Edit Queue:
+ * Edits are not sent one request per click. They are queued and
+ * sent together to /editor/<image_id>/edits/, which applies them
+ * in order in a single transaction (see editor.apply_edits).
+ * A batch leaves after a short pause or once it is large, and
+ * only one batch is in flight at a time so the order is kept.
+ *
  * Security:
  * All requests include a CSRF token extracted from browser
  * cookies to comply with server-side security protections.
@@ -39,6 +47,12 @@
  * or notify the user.
  */
 
+// Milliseconds a queued edit waits for more edits before the batch is sent
+const EDIT_FLUSH_DELAY = 300;
+
+// Edits per request, the server accepts up to EDITOR_MAX_OPS
+const EDIT_BATCH_SIZE = 200;
+
 
 /**
  * Retrieves the CSRF token stored in browser cookies.
@@ -65,16 +79,121 @@ function getCSRFToken() {
 }
 
 
+/**
+ * Queue of the edits of one image.
+ *
+ * Purpose:
+ * Collects editor operations and sends them in ordered batches,
+ * so correcting hundreds of eggs costs a handful of requests.
+ *
+ * Every queued edit gets a promise that resolves with its own
+ * result ({ status, id } as returned by the server), or with
+ * null if its batch could not be stored.
+ */
+export class EditQueue {
+    constructor(imageId) {
+        this.imageId = imageId;
+        this.pending = [];      // { op, resolve }
+        this.timer = null;
+        this.sending = null;    // promise of the batch in flight
+
+        // Whatever is still queued leaves with the page
+        window.addEventListener("pagehide", () => this.flush(true));
+    }
+
+    /**
+     * Queues one operation (see editor.apply_edits for the format).
+     * @param {Object} op - e.g. { op: "add_point", x, y }
+     * @returns {Promise<Object|null>} Result of the operation.
+     */
+    push(op) {
+        return new Promise(resolve => {
+            this.pending.push({ op, resolve });
+
+            if (this.pending.length >= EDIT_BATCH_SIZE) {
+                this.flush();
+            } else if (this.timer === null) {
+                this.timer = setTimeout(() => this.flush(), EDIT_FLUSH_DELAY);
+            }
+        });
+    }
+
+    /**
+     * Sends the queued operations, after the batch in flight.
+     * @param {boolean} leaving - True when the page is closing, the request outlives it.
+     */
+    flush(leaving = false) {
+        clearTimeout(this.timer);
+        this.timer = null;
+        if (this.pending.length === 0) return this.sending;
+
+        const batch = this.pending.splice(0, EDIT_BATCH_SIZE);
+        const previous = this.sending || Promise.resolve();
+
+        // A closing page cannot wait for the batch in flight, its request must start now
+        this.sending = leaving
+            ? Promise.all([previous, this.send(batch, true)])
+            : previous.then(() => this.send(batch, false));
+        if (this.pending.length > 0) this.flush(leaving);
+        return this.sending;
+    }
+
+    async send(batch, leaving) {
+        try {
+            const response = await fetch(`/editor/${this.imageId}/edits/`, {
+                method: "POST",
+                headers: {
+                    "Content-Type": "application/json",
+                    "X-CSRFToken": getCSRFToken(),
+                },
+                body: JSON.stringify({ ops: batch.map(entry => entry.op) }),
+                keepalive: leaving,
+            });
+
+            const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.error || `Server error: ${response.status}`);
+            }
+
+            batch.forEach((entry, i) => entry.resolve(data.results[i]));
+
+        } catch (err) {
+            console.error("Edits could not be saved:", err);
+            batch.forEach(entry => entry.resolve(null));
+        }
+    }
+}
+
+// One queue per image of the page
+const queues = new Map();
+
+/**
+ * Returns the edit queue of an image.
+ * @param {number|string} imageId
+ * @returns {EditQueue}
+ */
+export function editQueue(imageId) {
+    if (!queues.has(imageId)) queues.set(imageId, new EditQueue(imageId));
+    return queues.get(imageId);
+}
+
+/**
+ * Queues an edit and reports whether the server applied it.
+ * @returns {Promise<boolean>} False if it failed or found nothing to delete.
+ */
+async function queueEdit(imageId, op) {
+    const result = await editQueue(imageId).push(op);
+    return result !== null && result.status !== "not_found";
+}
+
+
 /**
  * Sends a newly created point annotation to the server.
  *
  * Purpose:
  * When a user marks a mosquito egg using a point marker,
- * this function transmits the image identifier and the
- * annotation coordinates to the backend database.
- *
- * Request Type:
- * POST
+ * this function queues the annotation coordinates for
+ * the backend database.
  *
  * Parameters:
  * - Image identifier
@@ -84,36 +203,9 @@ function getCSRFToken() {
  * Returns:
  * - true if the server confirms the annotation was stored
  * - false if the request fails
- *
- * Failure Handling:
- * If the server cannot be reached, the function reports
- * the failure so the application can optionally store
- * the annotation locally or retry later.
  */
-
 export async function addPointToServer(imageId, x, y) {
-    try {
-        const response = await fetch(`/add_egg_to_db_point/${imageId}/`, {
-            method: "POST",
-            headers: {
-                "Content-Type": "application/json",
-                "X-CSRFToken": getCSRFToken(),
-            },
-            body: JSON.stringify({ x, y })
-        });
-
-        if (!response.ok) {
-            throw new Error(`Server error: ${response.status}`);
-        }
-
-        const data = await response.json();
-        console.log("Server says:", data.message || data.STATUS);
-        return true;
-
-    } catch (err) {
-        console.error("Server offline, storing point locally:", err);
-        return false;
-    }
+    return queueEdit(imageId, { op: "add_point", x, y });
 }
 
 /**
@@ -124,9 +216,6 @@ export async function addPointToServer(imageId, x, y) {
  * this function ensures the corresponding record
  * is removed from the backend database.
  *
- * Request Type:
- * POST
- *
  * Parameters:
  * - Image identifier
  * - X coordinate
@@ -137,28 +226,7 @@ export async function addPointToServer(imageId, x, y) {
  * - false if the request fails
  */
 export async function removePointFromServer(imageId, x, y) {
-    try {
-        const response = await fetch(`/remove_egg_from_db_point/${imageId}/`, {
-            method: "POST",
-            headers: {
-                "Content-Type": "application/json",
-                "X-CSRFToken": getCSRFToken(),
-            },
-            body: JSON.stringify({ x, y })
-        });
-
-        if (!response.ok) {
-            throw new Error(`Server error: ${response.status}`);
-        }
-
-        const data = await response.json();
-        console.log("Server says:", data.message || data.STATUS);
-        return true;
-
-    } catch (err) {
-        console.warn("Deletion failed:", err);
-        return false;
-    }
+    return queueEdit(imageId, { op: "remove_point", x, y });
 }
 
 /**
@@ -170,9 +238,6 @@ export async function removePointFromServer(imageId, x, y) {
  * This function stores the rectangle coordinates in
  * the backend database.
  *
- * Request Type:
- * POST
- *
  * Parameters:
  * - Image identifier
  * - Rectangle corner coordinates
@@ -180,36 +245,9 @@ export async function removePointFromServer(imageId, x, y) {
  * Returns:
  * - true if the server confirms storage
  * - false if the request fails
- *
- * Failure Handling:
- * If the request fails due to connectivity issues,
- * the function returns a failure state so the
- * application may retry or store the annotation locally.
  */
-
 export async function addRectToServer(imageId, x1, y1, x2, y2) {
-    try {
-        const response = await fetch(`/add_egg_to_db_rect/${imageId}/`, {
-            method: "POST",
-            headers: {
-                "Content-Type": "application/json",
-                "X-CSRFToken": getCSRFToken(),
-            },
-            body: JSON.stringify({ x1, y1, x2, y2 })
-        });
-
-        if (!response.ok) {
-            throw new Error(`Server error: ${response.status}`);
-        }
-
-        const data = await response.json();
-        console.log("Server says:", data.message || data.STATUS);
-        return true;
-
-    } catch (err) {
-        console.error("Server offline, storing rect locally:", err);
-        return false;
-    }
+    return queueEdit(imageId, { op: "add_rect", x1, y1, x2, y2 });
 }
 
 
@@ -221,9 +259,6 @@ export async function addRectToServer(imageId, x1, y1, x2, y2) {
  * this function ensures the corresponding rectangle entry
  * is removed from the backend database.
  *
- * Request Type:
- * POST
- *
  * Parameters:
  * - Image identifier
  * - Rectangle corner coordinates
@@ -232,30 +267,8 @@ export async function addRectToServer(imageId, x1, y1, x2, y2) {
  * - true if the server confirms deletion
  * - false if the request fails
  */
-
 export async function removeRectFromServer(imageId, x1, y1, x2, y2) {
-    try {
-        const response = await fetch(`/remove_egg_from_db_rect/${imageId}/`, {
-            method: "POST",
-            headers: {
-                "Content-Type": "application/json",
-                "X-CSRFToken": getCSRFToken(),
-            },
-            body: JSON.stringify({ x1, y1, x2, y2 })
-        });
-
-        if (!response.ok) {
-            throw new Error(`Server error: ${response.status}`);
-        }
-
-        const data = await response.json();
-        console.log("Server says:", data.message || data.STATUS);
-        return true;
-
-    } catch (err) {
-        console.warn("Deletion failed:", err);
-        return false;
-    }
+    return queueEdit(imageId, { op: "remove_rect", x1, y1, x2, y2 });
 }
 
 /**
@@ -267,44 +280,38 @@ export async function removeRectFromServer(imageId, x1, y1, x2, y2) {
  * during annotation. This function records those
  * interactions in the backend database.
  *
- * Request Type:
- * POST
- *
  * Parameters:
  * - Image identifier
  * - Grid X position
  * - Grid Y position
+ * - Columns and rows of the grid, size the bitmap of the image
  *
  * Returns:
  * - true if the server confirms the update
  * - false if the request fails
- *
- * Failure Handling:
- * If the request fails, the application can retry
- * or manage the grid state locally until the
- * server becomes available.
  */
-export async function saveGridToServer(image_id,x,y){
-    console.log("sgfs",image_id,x,y);
-    try{
-        const response = await fetch(`/toggleGrid/${image_id}/`,{
-            method:"POST",
-            headers: {
-                "Content-Type": "application/json",
-                "X-CSRFToken": getCSRFToken(),
-            },
-            body: JSON.stringify({ x,y })
-        }) 
-
-        if (!response.ok) {
-            throw new Error(`Server error: ${response.status}`);
-        }
+export async function saveGridToServer(image_id, x, y, cols, rows) {
+    return queueEdit(image_id, { op: "toggle_grid", x, y, cols, rows });
+}
 
-        const data = await response.json();
-        console.log("Server says:", data.message || data.STATUS);
-        return true;
-    } catch (err){
-        console.warn("Saving failed",err);
-        return false;
-    }
-}
\ No newline at end of file
+/**
+ * Saves the state of a range of grid cells to the server.
+ *
+ * Purpose:
+ * Marks every cell between two corner cells as verified
+ * (or not) with a single operation, instead of one toggle
+ * per cell.
+ *
+ * Parameters:
+ * - Image identifier
+ * - Grid X and Y of two opposite corner cells
+ * - New state of the cells
+ * - Columns and rows of the grid
+ *
+ * Returns:
+ * - true if the server confirms the update
+ * - false if the request fails
+ */
+export async function fillGridToServer(image_id, x1, y1, x2, y2, verified, cols, rows) {
+    return queueEdit(image_id, { op: "fill_grid", x1, y1, x2, y2, verified, cols, rows });
+}
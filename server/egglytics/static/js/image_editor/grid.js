@@ -7,7 +7,7 @@
 // 
 
 
-import { saveGridToServer } from './api.js';
+import { saveGridToServer, fillGridToServer } from './api.js';
 import { addOverlay, addOverlayWithMinimap, removeOverlay, createGridLineOverlay, createGridCellOverlay } from './overlay.js';
 
 /**
@@ -19,6 +19,7 @@ import { addOverlay, addOverlayWithMinimap, removeOverlay, createGridLineOverlay
  * - Draw grid lines on top of the viewer image
  * - Manage filled grid cells used for annotation or selection
  * - Toggle grid cells based on user interaction
+ * - Fill a range of cells from the last toggled one (Shift + FILL_CELL)
  * - Synchronize grid state with the backend server
  * - Restore grid state when switching views or reloading overlays
  *
@@ -49,6 +50,8 @@ export class GridManager {
         this.filledCells = new Map();
         this.visible = false;
         this.img_id = img_id;
+        /** @type {{col: number, row: number, filled: boolean}|null} Last toggled cell, start of range fills */
+        this.anchor = null;
     }
     /**
      * Loads previously saved grid cell states.
@@ -57,17 +60,23 @@ export class GridManager {
      * Restores filled grid cells from data retrieved from the server
      * when an image is opened or annotations are loaded.
      *
-     * @param {Array<Object>} gridArray - Array of saved grid coordinates.
+     * The server sends the grid as a bitmap (see grids.py): bit
+     * row * cols + col is set for a filled cell, bits are counted
+     * from the least significant one of each byte.
+     *
+     * @param {{cols: number, rows: number, bitmap: string}} grid - Saved grid, bitmap base64 encoded.
      */
-    loadGrid(gridArray) {
+    loadGrid(grid) {
         
-        if (!Array.isArray(gridArray)) return;
+        if (!grid || !grid.bitmap) return;
+
+        const bytes = Uint8Array.from(atob(grid.bitmap), c => c.charCodeAt(0));
 
-        // Clear existing (prevents duplicates when switching images)
+        for (let bit = 0; bit < grid.cols * grid.rows; bit++) {
+            if (!(bytes[bit >> 3] >> (bit & 7) & 1)) continue;
 
-        gridArray.forEach(g => {
-            const col = parseInt(g.x);
-            const row = parseInt(g.y);
+            const col = bit % grid.cols;
+            const row = Math.floor(bit / grid.cols);
             const key = `${col},${row}`;
 
 
@@ -78,11 +87,28 @@ export class GridManager {
                 this.gridSize
             );
             this.filledCells.set(key, element);
-        });
+        }
 
 
     }
 
+    /**
+     * Returns the number of grid columns and rows covering the image.
+     *
+     * Purpose:
+     * Sent with every grid change so the server sizes the bitmap
+     * of the image once, on its first change.
+     *
+     * @returns {{cols: number, rows: number}}
+     */
+    getDimensions() {
+        const imageSize = this.viewer.world.getItemAt(0).getContentSize();
+        return {
+            cols: Math.ceil(imageSize.x / this.gridSize),
+            rows: Math.ceil(imageSize.y / this.gridSize)
+        };
+    }
+
     /**
      * Draws grid lines over the current image.
      *
@@ -165,17 +191,73 @@ export class GridManager {
     toggleCell(x, y) {
         const col = Math.floor(x / this.gridSize);
         const row = Math.floor(y / this.gridSize);
-        const key = `${col},${row}`;
+        const { cols, rows } = this.getDimensions();
 
         // This is already boolean so it checks if it exists or not in the server.
-        saveGridToServer(this.img_id,col,row);
+        saveGridToServer(this.img_id, col, row, cols, rows);
 
-        if (this.filledCells.has(key)) {
+        const filled = !this.filledCells.has(`${col},${row}`);
+        this.setCell(col, row, filled);
+        this.anchor = { col, row, filled };
+        return filled;
+    }
+
+    /**
+     * Fills the range of cells between the last toggled cell and a point.
+     *
+     * Purpose:
+     * Marks a whole block of cells at once. Every cell of the
+     * rectangle spanned by the last toggled cell and the cell under
+     * the point takes the state the toggled cell was given.
+     * Without a toggled cell the cell under the point is toggled.
+     *
+     * The server sets the whole range with a single operation.
+     *
+     * @param {number} x - Image X coordinate of the point.
+     * @param {number} y - Image Y coordinate of the point.
+     * @returns {number} Number of cells in the range.
+     */
+    fillRange(x, y) {
+        if (!this.anchor) {
+            this.toggleCell(x, y);
+            return 1;
+        }
+
+        const col = Math.floor(x / this.gridSize);
+        const row = Math.floor(y / this.gridSize);
+        const { cols, rows } = this.getDimensions();
+        const { filled } = this.anchor;
+
+        const col1 = Math.min(col, this.anchor.col);
+        const col2 = Math.max(col, this.anchor.col);
+        const row1 = Math.min(row, this.anchor.row);
+        const row2 = Math.max(row, this.anchor.row);
+
+        fillGridToServer(this.img_id, col1, row1, col2, row2, filled, cols, rows);
+
+        for (let r = row1; r <= row2; r++) {
+            for (let c = col1; c <= col2; c++) {
+                this.setCell(c, r, filled);
+            }
+        }
+        return (col2 - col1 + 1) * (row2 - row1 + 1);
+    }
+
+    /**
+     * Shows or removes the filled overlay of one cell.
+     *
+     * @param {number} col - Column of the cell.
+     * @param {number} row - Row of the cell.
+     * @param {boolean} filled - Whether the cell is filled.
+     */
+    setCell(col, row, filled) {
+        const key = `${col},${row}`;
+
+        if (!filled && this.filledCells.has(key)) {
             removeOverlay(this.viewer, this.filledCells.get(key));
             this.filledCells.delete(key);
 
-            return false;
-        } else {
+        } else if (filled && !this.filledCells.has(key)) {
             const { element, vpRect } = createGridCellOverlay(
                 this.viewer,
                 col,
@@ -185,7 +267,6 @@ export class GridManager {
 
             addOverlayWithMinimap(this.viewer, element, vpRect); // Changed this line
             this.filledCells.set(key, element);
-            return true;
         }
     }
 
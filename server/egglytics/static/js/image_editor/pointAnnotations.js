@@ -7,6 +7,7 @@
 // 
 
 import { imageToViewportCoordinates, viewportToPixelCoordinates } from './viewer.js';
+import { drawClusters } from './annotationLoader.js';
 /**
  * PointAnnotationManager
  * ----------------------
@@ -18,6 +19,7 @@ import { imageToViewportCoordinates, viewportToPixelCoordinates } from './viewer
  * - Support point selection and hover highlighting
  * - Convert coordinates between image, viewport, and pixel space
  * - Enable adding, removing, loading, and clearing annotations
+ * - Render clusters in place of the points of a crowded view
  *
  * Points are stored in image coordinate space and converted
  * dynamically to pixel coordinates during rendering. This ensures
@@ -48,6 +50,7 @@ export class PointAnnotationManager {
         this.viewer = viewer;
         this.canvas = canvas;
         this.points = [];
+        this.clusters = [];
         this.selectedPoint = null;
         this.visible = true;
     }
@@ -111,6 +114,35 @@ export class PointAnnotationManager {
         });
     }
 
+    /**
+     * Loads points from flat x, y pairs.
+     *
+     * Purpose:
+     * Reads the binary answer of the server (see annotationLoader.js)
+     * without building an intermediate array.
+     *
+     * @param {Int32Array} values - x1, y1, x2, y2, ...
+     */
+    loadPackedPoints(values) {
+        this.points.length = 0;
+        for (let i = 0; i < values.length; i += 2) {
+            this.points.push({ x: values[i], y: values[i + 1] });
+        }
+    }
+
+    /**
+     * Sets the clusters drawn for a view too crowded for its points.
+     *
+     * Purpose:
+     * Used when the server answers a view with clusters
+     * (see annotationLoader.js), an empty array removes them.
+     *
+     * @param {Array<Object>} clusters - Array of { x, y, count } objects.
+     */
+    setClusters(clusters) {
+        this.clusters = clusters;
+    }
+
     /**
      * Clears all stored annotation points.
      */
@@ -186,6 +218,8 @@ export class PointAnnotationManager {
             ctx.fill();
             ctx.stroke();
         }
+
+        drawClusters(this.viewer, this.canvas, this.clusters, "lime");
     }
 
     /**
@@ -7,14 +7,19 @@
  */
 
 import { addOverlay, removeOverlay, updateOverlay, createOverlayElement } from './overlay.js';
+import { drawClusters } from './annotationLoader.js';
 
 export class RectAnnotationManager {
     /**
      * Creates a new RectAnnotationManager instance.
      * @param {OpenSeadragon.Viewer} viewer - The OpenSeadragon viewer instance.
+     * @param {HTMLCanvasElement} canvas - Canvas overlay used for rendering clusters.
      */
-    constructor(viewer) {
+    constructor(viewer, canvas) {
         this.viewer = viewer;
+        this.canvas = canvas;
+        /** @type {Array<Object>} Clusters drawn for a view too crowded for its rectangles */
+        this.clusters = [];
         /** @type {Array<Object>} List of rectangle annotations */
         this.rects = [];
         /** @type {Array<Array<number>>} Temporary edge points for rectangle drawing */
@@ -157,13 +162,43 @@ export class RectAnnotationManager {
      * {x_init, y_init, x_end, y_end, rect_id}
      */
     loadRects(loadedRects) {
-        this.rects.length = 0;
+        this.clearRects();
 
         loadedRects.forEach(r => {
             this.addRect(r.x_init, r.y_init, r.x_end, r.y_end, "red", 2, r.rect_id);
         });
     }
 
+    /**
+     * Loads rectangles from flat rows of the binary answer of the server.
+     *
+     * @param {Int32Array} values Rows of rect_id, x_init, y_init, x_end, y_end
+     */
+    loadPackedRects(values) {
+        this.clearRects();
+
+        for (let i = 0; i < values.length; i += 5) {
+            this.addRect(values[i + 1], values[i + 2], values[i + 3], values[i + 4], "red", 2, values[i]);
+        }
+    }
+
+    /**
+     * Removes every rectangle and its overlay.
+     */
+    clearRects() {
+        this.hideAll();
+        this.rects.length = 0;
+    }
+
+    /**
+     * Sets the clusters drawn in place of the rectangles of a crowded view.
+     *
+     * @param {Array<Object>} clusters Array of { x, y, count } in image space
+     */
+    loadClusters(clusters) {
+        this.clusters = clusters;
+    }
+
     /**
      * Removes a rectangle annotation.
      *
@@ -261,6 +296,10 @@ export class RectAnnotationManager {
 
             r.element = rectEl;
         });
+
+        // The canvas only shows the clusters in rectangle mode
+        this.canvas.getContext("2d").clearRect(0, 0, this.canvas.width, this.canvas.height);
+        drawClusters(this.viewer, this.canvas, this.clusters, "red");
     }
 
 
@@ -11,17 +11,26 @@
 /**
  * Initializes an OpenSeadragon viewer.
  *
+ * When a Deep Zoom pyramid is available only the tiles in view are downloaded,
+ * otherwise the preview is shown first and swapped for the full image once loaded.
+ *
  * @param {string} imageUrl - URL of the image to load.
+ * @param {string|null} previewUrl - URL of the compressed preview.
+ * @param {string|null} dziUrl - URL of the .dzi descriptor of the tile pyramid.
  * @returns {OpenSeadragon.Viewer} - Initialized viewer instance.
  */
-export function initializeViewer(imageUrl, previewUrl = null) {
+export function initializeViewer(imageUrl, previewUrl = null, dziUrl = null) {
     const startUrl = previewUrl || imageUrl;
     let viewerInitialized = false;
 
+    if (dziUrl) {
+        previewUrl = null; // Tiles load progressively, no full image swap
+    }
+
     const viewer = OpenSeadragon({
         id: "viewer",
         prefixUrl: "https://cdnjs.cloudflare.com/ajax/libs/openseadragon/4.1.0/images/",
-        tileSources: {
+        tileSources: dziUrl || {
             type: "image",
             url: startUrl
         },
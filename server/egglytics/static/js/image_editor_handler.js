@@ -5,6 +5,7 @@ import { GridManager } from './image_editor/grid.js';
 import { UIManager } from './image_editor/ui.js';
 import { addPointToServer, removePointFromServer, addRectToServer, removeRectFromServer } from './image_editor/api.js';
 import { PolygonManager } from './image_editor/polygonManager.js';
+import { AnnotationLoader } from './image_editor/annotationLoader.js';
 import { KEYBINDS } from './config/keybinds.js';
 
 $(document).ready(function () {
@@ -15,6 +16,7 @@ $(document).ready(function () {
     let viewerReady = false;
     let lastMousePos = null;
     let totalEggs = window.total_egg_count;
+    let annotationLoaderStarted = false;
 
     // Get elements
     const messageEl = document.getElementById("messages");
@@ -22,18 +24,31 @@ $(document).ready(function () {
     const eggCountEl = document.getElementById("egg_count");
     const imageUrl = document.getElementById("viewer").dataset.imageUrl;
     const imageId = window.image_id;
-    const savedGrids = window.grids;
+    const savedGrid = window.grid;
     const previewUrl = window.image_preview_url || null;
+    const dziUrl = window.image_dzi_url || null;
 
     // Initialize managers
-    const viewer = initializeViewer(imageUrl, previewUrl);
+    const viewer = initializeViewer(imageUrl, previewUrl, dziUrl);
     const canvas = setupCanvas(viewer);
     const pointManager = new PointAnnotationManager(viewer, canvas);
-    const rectManager = new RectAnnotationManager(viewer);
+    const rectManager = new RectAnnotationManager(viewer, canvas);
     const polygonManager = new PolygonManager(viewer, canvas);
     const gridManager = new GridManager(viewer, 512, imageId);
     const uiManager = new UIManager(messageEl, modeEl, eggCountEl);
 
+    // Only the annotations in view are loaded, clustered when the view is crowded
+    const annotationLoader = new AnnotationLoader(viewer, imageId, function (data) {
+        pointManager.loadPackedPoints(data.points);
+        pointManager.setClusters(data.point_clusters);
+        rectManager.loadPackedRects(data.rects);
+        rectManager.loadClusters(data.rect_clusters);
+        if (isPointAnnotate || isRectAnnotate) {
+            uiManager.setEggCount(isPointAnnotate ? data.point_count : data.rect_count);
+        }
+        redrawAll();
+    });
+
     // Set initial egg count
     uiManager.setEggCount(totalEggs);
     // This sets on what is displayed on the screen..
@@ -68,18 +83,19 @@ $(document).ready(function () {
         console.log("Viewer opened and ready!");
         if (viewerReady) return; // skip on full-res swap
 
-        if (Array.isArray(window.points)) {
-            pointManager.loadPoints(window.points);
-        }
-        if (Array.isArray(window.rects)) {
-            rectManager.loadRects(window.rects);
+        // The full image replaces the preview, its annotations are requested again
+        annotationLoader.invalidate();
+        if (!annotationLoaderStarted) {
+            annotationLoaderStarted = true;
+            annotationLoader.start();
+        } else {
+            annotationLoader.load();
         }
 
         console.log("Image size:", viewer.world.getItemAt(0).getContentSize());
-        console.log("Sample point:", pointManager.getPoints()[0]);
         setAnnotationMode({ point: true, modeName: "Point" })
 
-        gridManager.loadGrid(savedGrids);
+        gridManager.loadGrid(savedGrid);
     });
 
     // Canvas click handler
@@ -112,6 +128,7 @@ $(document).ready(function () {
             const success = await addPointToServer(imageId, pos.x, pos.y);
             
             if (success) {
+                annotationLoader.counts.points++;
                 totalEggs++;
                 uiManager.setEggCount(totalEggs);
             }
@@ -137,6 +154,7 @@ $(document).ready(function () {
                 );
 
                 if (success) {
+                    annotationLoader.counts.rects++;
                     totalEggs++;
                     uiManager.setEggCount(totalEggs);
                 }
@@ -237,6 +255,7 @@ $(document).ready(function () {
                 const success = await removePointFromServer(imageId, removed.x, removed.y);
                 
                 if (success) {
+                    annotationLoader.counts.points--;
                     totalEggs--;
                     uiManager.setEggCount(totalEggs);
                 }
@@ -256,6 +275,7 @@ $(document).ready(function () {
                 );
 
                 if (success) {
+                    annotationLoader.counts.rects--;
                     totalEggs--;
                     uiManager.setEggCount(totalEggs);
                 }
@@ -267,14 +287,18 @@ $(document).ready(function () {
 
     });
 
-    // Fill grid cell (F key)
+    // Fill grid cell (W key), Shift + W fills every cell from the last filled one
     window.addEventListener("keydown", (e) => {
         if (e.key.toLowerCase() !== KEYBINDS.FILL_CELL) return;
 
         if(gridManager.isVisible()){
             const pos = getMouseImagePosition(viewer, lastMousePos);
             if (!pos) return;
-            gridManager.toggleCell(pos.x, pos.y);
+            if (e.shiftKey) {
+                gridManager.fillRange(pos.x, pos.y);
+            } else {
+                gridManager.toggleCell(pos.x, pos.y);
+            }
         }
 
 
@@ -320,9 +344,9 @@ $(document).ready(function () {
         submitBtn.hidden = modeName !== "Recalibrate";
         submitBtn.style.display = modeName === "Recalibrate" ? "flex" : "none";
 
-        // Count eggs/rects if not recalibration
-        const total = point ? pointManager.getPoints().length
-                    : rect ? rectManager.getRects().length
+        // Count eggs/rects of the whole image if not recalibration, the managers only hold the view
+        const total = point ? annotationLoader.counts.points
+                    : rect ? annotationLoader.counts.rects
                     : 0;
         uiManager.setEggCount(total);
 
@@ -8,7 +8,7 @@
  * - Validate selected image files (type + size)
  * - Maintain the staged upload file array
  * - Coordinate table updates after file changes
- * - Submit files and metadata to the backend
+ * - Submit files and metadata to the backend in resumable chunks
  * - Handle upload progress and success flow
  *
  * This module acts as the pipeline controller between:
@@ -22,7 +22,7 @@
  * - localStorage
  *
  * Workflow:
- * File Selection → Validation → Table Sync → Upload → Redirect
+ * File Selection → Validation → Table Sync → Upload Session → Chunks → Finalize → Redirect
  */
 
 export class UploadHandler {
@@ -65,6 +65,24 @@ export class UploadHandler {
          * @type {number}
          */        
         this.MAX_SIZE_PER_FILE = 500 * 1024 * 1024; // 500 MB
+
+        /**
+         * localStorage key of the upload session that can be resumed.
+         * @type {string}
+         */
+        this.SESSION_KEY = "chunkedUpload";
+
+        /**
+         * Chunks sent at the same time.
+         * @type {number}
+         */
+        this.PARALLEL_CHUNKS = 3;
+
+        /**
+         * Attempts per chunk before the upload is reported as interrupted.
+         * @type {number}
+         */
+        this.CHUNK_ATTEMPTS = 5;
     }
 
     /* ========================
@@ -141,6 +159,10 @@ export class UploadHandler {
 
     /**
      * Submits all staged files and metadata to the server.
+     *
+     * Files are sent in chunks through an upload session (see chunked_upload.py).
+     * The session is remembered in localStorage, so submitting the same files again
+     * after a dropped connection only sends the chunks the server has not confirmed.
      * Handles progress visualization and redirect on success.
      *
      * @async
@@ -148,68 +170,51 @@ export class UploadHandler {
      */
     async submitUpload() {
         const fileArray = this.getFileArray();
-        const formData = new FormData();
+        const files = [];
 
-        // Append files and their settings
+        // Collect files and their settings
         // Iterate over each rows
         $("#upload-table tbody tr").each(function(index) {
             const $row = $(this);
             const file = fileArray[index];
-            
+
             if (!file) return;
 
-            formData.append("myfiles", file);
             //Get the selected model
             const model = $row.find('select[data-row-model="true"]').val();
-            console.log(model)
-            formData.append(`model_${index}`, model);
-
             const isMacro = $row.find('.mode-toggle').is(":checked");
             const mode = isMacro ? "macro" : "micro";
-            formData.append(`mode_${index}`, mode);
+
+            files.push({ file, model, mode });
         });
 
-        // Append metadata
+        // Metadata
         const user = $("#user_name").val().trim().toLowerCase();
         const name = $("#batch_name").val().trim().toLowerCase();
-        
-        formData.append("username", user);
-        formData.append("user", user);
-        formData.append("batch_name", name);
-        formData.append("file_count", fileArray.length);
 
         // Save username for next time
         localStorage.setItem("username", user);
 
-        console.log("Uploading:", user, name, fileArray.length, "files");
+        console.log("Uploading:", user, name, files.length, "files");
 
         // Show progress bar
         this.showProgress();
 
-        return new Promise((resolve, reject) => {
-            $.ajax({
-                url: "/",
-                type: "POST",
-                data: formData,
-                processData: false,
-                contentType: false,
-                headers: {
-                    "X-CSRFToken": this.getCSRFToken(),
-                },
-                xhr: () => this.createXHRWithProgress(),
-                success: (response) => {
-                    console.log("Uploaded files:", response.filenames);
-                    this.handleUploadSuccess();
-                    resolve(response);
-                },
-                error: (xhr, status, error) => {
-                    console.error("Upload failed:", error);
-                    alert("Upload failed. Please try again.");
-                    this.hideProgress();
-                    reject(error);
-                }
-            });
-        });
+        try {
+            const session = await this.openSession(user, name, files);
+            await this.sendMissingChunks(session, files);
+            const response = await this.requestJSON(`/upload/sessions/${session.upload_id}/finalize/`, { method: "POST" });
+
+            localStorage.removeItem(this.SESSION_KEY);
+            this.handleUploadSuccess();
+            return response;
+
+        } catch (error) {
+            console.error("Upload failed:", error);
+            alert("Upload interrupted. Submit again to resume from where it stopped.");
+            this.hideProgress();
+            throw error;
+        }
     }
 
     /* ========================
@@ -217,20 +222,191 @@ export class UploadHandler {
     ======================== */
 
     /**
-     * Creates an XMLHttpRequest instance with upload progress tracking (This is the progress bar)
+     * Returns the upload session to send the files to: the stored one if it
+     * describes the same batch and is still open, otherwise a new one.
+     *
+     * @param {string} user
+     * @param {string} name
+     * @param {{file: File, model: string, mode: string}[]} files
+     * @returns {Promise<Object>} Upload status (see upload_status).
+     */
+    async openSession(user, name, files) {
+        const fingerprint = JSON.stringify([
+            user, name,
+            files.map(({ file, model, mode }) => [file.name, file.size, file.lastModified, model, mode])
+        ]);
+
+        const stored = JSON.parse(localStorage.getItem(this.SESSION_KEY) || "null");
+        if (stored && stored.fingerprint === fingerprint) {
+            try {
+                const status = await this.requestJSON(`/upload/sessions/${stored.uploadId}/`);
+                if (status.status === "OPEN") {
+                    console.log("Resuming upload", stored.uploadId);
+                    return status;
+                }
+            } catch (error) {
+                console.warn("Stored upload cannot be resumed:", error);
+            }
+        }
+
+        const created = await this.requestJSON("/upload/sessions/", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({
+                user,
+                batch_name: name,
+                files: files.map(({ file, model, mode }) => ({
+                    name: file.name,
+                    size: file.size,
+                    model,
+                    mode,
+                })),
+            }),
+        });
+
+        localStorage.setItem(this.SESSION_KEY, JSON.stringify({ uploadId: created.upload_id, fingerprint }));
+        return { ...created, files: created.files.map(f => ({ ...f, received: [] })) };
+    }
+
+    /**
+     * Sends every chunk the server has not confirmed, a few at a time.
+     *
+     * @param {Object} session - Upload status (see upload_status).
+     * @param {{file: File}[]} files
+     * @returns {Promise<void>}
+     */
+    async sendMissingChunks(session, files) {
+        const chunkSize = session.chunk_size;
+        const totalBytes = files.reduce((sum, { file }) => sum + file.size, 0);
+        let sentBytes = 0;
+
+        const queue = [];
+        session.files.forEach((info, fileIndex) => {
+            const file = files[fileIndex].file;
+            const received = new Set(info.received);
+
+            for (let chunkIndex = 0; chunkIndex < info.chunks; chunkIndex++) {
+                const start = chunkIndex * chunkSize;
+                const end = Math.min(start + chunkSize, file.size);
+
+                if (received.has(chunkIndex)) {
+                    sentBytes += end - start;
+                } else {
+                    queue.push({ file, fileIndex, chunkIndex, start, end });
+                }
+            }
+        });
+
+        this.setProgress(sentBytes / totalBytes);
+
+        const worker = async () => {
+            while (queue.length) {
+                const chunk = queue.shift();
+                await this.sendChunk(session.upload_id, chunk);
+                sentBytes += chunk.end - chunk.start;
+                this.setProgress(sentBytes / totalBytes);
+            }
+        };
+
+        const workers = [];
+        for (let i = 0; i < this.PARALLEL_CHUNKS; i++) {
+            workers.push(worker());
+        }
+        await Promise.all(workers);
+    }
+
+    /**
+     * Sends one chunk with its checksum, retrying with a growing delay.
      *
-     * @returns {XMLHttpRequest}
+     * @param {string} uploadId
+     * @param {{file: File, fileIndex: number, chunkIndex: number, start: number, end: number}} chunk
+     * @returns {Promise<void>}
      */
-    createXHRWithProgress() {
-        const xhr = new window.XMLHttpRequest();
-        xhr.upload.addEventListener("progress", (evt) => {
-            if (evt.lengthComputable) {
-                const percentComplete = Math.round((evt.loaded / evt.total) * 100);
-                $("#upload-progress").css("width", percentComplete + "%");
-                $("#upload-progress").text(percentComplete + "%");
+    async sendChunk(uploadId, { file, fileIndex, chunkIndex, start, end }) {
+        const data = await file.slice(start, end).arrayBuffer();
+        const checksum = await this.checksum(data);
+
+        for (let attempt = 0; ; attempt++) {
+            try {
+                await this.requestJSON(`/upload/sessions/${uploadId}/files/${fileIndex}/chunks/${chunkIndex}/`, {
+                    method: "PUT",
+                    headers: {
+                        "Content-Type": "application/octet-stream",
+                        "X-Chunk-Checksum": checksum,
+                    },
+                    body: data,
+                });
+                return;
+
+            } catch (error) {
+                if (attempt + 1 >= this.CHUNK_ATTEMPTS) throw error;
+                console.warn(`Chunk ${fileIndex}/${chunkIndex} failed, retrying:`, error);
+                await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** attempt));
             }
-        }, false);
-        return xhr;
+        }
+    }
+
+    /**
+     * Checksum header value of a chunk. SHA-256 needs a secure context (HTTPS or localhost),
+     * plain HTTP falls back to CRC-32.
+     *
+     * @param {ArrayBuffer} data
+     * @returns {Promise<string>} "sha256=<hex>" or "crc32=<hex>"
+     */
+    async checksum(data) {
+        if (window.crypto && window.crypto.subtle) {
+            const digest = await window.crypto.subtle.digest("SHA-256", data);
+            const hex = Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, "0")).join("");
+            return `sha256=${hex}`;
+        }
+
+        if (!UploadHandler.CRC_TABLE) {
+            UploadHandler.CRC_TABLE = new Uint32Array(256);
+            for (let n = 0; n < 256; n++) {
+                let c = n;
+                for (let k = 0; k < 8; k++) {
+                    c = c & 1 ? 0xEDB88320 ^ (c >>> 1) : c >>> 1;
+                }
+                UploadHandler.CRC_TABLE[n] = c >>> 0;
+            }
+        }
+
+        const bytes = new Uint8Array(data);
+        let crc = 0xFFFFFFFF;
+        for (let i = 0; i < bytes.length; i++) {
+            crc = UploadHandler.CRC_TABLE[(crc ^ bytes[i]) & 0xFF] ^ (crc >>> 8);
+        }
+        return `crc32=${((crc ^ 0xFFFFFFFF) >>> 0).toString(16).padStart(8, "0")}`;
+    }
+
+    /**
+     * fetch() with the CSRF token, throws on non-2xx responses.
+     *
+     * @param {string} url
+     * @param {RequestInit} [options]
+     * @returns {Promise<Object>} Decoded JSON response.
+     */
+    async requestJSON(url, options = {}) {
+        const response = await fetch(url, {
+            ...options,
+            headers: { ...(options.headers || {}), "X-CSRFToken": this.getCSRFToken() },
+        });
+        if (!response.ok) {
+            throw new Error(`Server error: ${response.status}`);
+        }
+        return response.json();
+    }
+
+    /**
+     * Updates the progress bar.
+     *
+     * @param {number} fraction - Between 0 and 1.
+     * @returns {void}
+     */
+    setProgress(fraction) {
+        const percentComplete = Math.round(fraction * 100);
+        $("#upload-progress").css("width", percentComplete + "%");
+        $("#upload-progress").text(percentComplete + "%");
     }
 
     /**
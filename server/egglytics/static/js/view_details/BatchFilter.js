@@ -2,80 +2,57 @@
  * -----------------------------------------
  * BATCH FILTER
  * -----------------------------------------
- * Filters batch table rows based on multiple
- * criteria such as batch name, owner, date range,
- * number of images, and egg counts.
+ * Sends the filter inputs (batch name, owner, date range,
+ * number of images, egg counts and status) to the server
+ * through a BatchTable, which reloads the first page.
  */
 
 export class BatchFilter {
     /**
-     * @param {string} tableSelector - jQuery selector for the table to filter.
-     * @param {Object} pagination - Pagination object with a reset() method.
-     * @param {Function} onFilter - Optional callback invoked after filtering.
+     * @param {Object} table - BatchTable instance.
      */
-    constructor(tableSelector, pagination, onFilter) {
+    constructor(table) {
         /**
-         * Selector for the table.
-         * @type {string}
-         */
-        this.tableSelector = tableSelector;
-        /**
-         * Pagination controller.
+         * Table to filter.
          * @type {Object}
          */
-        this.pagination = pagination;
+        this.table = table;
 
         /**
-         * Callback to run after filtering.
-         * @type {Function|null}
+         * Debounce timer, typing sends one request once the user pauses.
+         * @type {number|null}
          */
-        this.onFilter = onFilter;
+        this.timer = null;
 
         const inputIds = [
             "batchSearch", "ownerSearch", "dateFrom", "dateTo",
-            "imagesMin", "imagesMax", "eggsMin", "eggsMax"
+            "imagesMin", "imagesMax", "eggsMin", "eggsMax", "statusFilter"
         ];
-        inputIds.forEach(id => $(`#${id}`).on("input", () => this.apply()));
+        inputIds.forEach(id => $(`#${id}`).on("input change", () => this.schedule()));
     }
-    
+
     /**
-     * Apply filters to all table rows based on user input.
-     * Sets a 'data-filtered-out' attribute on each row
-     * indicating whether it matches the filter criteria.
+     * Apply the filters after a short pause in typing.
      */
-    apply() {
-        const batchQuery  = $("#batchSearch").val().toLowerCase();
-        const ownerQuery  = $("#ownerSearch").val().toLowerCase();
-        const dateFrom    = $("#dateFrom").val() ? new Date($("#dateFrom").val()) : null;
-        const dateTo      = $("#dateTo").val()   ? new Date($("#dateTo").val())   : null;
-        const imagesMin   = parseFloat($("#imagesMin").val()) || 0;
-        const imagesMax   = parseFloat($("#imagesMax").val()) || Infinity;
-        const eggsMin     = parseFloat($("#eggsMin").val())   || 0;
-        const eggsMax     = parseFloat($("#eggsMax").val())   || Infinity;
-
-        $(`${this.tableSelector} tbody tr`).each(function () {
-            const cells      = this.children;
-            const batchName  = cells[0].textContent.toLowerCase();
-            const dateText   = cells[1].textContent.trim();
-            const ownerName  = cells[2].textContent.toLowerCase();
-            const totalImages = parseFloat(cells[3].textContent.trim()) || 0;
-            const totalEggs  = parseFloat(cells[4].textContent.trim()) || 0;
-
-            const parts   = dateText.split('/');
-            const rowDate = new Date(`${parts[2]}-${parts[0]}-${parts[1]}`);
-
-            const isMatch =
-                batchName.includes(batchQuery) &&
-                ownerName.includes(ownerQuery) &&
-                (!dateFrom || rowDate >= dateFrom) &&
-                (!dateTo   || rowDate <= dateTo) &&
-                totalImages >= imagesMin && totalImages <= imagesMax &&
-                totalEggs   >= eggsMin   && totalEggs   <= eggsMax;
+    schedule() {
+        clearTimeout(this.timer);
+        this.timer = setTimeout(() => this.apply(), 300);
+    }
 
-            $(this).attr('data-filtered-out', isMatch ? 'false' : 'true');
+    /**
+     * Read the filter inputs and reload the table with them.
+     */
+    apply() {
+        this.table.setFilters({
+            name:       $("#batchSearch").val().trim(),
+            owner:      $("#ownerSearch").val().trim(),
+            date_from:  $("#dateFrom").val(),
+            date_to:    $("#dateTo").val(),
+            images_min: $("#imagesMin").val(),
+            images_max: $("#imagesMax").val(),
+            eggs_min:   $("#eggsMin").val(),
+            eggs_max:   $("#eggsMax").val(),
+            status:     $("#statusFilter").val(),
         });
-
-        this.pagination.reset();
-        if (this.onFilter) this.onFilter();
     }
-}
\ No newline at end of file
+}
@@ -41,7 +41,7 @@ export class BatchPopup {
     }
 
     /**
-     * Open popup for a given batch and fetch its images.
+     * Open popup for a given batch and fetch its first page of images.
      * @param {number|string} batchId - ID of the batch to open.
      * @param {string} batchName - Name of the batch to display.
      */
@@ -50,29 +50,52 @@ export class BatchPopup {
         $popup.data("batchId", batchId);
         $("#popup-batch-name").text(batchName);
         $("#popup-text").show();
+        $("#popup-details").empty();
+        $("#popup-image").attr("src", "");
         $popup.css("display", "flex");
 
-        fetch(`/batch/${batchId}/images/`)
+        this.loadPage(batchId, batchName, null);
+    }
+
+    /**
+     * Fetch one page of images of the batch and append its rows.
+     * The browser revalidates the page, an unchanged batch costs a 304.
+     * @param {number|string} batchId - ID of the batch.
+     * @param {string} batchName - Name of the batch, for the error message.
+     * @param {number|null} after - next_after of the previous page, null for the first page.
+     */
+    loadPage(batchId, batchName, after) {
+        const url = after === null
+            ? `/batch/${batchId}/images/`
+            : `/batch/${batchId}/images/?after=${after}`;
+
+        fetch(url, { cache: "no-cache" })
             .then(res => res.json())
             .then(data => {
-                if (data.length > 0) {
-                    $("#popup-image").attr("src", data[0].image_url);
-                }
+                // The popup moved on to another batch meanwhile
+                if (String($("#popup").data("batchId")) !== String(batchId)) return;
 
-                this.totalEggs    = data.reduce((s, img) => s + img.total_eggs, 0);
-                this.totalHatched = data.reduce((s, img) => s + img.total_hatched, 0);
+                this.totalEggs    = data.total_eggs;
+                this.totalHatched = data.total_hatched;
 
                 $("#eggs-header").text(`Eggs (Total: ${this.totalEggs})`);
                 $("#hatched-header").text(`Hatched (Total: ${this.totalHatched})`);
 
+                const first = after === null;
+                if (first && data.images.length > 0) {
+                    $("#popup-image").attr("src", data.images[0].thumbnail_url);
+                }
+
                 let rowsHTML = "";
-                data.forEach((img, index) => {
+                data.images.forEach((img, index) => {
+                    const name = Utils.escapeHTML(img.image_name);
                     rowsHTML += `
-                        <tr class="image-details ${index === 0 ? 'selected' : ''}"
-                            data-image-name="${img.image_name}"
+                        <tr class="image-details ${first && index === 0 ? 'selected' : ''}"
+                            data-image-name="${name}"
                             data-image-id="${img.image_id}"
-                            data-image-path="${img.image_path}">
-                            <td class="filename" data-image-id="${img.image_id}">${img.image_name}</td>
+                            data-image-path="${Utils.escapeHTML(img.image_path)}"
+                            data-image-url="${Utils.escapeHTML(img.thumbnail_url)}">
+                            <td class="filename" data-image-id="${img.image_id}">${name}</td>
                             <td>${img.total_eggs}</td>
                             <td class="editable-hatched" data-image-id="${img.image_id}">${img.total_hatched}</td>
                             <td>${img.img_type}</td>
@@ -85,7 +108,21 @@ export class BatchPopup {
                         </tr>`;
                 });
 
-                $("#popup-details").html(rowsHTML);
+                $("#popup-details .load-more-row").remove();
+                $("#popup-details").append(rowsHTML);
+
+                if (data.next_after !== null) {
+                    const $more = $(`
+                        <tr class="load-more-row">
+                            <td colspan="6"><button class="load-more-btn">Load more (${data.count} images)</button></td>
+                        </tr>`);
+                    $more.find("button").on("click", (e) => {
+                        e.stopPropagation();
+                        $(e.currentTarget).prop("disabled", true);
+                        this.loadPage(batchId, batchName, data.next_after);
+                    });
+                    $("#popup-details").append($more);
+                }
             })
             .catch(err => {
                 $("#popup-text").text(`Error loading images for: ${batchName}`);
@@ -126,16 +163,16 @@ export class BatchPopup {
             $(".image-details").removeClass("selected");
             $(this).addClass("selected");
 
-            const imagePath  = $(this).attr("data-image-path");
+            const imageUrl   = $(this).attr("data-image-url");
             const $popupImg  = $("#popup-image");
 
             $popupImg.css("opacity", "0.3");
 
             const newImage  = new Image();
             newImage.onload = function () {
-                $popupImg.attr("src", `/thumbnail/${imagePath}?w=800&h=600`).css("opacity", "1");
+                $popupImg.attr("src", imageUrl).css("opacity", "1");
             };
-            newImage.src = `/thumbnail/${imagePath}?w=800&h=600`;
+            newImage.src = imageUrl;
         });
     }
 
@@ -174,7 +211,7 @@ export class BatchPopup {
                 $("#hatched-header").text(`Hatched (Total: ${this.totalHatched})`);
 
                 if (currentPreview === imageUrl) {
-                    const $firstRow = $("#popup-details tr").first();
+                    const $firstRow = $("#popup-details tr.image-details").first();
                     $("#popup-image").attr("src", $firstRow.length ? $firstRow.data("image-url") : "");
                 }
 
@@ -4,13 +4,17 @@ import { Utils } from "./Utils.js";
  * -----------------------------------------
  * BATCH STATUS POLLER
  * -----------------------------------------
- * Periodically polls the server for the status of batches
- * and updates the batch table UI and notice box accordingly.
- * Provides automatic refresh every 5 seconds.
+ * Follows the status of batches and updates the batch table UI
+ * and notice box accordingly. Updates are pushed by the server
+ * (/events/), when it cannot push the status is polled every
+ * 5 seconds instead. Only batches in flight or changed since the
+ * previous poll are sent, an unchanged poll is answered with a 304.
+ * The callback runs when a batch finishes, so the page (its
+ * totals and sort position) is loaded again only then.
  */
 export class BatchStatusPoller {
     /**
-     * @param {Function} onUpdate - Optional callback executed after each status update.
+     * @param {Function} onUpdate - Optional callback executed when a batch finished processing.
      */
     constructor(onUpdate) {
         /**
@@ -24,66 +28,157 @@ export class BatchStatusPoller {
          * @type {number|null}
          */
         this.poller   = null;
+
+        /**
+         * is_complete of every batch seen by the previous update.
+         * @type {Map<number, boolean>}
+         */
+        this.completed = new Map();
+
+        /**
+         * Cursor of the previous response, see batch_status.
+         * @type {string|null}
+         */
+        this.since = null;
+
+        /**
+         * Stream of /events/, null until started.
+         * @type {EventSource|null}
+         */
+        this.source = null;
     }
 
 
+    /**
+     * Follows the /events/ stream, or polls /batch/status/ when the server
+     * cannot stream (it answers 204 under WSGI) or the stream is closed.
+     */
     start() {
         this.update();
-        this.poller = setInterval(() => this.update(), 5000);
+
+        if (!window.EventSource) {
+            this.startPolling();
+            return;
+        }
+
+        this.source = new EventSource("/events/");
+        // Also after a reconnect, to catch up on what happened while the stream was down
+        this.source.addEventListener("open", () => this.update());
+        this.source.addEventListener("batch", event => {
+            const data = JSON.parse(event.data);
+            if (this.show(data.batch) && this.onUpdate) this.onUpdate();
+        });
+        this.source.addEventListener("error", () => {
+            // A dropped stream reconnects by itself, a refused one is CLOSED for good
+            if (this.source.readyState === EventSource.CLOSED) this.startPolling();
+        });
+    }
+
+    startPolling() {
+        if (this.poller === null) {
+            this.poller = setInterval(() => this.update(), 5000);
+        }
     }
 
     stop() {
         clearInterval(this.poller);
+        this.poller = null;
+        if (this.source) this.source.close();
     }
 
     update() {
-        fetch('/batch/status/')
+        const url = this.since
+            ? `/batch/status/?since=${encodeURIComponent(this.since)}`
+            : '/batch/status/';
+
+        // no-cache revalidates with the ETag, a 304 hands back the previous payload
+        fetch(url, { cache: "no-cache" })
             .then(res => res.json())
-            .then(batches => {
-                if (!batches || batches.length === 0) {
-                    $("#notice-box").html("<h5>No batches found</h5>").show();
-                    return;
-                }
-
-                batches.forEach(batch => {
-                    const row = document.querySelector(`#batchTable tbody tr[data-batch-id="${batch.id}"]`);
-                    if (!row) return;
-
-                    row.children[4].textContent = batch.total_eggs;
-                    const statusCell = row.children[5];
-
-                    if (batch.is_complete && !batch.has_fail_present) {
-                        statusCell.innerHTML = '<i class="fas fa-check-circle" style="color:green;"></i>';
-                        if (Utils.getFlag()?.processingActive) {
-                            $("#notice-box").html("<h5>Processing Complete! All images processed successfully.</h5>").show();
-                        }
-                        localStorage.removeItem("flag");
-
-                    } else if (batch.is_complete) {
-                        statusCell.innerHTML = '<i class="fas fa-exclamation-triangle" style="color:red;"></i>';
-                        if (Utils.getFlag()?.processingActive) {
-                            $("#notice-box").html("<h5>Processing Complete! Some images failed.</h5>").show();
-                        }
-                        localStorage.removeItem("flag");
-
-                    } else if (batch.has_fail_present) {
-                        statusCell.innerHTML = '<i class="fas fa-exclamation-triangle" style="color:orange;"></i>';
-                        if (Utils.getFlag()?.processingActive) {
-                            $("#notice-box").html("<h5>Processing Ongoing! Some images failed.</h5>").show();
-                        }
-                        localStorage.removeItem("flag");
-
-                    } else {
-                        statusCell.innerHTML = '<i class="fas fa-spinner fa-spin" style="color:orange;"></i>';
-                        $("#notice-box").html(`
-                            <h5>Your images are being processed. Results update every 5 seconds.<br>
-                            Processing Status: <i class='fas fa-spinner fa-spin' style='color:orange;'></i></h5>
-                        `).show();
+            .then(data => {
+                this.since = data.since;
+
+                let finished = false;
+                data.batches.forEach(batch => {
+                    if (this.show(batch)) finished = true;
+                });
+
+                // Every batch in flight is sent, one that is missing finished (or was deleted) unseen
+                const sent = new Set(data.batches.map(batch => batch.id));
+                this.completed.forEach((complete, id) => {
+                    if (!complete && !sent.has(id)) {
+                        this.completed.delete(id);
+                        finished = true;
                     }
                 });
 
-                if (this.onUpdate) this.onUpdate();
+                if (finished && this.onUpdate) this.onUpdate();
             })
             .catch(err => console.error(err));
     }
+
+    /**
+     * Shows the status of a batch in its row (if on the page) and in the notice box.
+     * @param {Object} batch - Entry of /batch/status/ (or of a "batch" event)
+     * @returns {boolean} True if the batch just finished.
+     */
+    show(batch) {
+        const finished = this.completed.get(batch.id) === false && batch.is_complete;
+        this.completed.set(batch.id, batch.is_complete);
+
+        const row = document.querySelector(`#batchTable tbody tr[data-batch-id="${batch.id}"]`);
+        if (!row) return finished;
+
+        row.children[4].textContent = batch.total_eggs;
+        const statusCell = row.children[5];
+
+        if (batch.is_complete && !batch.has_fail_present) {
+            statusCell.innerHTML = '<i class="fas fa-check-circle" style="color:green;"></i>';
+            if (Utils.getFlag()?.processingActive) {
+                $("#notice-box").html("<h5>Processing Complete! All images processed successfully.</h5>").show();
+            }
+            localStorage.removeItem("flag");
+
+        } else if (batch.is_complete) {
+            statusCell.innerHTML = '<i class="fas fa-exclamation-triangle" style="color:red;"></i>';
+            if (Utils.getFlag()?.processingActive) {
+                $("#notice-box").html("<h5>Processing Complete! Some images failed.</h5>").show();
+            }
+            localStorage.removeItem("flag");
+
+        } else if (batch.has_fail_present || batch.images_failed > 0) {
+            statusCell.innerHTML = '<i class="fas fa-exclamation-triangle" style="color:orange;"></i>' + this.formatProgress(batch);
+            if (Utils.getFlag()?.processingActive) {
+                $("#notice-box").html("<h5>Processing Ongoing! Some images failed.</h5>").show();
+            }
+            localStorage.removeItem("flag");
+
+        } else {
+            statusCell.innerHTML = '<i class="fas fa-spinner fa-spin" style="color:orange;"></i>' + this.formatProgress(batch);
+            $("#notice-box").html(`
+                <h5>Your images are being processed.<br>
+                Processing Status: <i class='fas fa-spinner fa-spin' style='color:orange;'></i>${this.formatProgress(batch)}</h5>
+            `).show();
+        }
+        return finished;
+    }
+
+    /**
+     * Progress of an in-flight batch, e.g. " 12/300 (1 failed) ~4 min left".
+     * @param {Object} batch - Entry of /batch/status/
+     * @returns {string}
+     */
+    formatProgress(batch) {
+        let text = ` ${batch.images_processed}/${batch.total_images}`;
+
+        if (batch.images_failed > 0) {
+            text += ` (${batch.images_failed} failed)`;
+        }
+
+        if (batch.eta_seconds !== null && batch.eta_seconds !== undefined) {
+            text += batch.eta_seconds < 60
+                ? ` ~${batch.eta_seconds}s left`
+                : ` ~${Math.round(batch.eta_seconds / 60)} min left`;
+        }
+        return `<small>${text}</small>`;
+    }
 }
\ No newline at end of file
@@ -0,0 +1,187 @@
+import { Utils } from "./Utils.js";
+
+/**
+ * -----------------------------------------
+ * BATCH TABLE
+ * -----------------------------------------
+ * Loads the batch table one page at a time from /batch/list/.
+ * Filtering, sorting and paging all happen on the server,
+ * this class only keeps the current query and renders the rows.
+ *
+ * Pages are addressed with the cursors returned by the server
+ * (keyset pagination), so the table keeps the cursor that loaded
+ * the current page to reload it after a change.
+ */
+
+export class BatchTable {
+    /**
+     * @param {string} tableSelector - Selector for the batch table.
+     * @param {Function} onLoad - Callback receiving every /batch/list/ response.
+     */
+    constructor(tableSelector, onLoad) {
+        /**
+         * Selector for the table.
+         * @type {string}
+         */
+        this.tableSelector = tableSelector;
+
+        /**
+         * Callback run after each page load.
+         * @type {Function|null}
+         */
+        this.onLoad = onLoad;
+
+        /**
+         * Current query: filters, sort, order and limit.
+         * @type {Object}
+         */
+        this.query = { sort: "date_updated", order: "desc", limit: 5 };
+
+        /**
+         * Cursor params that loaded the current page ({} for the first page).
+         * @type {Object}
+         */
+        this.pageCursor = {};
+
+        /**
+         * Number of the current page, from 1.
+         * @type {number}
+         */
+        this.page = 1;
+
+        /**
+         * Last /batch/list/ response.
+         * @type {Object|null}
+         */
+        this.data = null;
+
+        /**
+         * Incremented on every request, responses of older requests are dropped.
+         * @type {number}
+         */
+        this.requestId = 0;
+    }
+
+    /**
+     * Replace the filters and go back to the first page.
+     * @param {Object} filters - Query params of /batch/list/ (empty values are ignored).
+     */
+    setFilters(filters) {
+        const { sort, order, limit } = this.query;
+        this.query = { sort, order, limit, ...filters };
+        this.first();
+    }
+
+    /**
+     * Sort by a column and go back to the first page.
+     * @param {string} sort - Column key (see BATCH_SORTS in view.py).
+     * @param {string} order - "asc" or "desc".
+     */
+    setSort(sort, order) {
+        this.query.sort = sort;
+        this.query.order = order;
+        this.first();
+    }
+
+    /**
+     * Change the rows per page and go back to the first page.
+     * @param {number} limit
+     */
+    setLimit(limit) {
+        this.query.limit = limit;
+        this.first();
+    }
+
+    /** Load the first page. */
+    first() {
+        this.page = 1;
+        return this.load({});
+    }
+
+    /** Load the next page, if any. */
+    next() {
+        if (!this.data?.next_cursor) return Promise.resolve();
+        this.page++;
+        return this.load({ after: this.data.next_cursor });
+    }
+
+    /** Load the previous page, if any. */
+    prev() {
+        if (!this.data?.prev_cursor) return Promise.resolve();
+        this.page = Math.max(1, this.page - 1);
+        return this.load({ before: this.data.prev_cursor });
+    }
+
+    /** Load the current page again (after a delete, rename or status change). */
+    reload() {
+        return this.load(this.pageCursor);
+    }
+
+    /**
+     * Fetch a page and render it.
+     * @param {Object} cursor - {} or {after} or {before}.
+     * @returns {Promise<void>}
+     */
+    load(cursor) {
+        const requestId = ++this.requestId;
+        const params = new URLSearchParams();
+        Object.entries({ ...this.query, ...cursor }).forEach(([key, value]) => {
+            if (value !== "" && value !== null && value !== undefined) params.set(key, value);
+        });
+
+        return fetch(`/batch/list/?${params}`)
+            .then(res => res.json())
+            .then(data => {
+                if (requestId !== this.requestId) return;
+                if (data.error) throw new Error(data.error);
+
+                // The first page can be reached by going back, the server says so with no prev_cursor
+                if (!data.prev_cursor) this.page = 1;
+
+                this.pageCursor = cursor;
+                this.data = data;
+                this.render(data.batches);
+                if (this.onLoad) this.onLoad(data);
+            })
+            .catch(err => console.error("Could not load batches:", err));
+    }
+
+    /**
+     * Render the rows of a page.
+     * @param {Object[]} batches - Rows of /batch/list/.
+     */
+    render(batches) {
+        const rowsHTML = batches.map(batch => `
+            <tr data-batch-id="${batch.id}">
+                <td class="truncate">${Utils.escapeHTML(batch.batch_name)}</td>
+                <td>${batch.date_display}</td>
+                <td>${Utils.escapeHTML(batch.owner)}</td>
+                <td>${batch.total_images}</td>
+                <td>${batch.total_eggs}</td>
+                <td>${BatchTable.statusIcon(batch)}</td>
+                <td>
+                    <button class="delete-btn" data-batch-id="${batch.id}">
+                        <i class="fas fa-times"></i>
+                    </button>
+                </td>
+            </tr>
+        `).join("");
+
+        $(`${this.tableSelector} tbody`).html(rowsHTML);
+    }
+
+    /**
+     * Processing status icon of a batch.
+     * @param {Object} batch - Row with is_complete and has_fail_present.
+     * @returns {string}
+     */
+    static statusIcon(batch) {
+        if (batch.has_fail_present) {
+            return '<i class="fas fa-exclamation-triangle" style="color: red;"></i>';
+        }
+        if (batch.is_complete) {
+            return '<i class="fas fa-check-circle" style="color: green;"></i>';
+        }
+        return '<i class="fas fa-spinner fa-spin" style="color: orange;"></i>';
+    }
+}
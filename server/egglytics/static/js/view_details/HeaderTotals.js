@@ -2,27 +2,17 @@
  * -----------------------------------------
  * HEADER TOTALS MANAGER
  * -----------------------------------------
- * Calculates and updates the total number of images and eggs
+ * Updates the total number of images and eggs
  * displayed in the batch table header.
  */
 
 export class HeaderTotals {
     /**
-     * Recalculates totals for visible rows in the batch table
-     * and updates the corresponding header elements.
+     * Show the totals of the batches matching the current filters.
+     * @param {Object} data - /batch/list/ response with total_images and total_eggs.
      */
-    recalc() {
-        let totalImages = 0;
-        let totalEggs   = 0;
-
-        $("#batchTable tbody tr").each(function () {
-            if ($(this).css("display") !== "none") {
-                totalImages += parseInt(this.children[3].innerText, 10) || 0;
-                totalEggs   += parseInt(this.children[4].innerText, 10) || 0;
-            }
-        });
-
-        $("#total-images-header").text(`Total Images: ${totalImages}`);
-        $("#total-eggs-header").text(`Total Eggs: ${totalEggs}`);
+    set(data) {
+        $("#total-images-header").text(`Total Images: ${data.total_images}`);
+        $("#total-eggs-header").text(`Total Eggs: ${data.total_eggs}`);
     }
-}
\ No newline at end of file
+}
@@ -18,7 +18,7 @@ export class ImageContextMenu extends ContextMenu {
      * @param {BatchPopup} popupInstance - The BatchPopup instance to update totals and UI after changes.
      */
     constructor(popupInstance) {
-        super("image-context-menu", "#popup-details tr");
+        super("image-context-menu", "#popup-details tr.image-details");
         this.popup = popupInstance;
         this._bindRename();
         this._bindChangeHatched();
@@ -168,7 +168,7 @@ export class ImageContextMenu extends ContextMenu {
                 $("#hatched-header").text(`Hatched (Total: ${this.popup.totalHatched})`);
 
                 if (currentPreview === imageUrl) {
-                    const $firstRow = $("#popup-details tr").first();
+                    const $firstRow = $("#popup-details tr.image-details").first();
                     $("#popup-image").attr("src", $firstRow.length ? $firstRow.data("image-url") : "");
                 }
 
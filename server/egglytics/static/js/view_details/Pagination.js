@@ -2,65 +2,43 @@
  * -----------------------------------------
  * PAGINATION MANAGER
  * -----------------------------------------
- * Handles pagination of table rows, including:
- *  - Previous/Next navigation
- *  - Rows-per-page selection
- *  - Integration with filtered tables
+ * Previous/Next navigation and rows-per-page selection
+ * for a BatchTable. Pages are loaded from the server,
+ * this class only drives the controls.
  */
 
 export class Pagination {
     /**
-     * @param {string} tableSelector - Selector for the target table.
+     * @param {Object} table - BatchTable instance.
      * @param {string} pageInfoId - ID of the element displaying current page info.
      * @param {string} prevBtnId - ID of the "Previous" button.
      * @param {string} nextBtnId - ID of the "Next" button.
      * @param {string} rowsSelectId - ID of the select element controlling rows per page.
      */
-    constructor(tableSelector, pageInfoId, prevBtnId, nextBtnId, rowsSelectId) {
-        this.tableSelector = tableSelector;
+    constructor(table, pageInfoId, prevBtnId, nextBtnId, rowsSelectId) {
+        this.table = table;
         this.$pageInfo = $(`#${pageInfoId}`);
         this.$prevBtn = $(`#${prevBtnId}`);
         this.$nextBtn = $(`#${nextBtnId}`);
-        this.currentPage = 1;
-        this.rowsPerPage = 5;
 
-        $(`#${rowsSelectId}`).on("change", (e) => {
-            this.rowsPerPage = parseInt(e.target.value, 10);
-            this.currentPage = 1;
-            this.render();
-        });
+        const $rowsSelect = $(`#${rowsSelectId}`);
+        this.table.query.limit = parseInt($rowsSelect.val(), 10) || this.table.query.limit;
 
-        this.$prevBtn.on("click", () => { this.currentPage--; this.render(); });
-        this.$nextBtn.on("click", () => { this.currentPage++; this.render(); });
+        $rowsSelect.on("change", (e) => this.table.setLimit(parseInt(e.target.value, 10)));
+        this.$prevBtn.on("click", () => this.table.prev());
+        this.$nextBtn.on("click", () => this.table.next());
     }
 
     /**
-     * Render the table according to current page and rows per page.
-     * Takes into account rows hidden via filtering.
+     * Update the controls for the page the table just loaded.
+     * @param {Object} data - /batch/list/ response.
      */
-    render() {
-        const allRows = $(`${this.tableSelector} tbody tr`).toArray();
-        const visibleRows = allRows.filter(r => $(r).attr('data-filtered-out') !== 'true');
-        const totalPages = Math.ceil(visibleRows.length / this.rowsPerPage) || 1;
+    render(data) {
+        const totalPages = Math.max(1, Math.ceil(data.count / this.table.query.limit));
+        const page = Math.min(this.table.page, totalPages);
 
-        if (this.currentPage < 1) this.currentPage = 1;
-        if (this.currentPage > totalPages) this.currentPage = totalPages;
-
-        $(allRows).hide();
-
-        const start = (this.currentPage - 1) * this.rowsPerPage;
-        visibleRows.slice(start, start + this.rowsPerPage).forEach(r => $(r).show());
-
-        this.$pageInfo.text(`Page ${this.currentPage} of ${totalPages}`);
-        this.$prevBtn.prop("disabled", this.currentPage === 1);
-        this.$nextBtn.prop("disabled", this.currentPage === totalPages);
-    }
-
-    /**
-     * Reset pagination to the first page and re-render.
-     */
-    reset() {
-        this.currentPage = 1;
-        this.render();
+        this.$pageInfo.text(`Page ${page} of ${totalPages}`);
+        this.$prevBtn.prop("disabled", !data.prev_cursor);
+        this.$nextBtn.prop("disabled", !data.next_cursor);
     }
-}
\ No newline at end of file
+}
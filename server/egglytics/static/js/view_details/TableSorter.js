@@ -2,45 +2,35 @@
  * -----------------------------------------
  * TABLE SORTER
  * -----------------------------------------
- * Enables click-based sorting for HTML tables.
- * Supports:
- *  - Sorting numeric and string values
- *  - Ascending/descending toggle
- *  - Works with dynamically generated tables (e.g., popup tables)
+ * Click-based sorting for tables:
+ *  - Batch table: headers with data-sort are sorted on the server (BatchTable)
+ *  - Popup tables: rows are sorted in place (numeric and string values)
+ * Both toggle ascending/descending on repeated clicks.
  */
 
 export class TableSorter {
     /**
-     * @param {string} tableSelector - Selector for the target table(s) to make sortable.
+     * @param {string} tableSelector - Selector for the batch table.
+     * @param {Object} table - BatchTable instance loading the batch table.
      */
-    constructor(tableSelector) {
-        // Batch table - direct header clicks
-        $(`${tableSelector} th`).each(function (index) {
-            let ascending = true;
-            $(this).on("click", function () {
-                const $tbody = $(this).closest("table").find("tbody");
-                const rows = $tbody.find("tr").toArray();
-
-                rows.sort((a, b) => {
-                    let cellA = a.children[index].textContent.trim();
-                    let cellB = b.children[index].textContent.trim();
-                    const numA = parseFloat(cellA.replace(/,/g, ""));
-                    const numB = parseFloat(cellB.replace(/,/g, ""));
-                    if (!isNaN(numA) && !isNaN(numB)) { cellA = numA; cellB = numB; }
-                    if (cellA < cellB) return ascending ? -1 : 1;
-                    if (cellA > cellB) return ascending ? 1 : -1;
-                    return 0;
-                });
-
-                rows.forEach(r => $tbody.append(r));
-                ascending = !ascending;
-            });
+    constructor(tableSelector, table) {
+        // Batch table - sorted by the server
+        $(`${tableSelector} th[data-sort]`).on("click", function () {
+            const $th = $(this);
+            const sort = $th.data("sort");
+            const order = table.query.sort === sort && table.query.order === "asc" ? "desc" : "asc";
+
+            $(`${tableSelector} th`).removeClass("asc desc");
+            $th.addClass(order);
+            table.setSort(sort, order);
         });
 
         // Popup table - delegated TH click
         $(document).on("click", "th", function () {
             const $th    = $(this);
             const $table = $th.closest("table");
+            if ($table.is(tableSelector)) return;
+
             const $tbody = $table.find("tbody");
             if (!$tbody.length) return;
 
@@ -63,4 +53,4 @@ export class TableSorter {
             rows.forEach(r => $tbody.append(r));
         });
     }
-}
\ No newline at end of file
+}
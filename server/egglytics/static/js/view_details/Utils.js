@@ -14,4 +14,8 @@ export class Utils {
     static getFlag() {
         return JSON.parse(localStorage.getItem("flag"));
     }
+
+    static escapeHTML(text) {
+        return $("<div>").text(text ?? "").html();
+    }
 }
\ No newline at end of file
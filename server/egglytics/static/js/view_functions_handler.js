@@ -9,46 +9,51 @@ import { BatchContextMenu } from "./view_details/BatchContextMenu.js";
 import { ImageContextMenu } from "./view_details/ImageContextMenu.js";
 import { HeaderTotals } from "./view_details/HeaderTotals.js";
 import { BatchDelete } from "./view_details/BatchDelete.js";
+import { BatchTable } from "./view_details/BatchTable.js";
 
 
 $(document).ready(function () {
     // -- Totals
     const headerTotals = new HeaderTotals();
-    const recalcTotals = () => headerTotals.recalc();
+
+    // -- Table, one page at a time from the server
+    const batchTable = new BatchTable("#batchTable", (data) => {
+        headerTotals.set(data);
+        pagination.render(data);
+    });
+    const reloadTable = () => batchTable.reload();
 
     // -- Pagination
-    const pagination = new Pagination("#batchTable", "pageInfo", "prevPage", "nextPage", "rowsPerPageSelect");
-    pagination.render();
+    const pagination = new Pagination(batchTable, "pageInfo", "prevPage", "nextPage", "rowsPerPageSelect");
 
     // -- Filter
-    new BatchFilter("#batchTable", pagination, recalcTotals);
+    new BatchFilter(batchTable);
 
     // -- Sorter
-    new TableSorter("#batchTable");
+    new TableSorter("#batchTable", batchTable);
 
     // -- Popup
-    const popup = new BatchPopup(recalcTotals);
+    const popup = new BatchPopup(reloadTable);
 
     // -- Context Menus
-    new BatchContextMenu(recalcTotals);
+    new BatchContextMenu(reloadTable);
     new ImageContextMenu(popup);
 
     // -- Batch Delete (main table)
-    new BatchDelete(recalcTotals);
+    new BatchDelete(reloadTable);
 
     // -- Status Poller
-    const poller = new BatchStatusPoller(recalcTotals);
+    const poller = new BatchStatusPoller(reloadTable);
 
     // -- Notice box
     $("#notice-box").hide();
     const flag = Utils.getFlag();
     if (flag?.processingActive) {
         $("#notice-box").html(`
-            <h5>Your images are being processed. Results update every 5 seconds.<br>
+            <h5>Your images are being processed.<br>
             Processing Status: <i class="fas fa-spinner fa-spin" style="color:orange;"></i></h5>
         `).show();
     }
 
-    poller.start();
-    recalcTotals();
+    batchTable.first().then(() => poller.start());
 });
\ No newline at end of file
@@ -0,0 +1,37 @@
+import base64
+import json
+from datetime import datetime, timezone
+
+from django.test import SimpleTestCase
+
+from egglytics.views.view import decode_cursor, encode_cursor
+
+
+class BatchCursorTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        row = {
+            "id": 42,
+            "batch_name": "Plate 7 / ü",
+            "date_updated": datetime(2026, 3, 4, 5, 6, 7, 890000, tzinfo=timezone.utc),
+            "is_complete": True,
+            "has_fail_present": False,
+        }
+        for fields in (["date_updated", "id"], ["batch_name", "id"], ["is_complete", "has_fail_present", "id"]):
+            with self.subTest(fields=fields):
+                cursor = encode_cursor(row, fields)
+                self.assertEqual(decode_cursor(cursor, fields), [row[f] for f in fields])
+
+    def test_url_safe(self):
+        cursor = encode_cursor({"batch_name": "???>>>", "id": 1}, ["batch_name", "id"])
+        self.assertNotRegex(cursor, r"[+/]")
+
+    def test_rejects_malformed(self):
+        fields = ["date_updated", "id"]
+
+        def cursor(values):
+            return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+        for bad in ("", "not base64!", cursor({"id": 1}), cursor([1]), cursor(["yesterday", 1]), cursor(["2026-01-01T00:00:00Z", "x"])):
+            with self.subTest(cursor=bad), self.assertRaises(ValueError):
+                decode_cursor(bad, fields)
@@ -0,0 +1,49 @@
+import hashlib
+import zlib
+from io import BytesIO
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+
+from egglytics.views.chunked_upload import READ_SIZE, chunk_count, receive_chunk
+
+
+class ReceiveChunkTests(SimpleTestCase):
+
+    def receive(self, body, length, algorithm="sha256"):
+        part = BytesIO()
+        received, checksum = receive_chunk(BytesIO(body), part, length, algorithm)
+        return received, checksum, part.getvalue()
+
+    def test_checksums(self):
+        body = bytes(range(256)) * (READ_SIZE // 100)
+        received, checksum, written = self.receive(body, len(body))
+        self.assertEqual((received, checksum, written), (len(body), hashlib.sha256(body).hexdigest(), body))
+
+        received, checksum, written = self.receive(body, len(body), "crc32")
+        self.assertEqual((received, checksum, written), (len(body), f"{zlib.crc32(body):08x}", body))
+
+    def test_crc32_is_zero_padded(self):
+        body = next(bytes([i]) for i in range(256) if zlib.crc32(bytes([i])) < 0x10000000)
+        _, checksum, _ = self.receive(body, 1, "crc32")
+        self.assertEqual(len(checksum), 8)
+        self.assertTrue(checksum.startswith("0"))
+
+    def test_short_body(self):
+        received, _, written = self.receive(b"abc", 5)
+        self.assertEqual((received, written), (3, b"abc"))
+
+    def test_long_body_stops_past_length(self):
+        body = b"x" * (READ_SIZE * 3)
+        received, _, written = self.receive(body, READ_SIZE + 10)
+        self.assertEqual(received, READ_SIZE + 11)
+        self.assertEqual(written, body[:READ_SIZE])
+
+
+class ChunkCountTests(SimpleTestCase):
+
+    def test_rounds_up(self):
+        for size, chunks in ((1, 1), (999, 1), (1000, 1), (1001, 2), (5000, 5)):
+            with self.subTest(size=size):
+                session = SimpleNamespace(chunk_size=1000, files=[{"size": size}])
+                self.assertEqual(chunk_count(session, 0), chunks)
@@ -0,0 +1,32 @@
+import asyncio
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from egglytics.views import events
+
+
+class EventStreamTests(SimpleTestCase):
+
+    def test_every_stream_gets_the_event(self):
+        async def run():
+            streams = [events._stream(None), events._stream(1), events._stream(2)]
+            try:
+                for stream in streams:
+                    self.assertTrue((await anext(stream)).startswith("retry:"))
+
+                events._dispatch(json.dumps({"event": "batch", "batch_id": 1, "batch": {"id": 1}}))
+                expected = 'event: batch\ndata: {"batch_id": 1, "batch": {"id": 1}}\n\n'
+                for stream in streams[:2]:
+                    self.assertEqual(await asyncio.wait_for(anext(stream), 1), expected)
+
+                # The stream of another batch got nothing
+                self.assertTrue(all(queue.empty() for _, queue, batch_id in events._subscribers if batch_id == 2))
+            finally:
+                for stream in streams:
+                    await stream.aclose()
+
+        with mock.patch.object(events, "_start_listener"):
+            asyncio.run(run())
+        self.assertEqual(events._subscribers, set())
@@ -0,0 +1,87 @@
+import struct
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from egglytics.views import frames
+
+
+class ResultFrameTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        polygons = [[[1, 2], [3, 4], [5, 6]], [[7, 8], [9, 10], [11, 12], [13, 14]]]
+        frame = frames.encode_result_frame(
+            "complete", 5,
+            image_bytes=b"\xff\xd8jpeg",
+            points=[(10, 20), (-3, 2**31 - 1)],
+            rectangles=[[0, 0, 4, 4]],
+            polygons=polygons,
+        )
+        result = frames.decode_result_frame(frame)
+
+        self.assertEqual(result["status"], "complete")
+        self.assertEqual(result["egg_count"], 5)
+        self.assertEqual(result["points"].tolist(), [[10, 20], [-3, 2**31 - 1]])
+        self.assertEqual(result["rectangles"].tolist(), [[0, 0, 4, 4]])
+        self.assertEqual([poly.tolist() for poly in result["polygons"]], polygons)
+        self.assertEqual(bytes(result["image_bytes"]), b"\xff\xd8jpeg")
+
+    def test_empty_result(self):
+        result = frames.decode_result_frame(frames.encode_result_frame("failed", 0))
+
+        self.assertEqual(result["status"], "failed")
+        self.assertEqual(result["points"].shape, (0, 2))
+        self.assertEqual(result["rectangles"].shape, (0, 4))
+        self.assertEqual(result["polygons"], [])
+        self.assertEqual(len(result["image_bytes"]), 0)
+
+    def test_layout(self):
+        frame = frames.encode_result_frame("complete", 1, image_bytes=b"img", points=np.array([[1, 2]]))
+
+        self.assertEqual(frame[:4], frames.FRAME_MAGIC)
+        (header_length,) = struct.unpack_from("<I", frame, 4)
+        body = frame[8 + header_length:]
+        self.assertEqual(body, struct.pack("<2i", 1, 2) + b"img")
+
+    def test_rejects_other_data(self):
+        with self.assertRaises(ValueError):
+            frames.decode_result_frame(b"JSON{}")
+
+    def test_every_truncation_is_a_value_error(self):
+        frame = frames.encode_result_frame("complete", 1, image_bytes=b"img", points=[(1, 2)], polygons=[[[0, 0], [1, 0], [0, 1]]])
+        for length in range(len(frame)):
+            with self.subTest(length=length), self.assertRaises(ValueError):
+                frames.decode_result_frame(frame[:length])
+
+    def test_rejects_truncated_image(self):
+        frame = frames.encode_result_frame("complete", 0, image_bytes=b"0123456789")
+        with self.assertRaises(ValueError):
+            frames.decode_result_frame(frame[:-1])
+
+
+class BatchFrameTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        parts = [b"first", b"", b"\x00" * 1000]
+        decoded = frames.decode_batch_frame(frames.encode_batch_frame(parts))
+        self.assertEqual([bytes(part) for part in decoded], parts)
+
+    def test_nested_result_frames(self):
+        inner = [frames.encode_result_frame("complete", i, points=[(i, i)]) for i in range(3)]
+        decoded = frames.decode_batch_frame(frames.encode_batch_frame(inner))
+        self.assertEqual([frames.decode_result_frame(part)["egg_count"] for part in decoded], [0, 1, 2])
+
+    def test_rejects_other_data(self):
+        with self.assertRaises(ValueError):
+            frames.decode_batch_frame(frames.encode_result_frame("failed", 0))
+
+    def test_every_truncation_is_a_value_error(self):
+        body = frames.encode_batch_frame([b"ab", b"cde"])
+        for length in range(len(body)):
+            with self.subTest(length=length), self.assertRaises(ValueError):
+                frames.decode_batch_frame(body[:length])
+
+    def test_rejects_truncated_part(self):
+        body = frames.encode_batch_frame([b"abcdef"])
+        with self.assertRaises(ValueError):
+            frames.decode_batch_frame(body[:-2])
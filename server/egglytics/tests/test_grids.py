@@ -0,0 +1,106 @@
+import importlib
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from egglytics.views import grids
+
+grid_bitmap_migration = importlib.import_module("egglytics.migrations.0026_grid_bitmap")
+
+
+class GridBitmapTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        rng = np.random.default_rng(0)
+        for rows, cols in ((1, 1), (3, 5), (6, 11), (8, 8), (17, 3)):
+            with self.subTest(rows=rows, cols=cols):
+                cells = rng.random((rows, cols)) < 0.4
+                packed = grids.pack_cells(cells)
+                self.assertEqual(len(packed), (rows * cols + 7) // 8)
+                np.testing.assert_array_equal(grids.grid_cells(packed, cols, rows), cells)
+
+    def test_bit_layout(self):
+        # Bit row * cols + col, least significant bit of each byte first (Postgres get_bit/set_bit)
+        cells = np.zeros((2, 5), dtype=bool)
+        cells[0, 0] = True      # bit 0
+        cells[1, 4] = True      # bit 9
+        self.assertEqual(grids.pack_cells(cells), bytes([0b00000001, 0b00000010]))
+
+    def test_reads_memoryview(self):
+        cells = grids.grid_cells(memoryview(b"\x80"), 4, 2)
+        self.assertEqual(list(zip(*cells.nonzero())), [(1, 3)])
+
+    def test_empty_grid(self):
+        for bitmap, cols, rows in ((None, 4, 3), (b"", 4, 3), (b"\xff", 0, 0)):
+            with self.subTest(bitmap=bitmap, cols=cols, rows=rows):
+                cells = grids.grid_cells(bitmap, cols, rows)
+                self.assertEqual(cells.shape, (rows, cols))
+                self.assertFalse(cells.any())
+
+    def test_grow_keeps_cells(self):
+        cells = np.array([[True, False], [False, True]])
+        self.assertIs(grids._grow(cells, 2, 1), cells)
+
+        grown = grids._grow(cells, 4, 3)
+        self.assertEqual(grown.shape, (3, 4))
+        self.assertEqual(list(zip(*grown.nonzero())), [(0, 0), (1, 1)])
+
+
+@override_settings(GRID_MAX_CELLS=100)
+class InGridTests(SimpleTestCase):
+
+    def test_inside(self):
+        self.assertTrue(grids.in_grid(0, 0))
+        self.assertTrue(grids.in_grid(99, 99, 100, 100))
+
+    def test_outside(self):
+        for args in ((-1, 0), (0, -1), (100, 0), (0, 100), (0, 0, 101, 1), (0, 0, 1, 101), (0, 0, -1, 0)):
+            with self.subTest(args=args):
+                self.assertFalse(grids.in_grid(*args))
+
+
+class GridBitmapMigrationTests(SimpleTestCase):
+    """
+    0026_grid_bitmap writes the same bits as grids.pack_cells.
+    """
+
+    def apps(self, image_details, verified_grids):
+        apps = mock.Mock()
+        apps.get_model.side_effect = lambda app, name: {"ImageDetails": image_details, "VerifiedGrids": verified_grids}[name]
+        return apps
+
+    def test_forwards(self):
+        rows = [(1, 0, 0), (1, 4, 1), (1, 2, 2), (2, 0, 0)]
+        verified_grids = mock.Mock()
+        verified_grids.objects.values_list.return_value.iterator.return_value = iter(rows)
+        image_details = mock.Mock()
+
+        grid_bitmap_migration.grids_to_bitmaps(self.apps(image_details, verified_grids), None)
+
+        updates = {
+            call.kwargs["image_id"]: update.kwargs
+            for call, update in zip(image_details.objects.filter.call_args_list, image_details.objects.filter.return_value.update.call_args_list)
+        }
+        cells = np.zeros((3, 5), dtype=bool)
+        cells[0, 0] = cells[1, 4] = cells[2, 2] = True
+        self.assertEqual(updates[1], {"grid_bitmap": grids.pack_cells(cells), "grid_cols": 5, "grid_rows": 3})
+        self.assertEqual(updates[2], {"grid_bitmap": b"\x01", "grid_cols": 1, "grid_rows": 1})
+
+    def test_backwards(self):
+        cells = np.zeros((4, 3), dtype=bool)
+        cells[0, 2] = cells[3, 0] = cells[2, 1] = True
+        image_details = mock.Mock()
+        image_details.objects.filter.return_value.values_list.return_value.iterator.return_value = iter(
+            [(7, memoryview(grids.pack_cells(cells)), 3, 4)]
+        )
+        verified_grids = mock.Mock(side_effect=lambda **fields: fields)
+
+        grid_bitmap_migration.bitmaps_to_grids(self.apps(image_details, verified_grids), None)
+
+        (created,), _ = verified_grids.objects.bulk_create.call_args
+        self.assertEqual(
+            sorted((c["x"], c["y"]) for c in created),
+            sorted((int(x), int(y)) for y, x in zip(*cells.nonzero())),
+        )
+        self.assertTrue(all(c["image_id"] == 7 for c in created))
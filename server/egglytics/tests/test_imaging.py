@@ -0,0 +1,46 @@
+from io import BytesIO
+
+from django.test import SimpleTestCase
+from PIL import Image
+
+from egglytics.views.imaging import estimate_jpeg_quality, is_storable_jpeg
+
+
+def encoded(image_format, quality=None, mode="RGB"):
+    buffer = BytesIO()
+    options = {"quality": quality} if quality else {}
+    Image.new(mode, (64, 48), 128).save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+class EstimateJpegQualityTests(SimpleTestCase):
+
+    def test_matches_saved_quality(self):
+        # Below 20 baseline tables are clamped to 255 and the estimate comes out a little high
+        for quality in (20, 30, 50, 70, 90, 95):
+            with self.subTest(quality=quality), Image.open(BytesIO(encoded("JPEG", quality))) as image:
+                self.assertAlmostEqual(estimate_jpeg_quality(image), quality, delta=1)
+
+    def test_low_quality_stays_low(self):
+        with Image.open(BytesIO(encoded("JPEG", 5))) as image:
+            self.assertLess(estimate_jpeg_quality(image), 20)
+
+    def test_no_quantization_table(self):
+        with Image.open(BytesIO(encoded("PNG"))) as image:
+            self.assertIsNone(estimate_jpeg_quality(image))
+
+
+class IsStorableJpegTests(SimpleTestCase):
+
+    def test_quality_limit(self):
+        data = encoded("JPEG", 70)
+        self.assertTrue(is_storable_jpeg(data, max_quality=90))
+        self.assertFalse(is_storable_jpeg(data, max_quality=60))
+
+    def test_grayscale(self):
+        self.assertTrue(is_storable_jpeg(encoded("JPEG", 70, mode="L"), max_quality=90))
+
+    def test_other_data(self):
+        for data in (encoded("PNG"), b"", b"\xff\xd8\xff garbage"):
+            with self.subTest(data=data[:8]):
+                self.assertFalse(is_storable_jpeg(data, max_quality=100))
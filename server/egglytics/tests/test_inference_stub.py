@@ -0,0 +1,77 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+import inference_stub
+from egglytics.views import inference
+
+
+class InferenceStubRoundTripTests(SimpleTestCase):
+    """
+    infer and infer_batch against inference_stub.py, for both transports.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = inference_stub.make_server(port=0, quiet=True)
+        inference_stub.start_in_thread(cls.server)
+        cls.url = "http://127.0.0.1:%d" % cls.server.server_address[1]
+
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.paths = []
+        for i, size in enumerate([(400, 200), (90, 300)]):
+            path = os.path.join(cls.tmp.name, f"image_{i}.png")
+            Image.new("RGB", size, (i * 50, 0, 0)).save(path)
+            cls.paths.append(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def expected(self, path):
+        with open(path, "rb") as f:
+            image_bytes = f.read()
+        result = inference_stub.fake_result(image_bytes)
+        result["image_bytes"] = image_bytes
+        return result
+
+    def assertResult(self, result, path):
+        expected = self.expected(path)
+        self.assertEqual(result["status"], "complete")
+        self.assertEqual(result["egg_count"], expected["egg_count"])
+        self.assertEqual([list(p) for p in result["points"]], expected["points"])
+        self.assertEqual([list(r) for r in result["rectangles"]], expected["rectangles"])
+        self.assertEqual([[list(v) for v in poly] for poly in result["polygons"]], expected["polygons"])
+        self.assertEqual(bytes(result["image_bytes"]), expected["image_bytes"])
+
+    def test_infer(self):
+        for transport in ("binary", "json"):
+            with self.subTest(transport=transport), override_settings(INFERENCE_URL=self.url, INFERENCE_TRANSPORT=transport):
+                status_code, result = inference.infer("upload_base64", "upload_binary", self.paths[0], {"mode": "micro"})
+                self.assertEqual(status_code, 200)
+                self.assertResult(result, self.paths[0])
+
+    def test_infer_recalibrate(self):
+        with override_settings(INFERENCE_URL=self.url, INFERENCE_TRANSPORT="binary"):
+            status_code, result = inference.infer(
+                "recalibrate_base64", "recalibrate_binary", self.paths[1], {"mode": "macro", "avg_pixels": 40}
+            )
+        self.assertEqual(status_code, 200)
+        self.assertResult(result, self.paths[1])
+
+    def test_infer_batch(self):
+        for transport in ("binary", "json"):
+            with self.subTest(transport=transport), override_settings(INFERENCE_URL=self.url, INFERENCE_TRANSPORT=transport):
+                status_code, results = inference.infer_batch(
+                    "upload_batch_base64", "upload_batch_binary", self.paths, {"mode": "micro"}
+                )
+                self.assertEqual(status_code, 200)
+                self.assertEqual(len(results), len(self.paths))
+                for result, path in zip(results, self.paths):
+                    self.assertResult(result, path)
@@ -0,0 +1,24 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from egglytics.views.annotations import pack_points, unpack_points
+
+
+class PackedPointsTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        points = [(0, 0), (12, 34), (-5, 2**31 - 1)]
+        self.assertEqual(unpack_points(pack_points(points)).tolist(), [list(p) for p in points])
+
+    def test_little_endian_int32_pairs(self):
+        self.assertEqual(pack_points([(1, 2)]), b"\x01\x00\x00\x00\x02\x00\x00\x00")
+        self.assertEqual(len(pack_points(np.zeros((100, 2)))), 800)
+
+    def test_reads_memoryview(self):
+        packed = memoryview(pack_points([(7, 8), (9, 10)]))
+        self.assertEqual(unpack_points(packed).tolist(), [[7, 8], [9, 10]])
+
+    def test_nothing_packed(self):
+        for packed in (None, b"", pack_points([])):
+            with self.subTest(packed=packed):
+                self.assertEqual(unpack_points(packed).shape, (0, 2))
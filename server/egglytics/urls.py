@@ -1,17 +1,23 @@
 from django.urls import path
-from .views import metrics, upload, view, editor, export
+from .views import metrics, upload, view, editor, export, chunked_upload, events
 from django.conf import settings
 from django.conf.urls.static import static
 
 urlpatterns = [
     # UPLOAD PAGE
     path("", upload.upload, name="upload"),
+    path("upload/sessions/", chunked_upload.create_upload_session, name="create_upload_session"),
+    path("upload/sessions/<uuid:upload_id>/", chunked_upload.upload_status, name="upload_status"),
+    path("upload/sessions/<uuid:upload_id>/files/<int:file_index>/chunks/<int:chunk_index>/", chunked_upload.upload_chunk, name="upload_chunk"),
+    path("upload/sessions/<uuid:upload_id>/finalize/", chunked_upload.finalize_upload, name="finalize_upload"),
 
     # VIEW PAGE
     path("view/",view.view,name="view"),
+    path("batch/list/", view.batch_list, name="batch_list"),
     path('batch/status/', view.batch_status, name='batch_status'),
     path("batch/<int:batch_id>/images/", view.batch_images, name="batch_images"),
     path('batch/status/latest/', view.batch_status_latest, name='batch_status_latest'),
+    path("events/", events.events, name="events"),
     path("delete-batch/<int:batch_id>/", view.delete_batch, name="delete_batch"),
     path('delete-image/<int:image_id>/', view.delete_image, name='delete_image'),
     path('edit-batch-name/<int:batch_id>/', view.edit_batch_name, name='edit_batch_name'),
@@ -25,6 +31,8 @@ urlpatterns = [
     path("remove_egg_from_db_point/<int:image_id>/", editor.remove_egg_from_db_point, name="remove_egg_from_db_point"),
     path("add_egg_to_db_rect/<int:image_id>/", editor.add_egg_to_db_rect, name="add_egg_to_db_rect"),
     path("remove_egg_from_db_rect/<int:image_id>/", editor.remove_egg_from_db_rect, name="remove_egg_from_db_rect"),
+    path("editor/<int:image_id>/edits/", editor.apply_edits, name="apply_edits"),
+    path("editor/<int:image_id>/annotations/", editor.annotations_in_view, name="annotations_in_view"),
     # Grids
     path("toggleGrid/<int:image_id>/",editor.toggleGrid, name = "toggleGrid"),
 
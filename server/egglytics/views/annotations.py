@@ -0,0 +1,492 @@
+#
+#
+# STORING MODEL ANNOTATIONS
+#
+# A dense image can hold thousands of annotations, so they are never inserted one row at a time.
+# Points and rectangles are written with bulk_create (or with Postgres COPY above
+# ANNOTATION_COPY_THRESHOLD rows), polygons with one insert for the parents and one for their vertices.
+# Callers wrap these helpers in transaction.atomic() together with the image record update,
+# so an image is either stored completely or not at all.
+#
+# Original points of dense images (COMPACT_POINTS_THRESHOLD) are not rows at all, they are packed
+# into ImageDetails.packed_points. Only reviewer edits are rows: added points (is_original=False) and
+# deleted packed points (is_original=True, is_deleted=True tombstones). Read points through
+# live_points / model_points / point_summary so both layouts give the same results.
+#
+# Removals sent by the editor are matched to the nearest annotation within ANNOTATION_MATCH_RADIUS
+# (find_point_near / find_rect_near), reading only the grid cells around the click through the
+# (image, bucket) indexes.
+#
+# The editor does not get every annotation of the image with the page. It asks for the box in view
+# (editor.annotations_in_view): points_in_box / rects_in_box read that box only, and a box holding more
+# than ANNOTATION_VIEW_MAX annotations is sent as clusters (cluster_points) instead.
+#
+#
+
+from ._imports import *
+from .models import ANNOTATION_BUCKET_SIZE
+from collections import Counter
+import math
+from django.db import connection
+from django.db.models import Count
+
+
+def bulk_create_annotations(image_record, points=(), rects=(), polygons=(), is_original=True):
+    """
+    Inserts the annotations of an image with batched inserts.
+
+    Original points are packed on the image instead (see pack_points) when there are at least
+    COMPACT_POINTS_THRESHOLD of them, packed_points and packed_point_count of image_record are updated.
+
+    Args:
+        image_record (ImageDetails): Image the annotations belong to.
+        points (list[tuple[int, int]]): [(x1,y1), ...]
+        rects (list[list[int]]): [[x1, y1, x2, y2], ...]
+        polygons (list[list[list[int]]]): [[ [x1,y1], [x2,y2], ... ], ...]
+        is_original (bool): True for model output.
+
+    Returns:
+        None
+    """
+    batch_size = settings.ANNOTATION_BATCH_SIZE
+
+    if points and is_original and _use_packing(len(points)):
+        image_record.packed_points = pack_points(points)
+        image_record.packed_point_count = len(points)
+        ImageDetails.objects.filter(image_id=image_record.image_id).update(
+            packed_points=image_record.packed_points,
+            packed_point_count=image_record.packed_point_count
+        )
+
+    elif points:
+        if _use_copy(len(points)):
+            _copy_rows(
+                AnnotationPoints,
+                ["image_id", "x", "y", "is_original", "is_deleted"],
+                ((image_record.image_id, p[0], p[1], is_original, False) for p in points)
+            )
+        else:
+            AnnotationPoints.objects.bulk_create(
+                [AnnotationPoints(image=image_record, x=p[0], y=p[1], is_original=is_original) for p in points],
+                batch_size=batch_size
+            )
+
+    if rects:
+        if _use_copy(len(rects)):
+            _copy_rows(
+                AnnotationRect,
+                ["image_id", "x_init", "y_init", "x_end", "y_end", "is_original", "is_deleted"],
+                ((image_record.image_id, r[0], r[1], r[2], r[3], is_original, False) for r in rects)
+            )
+        else:
+            AnnotationRect.objects.bulk_create(
+                [
+                    AnnotationRect(
+                        image=image_record,
+                        x_init=r[0],
+                        y_init=r[1],
+                        x_end=r[2],
+                        y_end=r[3],
+                        is_original=is_original
+                    )
+                    for r in rects
+                ],
+                batch_size=batch_size
+            )
+
+    if polygons:
+        # Postgres returns the primary keys of bulk inserted rows, the vertices can then be linked
+        polygon_records = AnnotationPolygon.objects.bulk_create(
+            [AnnotationPolygon(image=image_record, is_original=is_original) for _ in polygons],
+            batch_size=batch_size
+        )
+
+        AnnotationPolygonPoint.objects.bulk_create(
+            [
+                AnnotationPolygonPoint(polygon=polygon_record, x=p[0], y=p[1], order_index=i)
+                for polygon_record, poly in zip(polygon_records, polygons)
+                for i, p in enumerate(poly)
+            ],
+            batch_size=batch_size
+        )
+
+
+def pack_points(points):
+    """
+    Packs points as little-endian int32 x, y pairs.
+
+    Args:
+        points (list[tuple[int, int]] | np.ndarray): [(x1,y1), ...]
+
+    Returns:
+        bytes: 8 bytes per point.
+    """
+    return np.asarray(points, dtype="<i4").reshape(-1, 2).tobytes()
+
+
+def unpack_points(packed):
+    """
+    Reverses pack_points.
+
+    Args:
+        packed (bytes | memoryview | None): ImageDetails.packed_points
+
+    Returns:
+        np.ndarray: Shape (n, 2), empty if nothing is packed.
+    """
+    if not packed:
+        return np.empty((0, 2), dtype="<i4")
+    return np.frombuffer(packed, dtype="<i4").reshape(-1, 2)
+
+
+def model_points(image):
+    """
+    Points predicted by the model for an image, including the ones the reviewer deleted.
+
+    Args:
+        image (ImageDetails): The image.
+
+    Returns:
+        list[tuple[int, int]]: [(x1,y1), ...]
+    """
+    if image.packed_points is not None:
+        return [tuple(p) for p in unpack_points(image.packed_points).tolist()]
+
+    return list(AnnotationPoints.objects.filter(image=image, is_original=True).values_list("x", "y"))
+
+
+def live_points(image):
+    """
+    Points currently shown for an image: original points not deleted by the reviewer,
+    followed by the points the reviewer added.
+
+    Args:
+        image (ImageDetails): The image.
+
+    Returns:
+        list[tuple[int, int]]: [(x1,y1), ...]
+    """
+    rows = AnnotationPoints.objects.filter(image=image).values_list("x", "y", "is_original", "is_deleted")
+
+    if image.packed_points is None:
+        return [(x, y) for x, y, _, is_deleted in rows if not is_deleted]
+
+    # Each tombstone hides one packed point at its coordinates
+    tombstones = Counter()
+    added = []
+    for x, y, is_original, is_deleted in rows:
+        if is_original and is_deleted:
+            tombstones[(x, y)] += 1
+        elif not is_deleted:
+            added.append((x, y))
+
+    points = []
+    for p in unpack_points(image.packed_points).tolist():
+        p = tuple(p)
+        if tombstones[p]:
+            tombstones[p] -= 1
+        else:
+            points.append(p)
+    return points + added
+
+
+def bucket_of(value):
+    """
+    Grid cell index of one coordinate, truncated like the integer division of the bucket columns.
+    """
+    return math.trunc(int(value) / ANNOTATION_BUCKET_SIZE)
+
+
+def buckets_around(x, y, radius):
+    """
+    Bucket keys of the cells a box of the given radius around (x, y) touches.
+
+    Args:
+        x (int): X coordinate.
+        y (int): Y coordinate.
+        radius (int): Half side of the box in pixels.
+
+    Returns:
+        list[int]: Values of the bucket columns (see models.bucket_expression).
+    """
+    columns = range(bucket_of(x - radius), bucket_of(x + radius) + 1)
+    rows = range(bucket_of(y - radius), bucket_of(y + radius) + 1)
+    return [bx * 65536 + by for bx in columns for by in rows]
+
+
+def find_point_near(image, x, y, radius=None):
+    """
+    The live point of an image nearest to (x, y), within radius pixels on both axes.
+
+    Only the cells around (x, y) are read through the (image, bucket) index, so the
+    lookup does not depend on the number of points of the image. Packed points are
+    searched in memory.
+
+    Args:
+        image (ImageDetails): The image.
+        x (int): X coordinate sent by the editor.
+        y (int): Y coordinate sent by the editor.
+        radius (int, optional): Defaults to ANNOTATION_MATCH_RADIUS.
+
+    Returns:
+        tuple | None: (x, y, row) of the nearest point, row is its AnnotationPoints record or
+                      None for a packed point (deleting it must add a tombstone). None if no point is close.
+    """
+    radius = settings.ANNOTATION_MATCH_RADIUS if radius is None else radius
+    x, y = int(x), int(y)
+
+    nearby = AnnotationPoints.objects.filter(
+        image=image,
+        bucket__in=buckets_around(x, y, radius),
+        x__range=(x - radius, x + radius),
+        y__range=(y - radius, y + radius),
+    )
+
+    candidates = []
+    tombstones = Counter()
+    for row in nearby:
+        if not row.is_deleted:
+            candidates.append(((row.x - x) ** 2 + (row.y - y) ** 2, row.x, row.y, row))
+        elif row.is_original:
+            tombstones[(row.x, row.y)] += 1
+
+    if image.packed_points is not None:
+        packed = unpack_points(image.packed_points)
+        close = packed[(np.abs(packed[:, 0] - x) <= radius) & (np.abs(packed[:, 1] - y) <= radius)]
+        for px, py in close.tolist():
+            # Each tombstone hides one packed point at its coordinates
+            if tombstones[(px, py)]:
+                tombstones[(px, py)] -= 1
+            else:
+                candidates.append(((px - x) ** 2 + (py - y) ** 2, px, py, None))
+
+    if not candidates:
+        return None
+    # Rows first on a tie, removing a reviewer's point never needs a tombstone
+    _, px, py, row = min(candidates, key=lambda c: (c[0], c[3] is None))
+    return px, py, row
+
+
+def find_rect_near(image, x1, y1, x2, y2, radius=None):
+    """
+    The live rect of an image nearest to the given one, both corners within radius pixels.
+
+    Args:
+        image (ImageDetails): The image.
+        x1, y1, x2, y2 (int): Normalized corners sent by the editor (see editor.normalize_rect).
+        radius (int, optional): Defaults to ANNOTATION_MATCH_RADIUS.
+
+    Returns:
+        AnnotationRect | None: None if no rect is close.
+    """
+    radius = settings.ANNOTATION_MATCH_RADIUS if radius is None else radius
+    x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
+
+    nearby = AnnotationRect.objects.filter(
+        image=image,
+        is_deleted=False,
+        bucket__in=buckets_around(x1, y1, radius),
+        x_init__range=(x1 - radius, x1 + radius),
+        y_init__range=(y1 - radius, y1 + radius),
+        x_end__range=(x2 - radius, x2 + radius),
+        y_end__range=(y2 - radius, y2 + radius),
+    )
+    return min(
+        nearby,
+        key=lambda r: (r.x_init - x1) ** 2 + (r.y_init - y1) ** 2 + (r.x_end - x2) ** 2 + (r.y_end - y2) ** 2,
+        default=None,
+    )
+
+
+def points_in_box(image, x1, y1, x2, y2):
+    """
+    Live points of an image inside a box, edges included.
+
+    Rows are read through the (image, bucket) index: the bucket columns of the box are one
+    contiguous range of bucket values. Packed points are filtered in memory.
+
+    Args:
+        image (ImageDetails): The image.
+        x1, y1, x2, y2 (int): Corners of the box, x1 <= x2 and y1 <= y2.
+
+    Returns:
+        np.ndarray: Shape (n, 2) of x, y.
+    """
+    rows = AnnotationPoints.objects.filter(
+        image=image,
+        bucket__range=(bucket_of(x1) * 65536, bucket_of(x2) * 65536 + 65535),
+        x__range=(x1, x2),
+        y__range=(y1, y2),
+    )
+    stored = _coordinates(rows.filter(is_deleted=False).values_list("x", "y"))
+
+    if image.packed_points is None:
+        return stored
+
+    packed = unpack_points(image.packed_points)
+    inside = packed[(packed[:, 0] >= x1) & (packed[:, 0] <= x2) & (packed[:, 1] >= y1) & (packed[:, 1] <= y2)]
+
+    tombstones = Counter(rows.filter(is_original=True, is_deleted=True).values_list("x", "y"))
+    if tombstones:
+        # Each tombstone hides one packed point at its coordinates
+        keep = np.ones(len(inside), dtype=bool)
+        for i, p in enumerate(map(tuple, inside.tolist())):
+            if tombstones[p]:
+                tombstones[p] -= 1
+                keep[i] = False
+        inside = inside[keep]
+
+    return np.concatenate((inside, stored))
+
+
+# Fields of a rect sent to the editor
+RECT_VIEW_FIELDS = ("rect_id", "x_init", "y_init", "x_end", "y_end")
+
+
+def rects_in_box(image, x1, y1, x2, y2):
+    """
+    Live rects of an image overlapping a box.
+
+    Args:
+        image (ImageDetails): The image.
+        x1, y1, x2, y2 (int): Corners of the box, x1 <= x2 and y1 <= y2.
+
+    Returns:
+        QuerySet: Tuples of RECT_VIEW_FIELDS.
+    """
+    return AnnotationRect.objects.filter(
+        image=image,
+        is_deleted=False,
+        x_init__lte=x2,
+        x_end__gte=x1,
+        y_init__lte=y2,
+        y_end__gte=y1,
+    ).values_list(*RECT_VIEW_FIELDS)
+
+
+def cluster_points(points, cell):
+    """
+    Aggregates points on a square grid, one cluster per non-empty cell.
+
+    Args:
+        points (np.ndarray): Shape (n, 2) of x, y.
+        cell (int): Side of a grid cell in image pixels.
+
+    Returns:
+        np.ndarray: Shape (n, 3) of x, y, count, with x, y the mean position of the points of the cell.
+    """
+    if len(points) == 0:
+        return np.empty((0, 3), dtype="<i4")
+
+    cells, inverse, counts = np.unique(points // cell, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    sum_x = np.bincount(inverse, weights=points[:, 0], minlength=len(cells))
+    sum_y = np.bincount(inverse, weights=points[:, 1], minlength=len(cells))
+
+    return np.column_stack((np.rint(sum_x / counts), np.rint(sum_y / counts), counts)).astype("<i4")
+
+
+def point_summary(images):
+    """
+    Counts the points of several images by review outcome, without unpacking anything.
+
+    Args:
+        images (QuerySet[ImageDetails]): The images.
+
+    Returns:
+        dict[int, dict]: image_id -> {
+            "kept" (int): Original points not deleted by the reviewer,
+            "deleted" (int): Original points deleted by the reviewer,
+            "added" (int): Points added by the reviewer,
+            "added_deleted" (int): Rows of added points marked deleted (added points are
+                                   normally removed outright, is_original=False counts them),
+            "rows" (int): AnnotationPoints rows of the image in the row layout, deleted ones included,
+        }
+    """
+    # Only images with packed points have a packed_point_count, the blobs themselves are not loaded
+    summary = {
+        image_id: {"kept": packed_count, "deleted": 0, "added": 0, "added_deleted": 0, "packed": packed_count > 0}
+        for image_id, packed_count in images.values_list("image_id", "packed_point_count")
+    }
+
+    rows = (
+        AnnotationPoints.objects.filter(image_id__in=images.values("image_id"))
+        .values("image_id", "is_original", "is_deleted")
+        .annotate(n=Count("point_id"))
+    )
+    for row in rows:
+        counts = summary[row["image_id"]]
+        if not row["is_original"]:
+            if row["is_deleted"]:
+                counts["added_deleted"] += row["n"]
+            else:
+                counts["added"] += row["n"]
+        elif row["is_deleted"]:
+            counts["deleted"] += row["n"]
+            # Tombstone of a packed point
+            if counts["packed"]:
+                counts["kept"] -= row["n"]
+        else:
+            counts["kept"] += row["n"]
+
+    for counts in summary.values():
+        del counts["packed"]
+        # A packed point is one row, kept or deleted, its tombstone is not a row of its own
+        counts["rows"] = counts["kept"] + counts["deleted"] + counts["added"] + counts["added_deleted"]
+    return summary
+
+
+def _coordinates(rows):
+    """
+    Turns a values_list of integer pairs into an int32 array of shape (n, 2).
+    """
+    flat = np.fromiter((value for row in rows for value in row), dtype="<i4")
+    return flat.reshape(-1, 2)
+
+
+def _use_packing(point_count):
+    """
+    Whether point_count original points are packed instead of written as rows.
+    """
+    threshold = settings.COMPACT_POINTS_THRESHOLD
+    return threshold > 0 and point_count >= threshold
+
+
+def _use_copy(row_count):
+    """
+    Whether row_count rows are written with COPY instead of bulk_create.
+    """
+    threshold = settings.ANNOTATION_COPY_THRESHOLD
+    return connection.vendor == "postgresql" and threshold > 0 and row_count >= threshold
+
+
+def _copy_rows(model, columns, rows):
+    """
+    Writes rows to the table of a model with Postgres COPY (text format).
+
+    Only integers and booleans are written, so the values need no escaping.
+
+    Args:
+        model (Model): Target model.
+        columns (list[str]): Column names in the order of each row.
+        rows (iterable[tuple]): Row values.
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(
+            ("t" if value else "f") if isinstance(value, bool) else str(int(value))
+            for value in row
+        ))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    sql = f"COPY {model._meta.db_table} ({', '.join(columns)}) FROM STDIN"
+    with connection.cursor() as cursor:
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, "copy_expert"):
+            # psycopg2
+            raw_cursor.copy_expert(sql, buffer)
+        else:
+            # psycopg 3
+            with raw_cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
@@ -0,0 +1,433 @@
+#
+#
+# RESUMABLE (CHUNKED) UPLOADS
+#
+# upload() receives a whole batch in one multipart request, a dropped connection means starting over.
+# Large batches are instead sent in numbered chunks:
+#   1. POST upload/sessions/                                       describe the batch, get an upload_id
+#   2. PUT  upload/sessions/<id>/files/<i>/chunks/<n>/             raw bytes of a chunk, X-Chunk-Checksum header
+#   3. GET  upload/sessions/<id>/                                  chunks already confirmed (to resume)
+#   4. POST upload/sessions/<id>/finalize/                         creates the batch and queues PROCESS_BATCH
+# Each chunk is checked in a part file, then written at its offset in the staged file, so finalizing only moves the files.
+# Nothing exists for the rest of the app (no BatchDetails, no job) until the session is finalized.
+#
+#
+
+from ._imports import *
+from .jobs import enqueue_job
+from . import totals
+from .models import UploadSession, UploadChunk
+from datetime import timedelta
+import hashlib
+import shutil
+import zlib
+
+ALLOWED_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+# Bytes read from the request at a time while a chunk is written
+READ_SIZE = 64 * 1024
+
+
+def create_upload_session(request):
+    """
+    Starts a chunked upload.
+
+    Args:
+        request: POST request with JSON body containing:
+            - batch_name (str): Name of the upload batch
+            - user (str): Owner of the batch
+            - files (list[dict]): [{"name", "size", "model", "mode", "share"}, ...] in upload order
+
+    Returns:
+        JsonResponse: {"upload_id": str, "chunk_size": int, "files": [{"index", "name", "size", "chunks"}, ...]}
+        JsonResponse: {"error": str} with status 400 if the batch is invalid
+        JsonResponse: {"error": "Invalid method"} with status 405 for non-POST
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid method"}, status=405)
+
+    purge_expired_sessions()
+
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+
+    files = data.get("files") or []
+    if not files:
+        return JsonResponse({"error": "No files"}, status=400)
+    if len(files) > settings.UPLOAD_MAX_FILES:
+        return JsonResponse({"error": f"Maximum {settings.UPLOAD_MAX_FILES} files allowed"}, status=400)
+
+    cleaned = []
+    for f in files:
+        name = os.path.basename(str(f.get("name", "")))
+        size = f.get("size")
+        if not name.lower().endswith(ALLOWED_EXTENSIONS):
+            return JsonResponse({"error": f"Invalid file type: {name}"}, status=400)
+        if not isinstance(size, int) or size <= 0 or size > settings.UPLOAD_MAX_FILE_SIZE:
+            return JsonResponse({"error": f"Invalid file size: {name}"}, status=400)
+
+        cleaned.append({
+            "name": name,
+            "size": size,
+            "model": f.get("model"),
+            "mode": f.get("mode"),          # "micro" or "macro"
+            "share": bool(f.get("share")),
+        })
+
+    session = UploadSession.objects.create(
+        batch_name=data.get("batch_name") or "",
+        owner=data.get("user") or "Incognito",
+        files=cleaned,
+        chunk_size=settings.UPLOAD_CHUNK_SIZE,
+    )
+
+    # Every staged file exists from the start, chunks are written at their offset in any order
+    folder = session_dir(session.upload_id)
+    os.makedirs(folder, exist_ok=True)
+    for index in range(len(cleaned)):
+        open(staged_file(session, index), "wb").close()
+
+    return JsonResponse({
+        "upload_id": str(session.upload_id),
+        "chunk_size": session.chunk_size,
+        "files": [
+            {"index": i, "name": f["name"], "size": f["size"], "chunks": chunk_count(session, i)}
+            for i, f in enumerate(cleaned)
+        ],
+    })
+
+
+def upload_chunk(request, upload_id, file_index, chunk_index):
+    """
+    Stores one chunk of a file. Sending a chunk again replaces it once the new copy matches its checksum.
+
+    The body is streamed to a part file, it is never held in memory as a whole, and copied to its
+    offset in the staged file once its size and checksum are right.
+
+    Args:
+        request: PUT request whose body is the raw chunk, with header:
+            - X-Chunk-Checksum (str): "sha256=<hex>" or "crc32=<hex>" of the body
+        upload_id (UUID): Session returned by create_upload_session
+        file_index (int): Position of the file in the session
+        chunk_index (int): Position of the chunk in the file, from 0
+
+    Returns:
+        JsonResponse: {"success": True, "received": int} number of confirmed chunks of the file
+        JsonResponse: {"error": str} with status 400 if the chunk is invalid or does not match its checksum
+        JsonResponse: {"error": str} with status 404 if the session or chunk does not exist
+        JsonResponse: {"error": str} with status 409 if the session was finalized (or is being finalized or purged)
+        JsonResponse: {"error": "Invalid method"} with status 405 for non-PUT
+    """
+    if request.method != "PUT":
+        return JsonResponse({"error": "Invalid method"}, status=405)
+
+    session = UploadSession.objects.filter(upload_id=upload_id).first()
+    if session is None:
+        return JsonResponse({"error": "Upload not found"}, status=404)
+    if session.status != "OPEN":
+        return JsonResponse({"error": "Upload already finalized"}, status=409)
+    if not 0 <= file_index < len(session.files) or not 0 <= chunk_index < chunk_count(session, file_index):
+        return JsonResponse({"error": "Chunk not found"}, status=404)
+
+    algorithm, _, expected = request.headers.get("X-Chunk-Checksum", "").partition("=")
+    algorithm = algorithm.strip().lower()
+    expected = expected.strip().lower()
+    if algorithm not in ("sha256", "crc32") or not expected:
+        return JsonResponse({"error": "Missing or unsupported X-Chunk-Checksum"}, status=400)
+
+    offset = chunk_index * session.chunk_size
+    length = min(session.chunk_size, session.files[file_index]["size"] - offset)
+
+    # The chunk is written to a part file first, a failed resend leaves the confirmed copy untouched
+    part_path = os.path.join(session_dir(session.upload_id), f"{file_index}-{chunk_index}-{uuid.uuid4().hex}.part")
+    try:
+        with open(part_path, "w+b") as part:
+            received, actual = receive_chunk(request, part, length, algorithm)
+
+            if received != length:
+                return JsonResponse({"error": f"Chunk must be {length} bytes"}, status=400)
+            if actual != expected:
+                # Nothing was written to the staged file, the client sends the chunk again
+                return JsonResponse({"error": "Checksum mismatch"}, status=400)
+
+            # Under the row lock finalize_upload takes, so the staged file is not moved while it is written
+            with transaction.atomic():
+                locked = UploadSession.objects.select_for_update().filter(upload_id=session.upload_id).first()
+                if locked is None or locked.status != "OPEN":
+                    return JsonResponse({"error": "Upload already finalized"}, status=409)
+
+                with open(staged_file(session, file_index), "r+b") as f:
+                    f.seek(offset)
+                    part.seek(0)
+                    shutil.copyfileobj(part, f, READ_SIZE)
+
+                UploadChunk.objects.update_or_create(
+                    session=session,
+                    file_index=file_index,
+                    chunk_index=chunk_index,
+                    defaults={"size": length, "checksum": f"{algorithm}={actual}"},
+                )
+                UploadSession.objects.filter(upload_id=session.upload_id).update(last_update=timezone.now())
+    except FileNotFoundError:
+        # The session folder went away with a finalize or purge running alongside
+        return JsonResponse({"error": "Upload already finalized"}, status=409)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+    confirmed = UploadChunk.objects.filter(session=session, file_index=file_index).count()
+    return JsonResponse({"success": True, "received": confirmed})
+
+
+def receive_chunk(request, part, length, algorithm):
+    """
+    Streams the body of a chunk request to a file, hashing it on the way.
+
+    Args:
+        request: The PUT request.
+        part (file): Open binary file the body is written to.
+        length (int): Expected size of the chunk, reading stops one byte past it.
+        algorithm (str): "sha256" or "crc32".
+
+    Returns:
+        tuple[int, str]: Bytes received (length + 1 if the body is too long) and the hex checksum of the bytes written.
+    """
+    digest = hashlib.sha256() if algorithm == "sha256" else None
+    crc = 0
+    received = 0
+    while received <= length:
+        data = request.read(min(READ_SIZE, length + 1 - received))
+        if not data:
+            break
+        received += len(data)
+        if received > length:
+            break
+
+        part.write(data)
+        if digest:
+            digest.update(data)
+        else:
+            crc = zlib.crc32(data, crc)
+
+    return received, digest.hexdigest() if digest else f"{crc:08x}"
+
+
+def upload_status(request, upload_id):
+    """
+    Lists the confirmed chunks of an upload so an interrupted upload can resume.
+
+    Args:
+        request: GET request
+        upload_id (UUID): Session returned by create_upload_session
+
+    Returns:
+        JsonResponse: {
+            "upload_id" (str),
+            "status" (str): "OPEN" or "FINALIZED",
+            "batch_id" (int | None): Set once finalized,
+            "chunk_size" (int),
+            "files": [{"index", "name", "size", "chunks", "received": list[int]}, ...]
+        }
+        JsonResponse: {"error": "Upload not found"} with status 404
+    """
+    session = UploadSession.objects.filter(upload_id=upload_id).first()
+    if session is None:
+        return JsonResponse({"error": "Upload not found"}, status=404)
+
+    received = {}
+    for file_index, chunk_index in session.chunks.values_list("file_index", "chunk_index").order_by("chunk_index"):
+        received.setdefault(file_index, []).append(chunk_index)
+
+    return JsonResponse({
+        "upload_id": str(session.upload_id),
+        "status": session.status,
+        "batch_id": session.batch_id,
+        "chunk_size": session.chunk_size,
+        "files": [
+            {
+                "index": i,
+                "name": f["name"],
+                "size": f["size"],
+                "chunks": chunk_count(session, i),
+                "received": received.get(i, []),
+            }
+            for i, f in enumerate(session.files)
+        ],
+    })
+
+
+def finalize_upload(request, upload_id):
+    """
+    Completes an upload: creates the batch and queues a PROCESS_BATCH job (like upload does).
+
+    Finalizing twice returns the same batch.
+
+    Args:
+        request: POST request
+        upload_id (UUID): Session returned by create_upload_session
+
+    Returns:
+        JsonResponse: {"message": str, "batch_id": int}
+        JsonResponse: {"error": str, "missing": {file_index: [chunk_index, ...]}} with status 409 if chunks are missing
+        JsonResponse: {"error": "Upload not found"} with status 404
+        JsonResponse: {"error": "Invalid method"} with status 405 for non-POST
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid method"}, status=405)
+
+    # The files are moved inside the transaction so they are in place once the job can be claimed,
+    # they go back to the session folder if it rolls back, the upload can then be finalized again
+    moved = []
+    try:
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().filter(upload_id=upload_id).first()
+            if session is None:
+                return JsonResponse({"error": "Upload not found"}, status=404)
+
+            if session.status == "FINALIZED":
+                return JsonResponse({"message": "Upload received! Processing in background.", "batch_id": session.batch_id})
+
+            missing = missing_chunks(session)
+            if missing:
+                return JsonResponse({"error": "Upload incomplete", "missing": missing}, status=409)
+
+            batch = BatchDetails.objects.create(
+                batch_name=session.batch_name,
+                owner=session.owner,
+                total_images=len(session.files),
+                total_eggs=0,
+                total_hatched=0,
+                date_updated=timezone.now(),
+                is_complete=False,
+                has_fail_present=False,
+            )
+            totals.add(owner=batch.owner, batches=1, images=batch.total_images)
+
+            # Same staging layout as stage_upload, process_images removes the files once handled.
+            # The hash is left to the job, hashing gigabytes here would hold the request.
+            files_data = []
+            for i, f in enumerate(session.files):
+                _, ext = os.path.splitext(f["name"])
+                staged_path = os.path.join("staging", str(batch.id), f"{uuid.uuid4().hex}{ext.lower()}")
+                full_path = os.path.join(settings.MEDIA_ROOT, staged_path)
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.replace(staged_file(session, i), full_path)
+                moved.append((staged_file(session, i), full_path))
+
+                files_data.append({
+                    "name": f["name"],
+                    "path": staged_path,
+                    "hash": None,
+                    "model": f["model"],
+                    "mode": f["mode"],
+                    "share": f["share"],
+                })
+
+            session.status = "FINALIZED"
+            session.batch = batch
+            session.save()
+            session.chunks.all().delete()
+
+            enqueue_job("PROCESS_BATCH", {
+                "batch_id": batch.id,
+                "files": files_data,
+                "header": session.batch_name,
+            })
+    except Exception:
+        for session_path, batch_path in reversed(moved):
+            try:
+                os.replace(batch_path, session_path)
+            except OSError as e:
+                print("Could not move back a staged file:", e)
+        if moved:
+            try:
+                os.rmdir(os.path.dirname(moved[0][1]))
+            except OSError:
+                pass
+        raise
+
+    shutil.rmtree(session_dir(session.upload_id), ignore_errors=True)
+    return JsonResponse({"message": "Upload received! Processing in background.", "batch_id": batch.id})
+
+
+def chunk_count(session, file_index):
+    """
+    Number of chunks of a file of a session.
+
+    Args:
+        session (UploadSession): The session.
+        file_index (int): Position of the file in the session.
+
+    Returns:
+        int: ceil(size / chunk_size)
+    """
+    return -(-session.files[file_index]["size"] // session.chunk_size)
+
+
+def missing_chunks(session):
+    """
+    Chunks of a session that were not confirmed yet.
+
+    Args:
+        session (UploadSession): The session.
+
+    Returns:
+        dict[int, list[int]]: file_index -> missing chunk indexes, empty if the upload is complete.
+    """
+    received = set(session.chunks.values_list("file_index", "chunk_index"))
+    missing = {}
+    for i in range(len(session.files)):
+        absent = [n for n in range(chunk_count(session, i)) if (i, n) not in received]
+        if absent:
+            missing[i] = absent
+    return missing
+
+
+def session_dir(upload_id):
+    """
+    Folder of the staged files of a session.
+
+    Args:
+        upload_id (UUID): The session.
+
+    Returns:
+        str: MEDIA_ROOT/staging/sessions/<upload_id>
+    """
+    return os.path.join(settings.MEDIA_ROOT, "staging", "sessions", str(upload_id))
+
+
+def staged_file(session, file_index):
+    """
+    File the chunks of a file of a session are written to.
+
+    Args:
+        session (UploadSession): The session.
+        file_index (int): Position of the file in the session.
+
+    Returns:
+        str: <session_dir>/<file_index><ext>
+    """
+    _, ext = os.path.splitext(session.files[file_index]["name"])
+    return os.path.join(session_dir(session.upload_id), f"{file_index}{ext.lower()}")
+
+
+def purge_expired_sessions():
+    """
+    Deletes the sessions (and staged files) not touched for UPLOAD_SESSION_TTL seconds.
+
+    Returns:
+        int: Number of sessions deleted.
+    """
+    expired = UploadSession.objects.filter(
+        last_update__lt=timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+    )
+    upload_ids = list(expired.values_list("upload_id", flat=True))
+    if not upload_ids:
+        return 0
+
+    UploadSession.objects.filter(upload_id__in=upload_ids).delete()
+    for upload_id in upload_ids:
+        shutil.rmtree(session_dir(upload_id), ignore_errors=True)
+    return len(upload_ids)
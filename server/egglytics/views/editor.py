@@ -10,13 +10,18 @@
 
 
 from ._imports import *
+import math
+from .annotations import (
+    find_point_near, find_rect_near, points_in_box, rects_in_box, cluster_points, point_summary, RECT_VIEW_FIELDS
+)
+from . import totals, grids
 @transaction.atomic
 def add_egg_to_db_point(request, image_id):
     """
     Add a new annotation point (egg) to the database.
 
     Atomically creates a new AnnotationPoints record and increments
-    egg counts on both ImageDetails and BatchDetails.
+    egg counts on both ImageDetails and BatchDetails (and the running totals).
 
     Args:
         request: POST request with JSON body containing:
@@ -54,8 +59,11 @@ def add_egg_to_db_point(request, image_id):
         )
 
         # Atomic increments (NO RACE CONDITION)
-        ImageDetails.objects.filter(pk=image.pk).update(total_eggs=F("total_eggs") + 1)
-        BatchDetails.objects.filter(pk=batch.pk).update(total_eggs=F("total_eggs") + 1)
+        # last_update and date_updated set by hand, update() skips auto_now and batch_images
+        # derives its ETag from the first, batch_status looks for changed batches with the second
+        ImageDetails.objects.filter(pk=image.pk).update(total_eggs=F("total_eggs") + 1, last_update=timezone.now())
+        BatchDetails.objects.filter(pk=batch.pk).update(total_eggs=F("total_eggs") + 1, date_updated=timezone.now())
+        totals.add(owner=batch.owner, model=image.model_used, eggs=1)
 
         return JsonResponse({"STATUS": "Added"})
 
@@ -67,9 +75,11 @@ def remove_egg_from_db_point(request, image_id):
     """
     Remove an annotation point (egg) from the database.
 
-    Looks up the point by (image_id, x, y). Original points are soft-deleted
-    (is_deleted=True); user-added points are hard-deleted. Decrements egg
-    counts on both ImageDetails and BatchDetails.
+    Looks up the nearest point within ANNOTATION_MATCH_RADIUS of (x, y)
+    (see annotations.find_point_near). Original points are soft-deleted
+    (is_deleted=True); user-added points are hard-deleted. A packed original
+    point (see annotations.py) gets a soft-deleted row at its coordinates.
+    Decrements egg counts on both ImageDetails and BatchDetails (and the running totals).
 
     Args:
         request: POST request with JSON body containing:
@@ -95,15 +105,24 @@ def remove_egg_from_db_point(request, image_id):
         image = ImageDetails.objects.select_for_update().get(image_id=image_id)
         batch = BatchDetails.objects.select_for_update().get(id=image.batch_id)
 
-        point = AnnotationPoints.objects.select_for_update().filter(
-            image_id=image_id, x=x, y=y
-        ).first()
-
-        if not point:
+        # Nearest point within ANNOTATION_MATCH_RADIUS, the editor's rounding may differ from the stored value
+        found = find_point_near(image, x, y)
+        if found is None:
             return JsonResponse({"STATUS": "Point not found"}, status=404)
+        x, y, point = found
+
+        if point is None:
+            # Packed original point, record the deletion as a row
+            AnnotationPoints.objects.create(
+                image=image,
+                x=x,
+                y=y,
+                is_original=True,
+                is_deleted=True
+            )
 
         # Handle delete logic
-        if point.is_original:
+        elif point.is_original:
             point.is_deleted = True
             point.save()
         else:
@@ -111,11 +130,14 @@ def remove_egg_from_db_point(request, image_id):
 
         # Prevent negative counts
         ImageDetails.objects.filter(pk=image.pk).update(
-            total_eggs=F("total_eggs") - 1
+            total_eggs=F("total_eggs") - 1,
+            last_update=timezone.now()
         )
         BatchDetails.objects.filter(pk=batch.pk).update(
-            total_eggs=F("total_eggs") - 1
+            total_eggs=F("total_eggs") - 1,
+            date_updated=timezone.now()
         )
+        totals.add(owner=batch.owner, model=image.model_used, eggs=-1)
 
         return JsonResponse({"STATUS": "Deleted"})
 
@@ -181,7 +203,8 @@ def remove_egg_from_db_rect(request, image_id):
     """
     Remove an annotation rectangle (egg region) from the database.
 
-    Looks up the rect by its normalized coordinates. Original rects are
+    Looks up the nearest rect within ANNOTATION_MATCH_RADIUS of the normalized
+    coordinates (see annotations.find_rect_near). Original rects are
     soft-deleted (is_deleted=True); user-added rects are hard-deleted.
 
     Args:
@@ -209,13 +232,8 @@ def remove_egg_from_db_rect(request, image_id):
             # NORMALIZE HERE TOO
             x1, y1, x2, y2 = normalize_rect(x1, y1, x2, y2)
 
-            rect = AnnotationRect.objects.filter(
-                image_id=image_id,
-                x_init=x1,
-                y_init=y1,
-                x_end=x2,
-                y_end=y2
-            ).first()
+            # Nearest rect within ANNOTATION_MATCH_RADIUS on both corners
+            rect = find_rect_near(image_id, x1, y1, x2, y2)
 
             if not rect:
                 return JsonResponse({"STATUS": "Rect not found"}, status=404)
@@ -260,37 +278,366 @@ def toggleGrid(request, image_id):
     """
     Toggle a verified grid cell on or off for an image.
 
-    If a VerifiedGrids record matching (image_id, x, y) already exists,
-    it is deleted. Otherwise, a new record is created.
+    The cell is one bit of the grid bitmap of the image, flipped with a single UPDATE (see grids.py).
 
     Args:
         request: POST request with JSON body containing:
             - x (int): Grid column index
             - y (int): Grid row index
+            - cols, rows (int, optional): Size of the grid of the editor
         image_id (int): PK of the target ImageDetails record
 
     Returns:
-        JsonResponse: {"STATUS": "OK"} on success
+        JsonResponse: {"STATUS": "OK", "verified": bool} on success
         JsonResponse: {"STATUS": "Error: ..."} with status 500 on exception
         JsonResponse: {"STATUS": "Invalid request"} with status 400 for non-POST
+                      or a cell outside GRID_MAX_CELLS
     """
     if request.method == "POST":
         try:
             data = json.loads(request.body.decode("utf-8"))
-            print("DEBUG POST DATA:", data)
 
-            x = data.get("x")
-            y = data.get("y")
-
-            print(image_id, x,y)
-            grid_exists = VerifiedGrids.objects.filter(image_id = image_id, x=x, y=y).first()
-            if(grid_exists):
-                grid_exists.delete()
-            else:
-                newGrid = VerifiedGrids.objects.create(image_id = image_id, x = x, y = y)
-            return JsonResponse({"STATUS": "OK"})    
+            x = int(data.get("x"))
+            y = int(data.get("y"))
+            cols = int(data.get("cols", 0))
+            rows = int(data.get("rows", 0))
+            if not grids.in_grid(x, y, cols, rows):
+                return JsonResponse({"STATUS": "Invalid request"}, status=400)
+
+            verified = grids.toggle_cell(image_id, x, y, cols, rows)
+            if verified is None:
+                return JsonResponse({"STATUS": "Image not found"}, status=404)
+            return JsonResponse({"STATUS": "OK", "verified": verified})
         except Exception as e:
             return JsonResponse({"STATUS": f"Error: {str(e)}"}, status=500)
 
     return JsonResponse({"STATUS": "Invalid request"}, status=400)
 
+
+
+# Operations accepted by apply_edits, in the "op" field of each entry
+EDIT_OPS = (
+    "add_point", "remove_point",
+    "add_rect", "remove_rect",
+    "add_polygon", "remove_polygon",
+    "toggle_grid", "fill_grid",
+)
+
+class EditError(ValueError):
+    """
+    An invalid operation of apply_edits, index is its position in the list.
+    """
+    def __init__(self, message, index):
+        super().__init__(message)
+        self.index = index
+
+
+def apply_edits(request, image_id):
+    """
+    Apply an ordered list of editor operations to an image in a single transaction.
+
+    Replaces one request per click: the editor queues its edits (see image_editor/api.js)
+    and sends them together. Only the image row is locked while the operations run,
+    the egg counts of the image, its batch and the running totals are updated once at the end.
+    Points, rects and polygons each count as one egg, like the results of the model.
+
+    Args:
+        request: POST request with JSON body {"ops": [...]}, each entry one of:
+            - {"op": "add_point", "x", "y"}
+            - {"op": "remove_point", "x", "y"}
+            - {"op": "add_rect", "x1", "y1", "x2", "y2"}
+            - {"op": "remove_rect", "x1", "y1", "x2", "y2"}
+            - {"op": "add_polygon", "points": [[x, y], ...]} (at least 3 vertices)
+            - {"op": "remove_polygon", "id"}
+            - {"op": "toggle_grid", "x", "y"} optionally with "cols", "rows", the size of the grid
+            - {"op": "fill_grid", "x1", "y1", "x2", "y2", "verified"} every cell between two corner cells,
+              optionally with "cols", "rows"
+              (cells and sizes of the grid ops are at most GRID_MAX_CELLS, see grids.in_grid)
+        image_id (int): PK of the target ImageDetails record
+
+    Returns:
+        JsonResponse: {
+            "results" (list[dict]): One per operation, in order: {"status", "id"} where status is
+                "added", "deleted", "not_found", "on", "off" or "filled" and id the point_id, rect_id
+                or polygon_id (None when nothing was stored, the number of changed cells for "filled"),
+            "total_eggs" (int): Egg count of the image after the edits,
+        }
+        JsonResponse: {"error": str, "index": int} with status 400 if an operation is invalid,
+                      none of the operations are applied
+        JsonResponse: {"error": "Image not found"} with status 404
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid method"}, status=405)
+
+    try:
+        ops = json.loads(request.body.decode("utf-8")).get("ops")
+    except (ValueError, AttributeError):
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    if not isinstance(ops, list) or len(ops) > settings.EDITOR_MAX_OPS:
+        return JsonResponse({"error": f"ops must be a list of at most {settings.EDITOR_MAX_OPS} operations"}, status=400)
+
+    try:
+        with transaction.atomic():
+            image = (
+                ImageDetails.objects
+                .select_for_update(of=("self",))
+                .select_related("batch")
+                .filter(image_id=image_id)
+                .first()
+            )
+            if image is None:
+                return JsonResponse({"error": "Image not found"}, status=404)
+
+            results, eggs = run_edit_ops(image, ops)
+
+            if eggs:
+                # last_update and date_updated set by hand, update() skips auto_now (see add_egg_to_db_point)
+                ImageDetails.objects.filter(pk=image.pk).update(total_eggs=F("total_eggs") + eggs, last_update=timezone.now())
+                BatchDetails.objects.filter(pk=image.batch_id).update(
+                    total_eggs=F("total_eggs") + eggs, date_updated=timezone.now()
+                )
+                totals.add(owner=image.batch.owner, model=image.model_used, eggs=eggs)
+
+    except EditError as e:
+        return JsonResponse({"error": str(e), "index": e.index}, status=400)
+
+    return JsonResponse({"results": results, "total_eggs": image.total_eggs + eggs})
+
+
+def run_edit_ops(image, ops):
+    """
+    Runs the operations of apply_edits, inside its transaction.
+
+    Consecutive add_point operations are inserted with one bulk_create.
+
+    Args:
+        image (ImageDetails): The locked image.
+        ops (list[dict]): The operations (see apply_edits).
+
+    Returns:
+        tuple: (results, eggs) the result of every operation and the change of the egg count.
+
+    Raises:
+        EditError: On the first invalid operation.
+    """
+    results = [None] * len(ops)
+    eggs = 0
+    pending_points = [] # (index, AnnotationPoints) not inserted yet
+
+    def flush_points():
+        if pending_points:
+            created = AnnotationPoints.objects.bulk_create([point for _, point in pending_points])
+            for (index, _), point in zip(pending_points, created):
+                results[index] = {"status": "added", "id": point.point_id}
+            pending_points.clear()
+
+    def ints(op, index, *names):
+        try:
+            return [int(op[name]) for name in names]
+        except (KeyError, TypeError, ValueError):
+            raise EditError(f"{op.get('op')} needs integer {', '.join(names)}", index)
+
+    for index, op in enumerate(ops):
+        kind = op.get("op") if isinstance(op, dict) else None
+        if kind not in EDIT_OPS:
+            raise EditError(f"Unknown operation {kind}", index)
+
+        if kind == "add_point":
+            x, y = ints(op, index, "x", "y")
+            pending_points.append((index, AnnotationPoints(image=image, x=x, y=y, is_original=False)))
+            eggs += 1
+            continue
+
+        # Everything else may look for a point added just before
+        flush_points()
+
+        if kind == "remove_point":
+            x, y = ints(op, index, "x", "y")
+            found = find_point_near(image, x, y)
+            if found is None:
+                results[index] = {"status": "not_found", "id": None}
+                continue
+            x, y, point = found
+            if point is None:
+                # Packed original point, record the deletion as a row
+                point = AnnotationPoints.objects.create(image=image, x=x, y=y, is_original=True, is_deleted=True)
+            point_id = point.point_id
+            if point.is_original and not point.is_deleted:
+                point.is_deleted = True
+                point.save(update_fields=["is_deleted"])
+            elif not point.is_original:
+                point.delete()
+            results[index] = {"status": "deleted", "id": point_id}
+            eggs -= 1
+
+        elif kind == "add_rect":
+            x1, y1, x2, y2 = normalize_rect(*ints(op, index, "x1", "y1", "x2", "y2"))
+            rect = AnnotationRect.objects.create(
+                image=image, x_init=x1, y_init=y1, x_end=x2, y_end=y2, is_original=False
+            )
+            results[index] = {"status": "added", "id": rect.rect_id}
+            eggs += 1
+
+        elif kind == "remove_rect":
+            x1, y1, x2, y2 = normalize_rect(*ints(op, index, "x1", "y1", "x2", "y2"))
+            rect = find_rect_near(image, x1, y1, x2, y2)
+            if rect is None:
+                results[index] = {"status": "not_found", "id": None}
+                continue
+            rect_id = rect.rect_id
+            if rect.is_original:
+                rect.is_deleted = True
+                rect.save(update_fields=["is_deleted"])
+            else:
+                rect.delete()
+            results[index] = {"status": "deleted", "id": rect_id}
+            eggs -= 1
+
+        elif kind == "add_polygon":
+            vertices = op.get("points")
+            try:
+                vertices = [(int(x), int(y)) for x, y in vertices]
+            except (TypeError, ValueError):
+                raise EditError("add_polygon needs points as [[x, y], ...]", index)
+            if len(vertices) < 3:
+                raise EditError("add_polygon needs at least 3 points", index)
+            polygon = AnnotationPolygon.objects.create(image=image, is_original=False)
+            AnnotationPolygonPoint.objects.bulk_create([
+                AnnotationPolygonPoint(polygon=polygon, x=x, y=y, order_index=i)
+                for i, (x, y) in enumerate(vertices)
+            ])
+            results[index] = {"status": "added", "id": polygon.polygon_id}
+            eggs += 1
+
+        elif kind == "remove_polygon":
+            polygon_id, = ints(op, index, "id")
+            polygon = AnnotationPolygon.objects.filter(image=image, polygon_id=polygon_id, is_deleted=False).first()
+            if polygon is None:
+                results[index] = {"status": "not_found", "id": None}
+                continue
+            if polygon.is_original:
+                polygon.is_deleted = True
+                polygon.save(update_fields=["is_deleted"])
+            else:
+                polygon.delete()
+            results[index] = {"status": "deleted", "id": polygon_id}
+            eggs -= 1
+
+        elif kind == "toggle_grid":
+            x, y = ints(op, index, "x", "y")
+            cols, rows = ints(op, index, "cols", "rows") if "cols" in op else (0, 0)
+            if not grids.in_grid(x, y, cols, rows):
+                raise EditError("toggle_grid needs a cell inside the grid", index)
+            verified = grids.toggle_cell(image.image_id, x, y, cols, rows)
+            results[index] = {"status": "on" if verified else "off", "id": None}
+
+        elif kind == "fill_grid":
+            x1, y1, x2, y2 = ints(op, index, "x1", "y1", "x2", "y2")
+            cols, rows = ints(op, index, "cols", "rows") if "cols" in op else (0, 0)
+            if not (grids.in_grid(x1, y1, cols, rows) and grids.in_grid(x2, y2)):
+                raise EditError("fill_grid needs cells inside the grid", index)
+            changed = grids.fill_cells(image.image_id, x1, y1, x2, y2, bool(op.get("verified", True)), cols, rows)
+            results[index] = {"status": "filled", "id": changed}
+
+    flush_points()
+    return results, eggs
+
+
+
+# Layout of annotations_in_view with ?format=bin, every value a little-endian int32:
+#   header   magic "EGV1", then x1, y1, x2, y2, cell, point_count, rect_count
+#            and the number of rows of each section below
+#   points          x, y
+#   point_clusters  x, y, count
+#   rects           rect_id, x_init, y_init, x_end, y_end
+#   rect_clusters   x, y, count
+# Every section is 4-byte aligned, the editor reads them as Int32Array views of the response
+# (see image_editor/annotationLoader.js).
+VIEW_FORMAT_MAGIC = b"EGV1"
+
+
+def annotations_in_view(request, image_id):
+    """
+    Annotations of the part of an image shown by the editor.
+
+    The editor page no longer carries the annotations of the image, it asks for the box in view
+    whenever the viewer settles (see image_editor/annotationLoader.js). A box holding more than
+    ANNOTATION_VIEW_MAX points (or rects) gets them as clusters, one per cell of
+    ANNOTATION_CLUSTER_PIXELS screen pixels at the given zoom.
+
+    Args:
+        request: GET request with query params:
+            - x1, y1, x2, y2 (int): Box in image pixels, any two opposite corners
+            - zoom (float, optional): Screen pixels per image pixel, defaults to 1
+            - format (str, optional): "bin" for the binary layout of VIEW_FORMAT_MAGIC, JSON otherwise
+        image_id (int): PK of the target ImageDetails record
+
+    Returns:
+        JsonResponse: {
+            "box" (list[int]): The normalized box,
+            "cell" (int): Side of a cluster cell in image pixels,
+            "points" (list[dict]): {"x", "y"} of every point in the box, empty when clustered,
+            "point_clusters" (list[dict]): {"x", "y", "count"}, empty when the points are sent,
+            "rects" (list[dict]): {"rect_id", "x_init", "y_init", "x_end", "y_end"} overlapping the box,
+                                  empty when clustered,
+            "rect_clusters" (list[dict]): Clusters of the rect centers,
+            "point_count" (int): Live points of the whole image,
+            "rect_count" (int): Live rects of the whole image,
+        }
+        HttpResponse: The same content as application/octet-stream with format=bin
+        JsonResponse: {"error": str} with status 400 if the box or zoom is invalid
+        JsonResponse: {"error": "Image not found"} with status 404
+    """
+    try:
+        x1, y1, x2, y2 = normalize_rect(*(int(request.GET[name]) for name in ("x1", "y1", "x2", "y2")))
+        zoom = float(request.GET.get("zoom", 1))
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "x1, y1, x2 and y2 must be integers, zoom a number"}, status=400)
+    if not zoom > 0:
+        return JsonResponse({"error": "zoom must be positive"}, status=400)
+
+    image = ImageDetails.objects.filter(image_id=image_id).first()
+    if image is None:
+        return JsonResponse({"error": "Image not found"}, status=404)
+
+    limit = settings.ANNOTATION_VIEW_MAX
+    cell = max(1, math.ceil(settings.ANNOTATION_CLUSTER_PIXELS / zoom))
+    empty = np.empty((0, 3), dtype="<i4")
+
+    points = points_in_box(image, x1, y1, x2, y2)
+    point_clusters = empty
+    if len(points) > limit:
+        point_clusters = cluster_points(points, cell)
+        points = points[:0]
+
+    rects = rects_in_box(image, x1, y1, x2, y2)
+    rect_clusters = empty
+    if rects[:limit + 1].count() > limit:
+        corners = np.asarray(list(rects.values_list("x_init", "y_init", "x_end", "y_end")), dtype="<i4").reshape(-1, 4)
+        rect_clusters = cluster_points((corners[:, :2] + corners[:, 2:]) // 2, cell)
+        rects = np.empty((0, 5), dtype="<i4")
+    else:
+        rects = np.asarray(list(rects), dtype="<i4").reshape(-1, 5)
+
+    counts = point_summary(ImageDetails.objects.filter(image_id=image_id))[image_id]
+    header = [x1, y1, x2, y2, cell, counts["kept"] + counts["added"],
+              AnnotationRect.objects.filter(image=image, is_deleted=False).count()]
+
+    if request.GET.get("format") == "bin":
+        sections = (points, point_clusters, rects, rect_clusters)
+        header += [len(section) for section in sections]
+        body = VIEW_FORMAT_MAGIC + np.asarray(header, dtype="<i4").tobytes() + b"".join(
+            np.ascontiguousarray(section, dtype="<i4").tobytes() for section in sections
+        )
+        return HttpResponse(body, content_type="application/octet-stream")
+
+    return JsonResponse({
+        "box": header[:4],
+        "cell": cell,
+        "points": [{"x": x, "y": y} for x, y in points.tolist()],
+        "point_clusters": [{"x": x, "y": y, "count": n} for x, y, n in point_clusters.tolist()],
+        "rects": [dict(zip(RECT_VIEW_FIELDS, rect)) for rect in rects.tolist()],
+        "rect_clusters": [{"x": x, "y": y, "count": n} for x, y, n in rect_clusters.tolist()],
+        "point_count": header[5],
+        "rect_count": header[6],
+    })
@@ -0,0 +1,247 @@
+#
+#
+# LIVE EVENTS OF THE PROCESSING
+#
+# process_images and recalibrate_image publish small events (image finished or failed, batch progress)
+# with pg_notify on the "egglytics_events" channel. NOTIFY is delivered on commit to every process
+# that LISTENs, so the process running the job does not have to be the one holding the browser connection.
+# Each server process runs a single listener thread (started with its first subscriber) that hands
+# the events to the open /events/ streams of that process.
+#
+# The stream needs the ASGI server (server/asgi.py). Under WSGI a held connection would take a whole
+# request thread, /events/ answers 204 instead and the view page keeps polling batch_status.
+#
+#
+
+from ._imports import *
+import asyncio
+import select
+import time
+
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection, connections
+from django.http import StreamingHttpResponse
+
+CHANNEL = "egglytics_events"
+
+# Fields of a batch sent by batch_status and by the "batch" event
+BATCH_STATUS_FIELDS = (
+    "id", "total_eggs", "total_images", "is_complete", "has_fail_present",
+    "images_processed", "images_failed", "processing_started",
+)
+
+# Open streams of this process, (event loop, queue, batch_id or None)
+_subscribers = set()
+_subscribers_lock = threading.Lock()
+_listener = None
+
+
+def estimate_remaining_seconds(batch, started, current):
+    """
+    Estimate the time left for a batch from the average time per image so far.
+
+    Args:
+        batch (dict): Batch fields, with total_images, images_processed and is_complete
+        started (datetime | None): BatchDetails.processing_started
+        current (datetime): Time of the estimate
+
+    Returns:
+        int | None: Seconds left, None if the batch is complete or nothing finished yet
+    """
+    processed = batch["images_processed"]
+    if batch["is_complete"] or not started or processed <= 0:
+        return None
+
+    per_image = (current - started).total_seconds() / processed
+    remaining = max(batch["total_images"] - processed, 0)
+    return int(per_image * remaining)
+
+
+def batch_status_row(batch, current):
+    """
+    Turns the BATCH_STATUS_FIELDS of a batch into the dict sent to the browser.
+
+    Args:
+        batch (dict): BATCH_STATUS_FIELDS of the batch, processing_started is removed.
+        current (datetime): Time of the estimate.
+
+    Returns:
+        dict: The batch fields with eta_seconds.
+    """
+    started = batch.pop("processing_started")
+    batch["eta_seconds"] = estimate_remaining_seconds(batch, started, current)
+    return batch
+
+
+def publish(event, **data):
+    """
+    Sends an event to every /events/ stream, of every server process.
+
+    Inside a transaction the event is only delivered if (and when) it commits.
+
+    Args:
+        event (str): Name of the event ("image" or "batch").
+        **data: JSON serializable fields of the event, batch_id is used to filter streams.
+
+    Returns:
+        None
+    """
+    payload = json.dumps({"event": event, **data})
+
+    if connection.vendor != "postgresql":
+        # Without LISTEN/NOTIFY only the streams of this process are reached
+        _dispatch(payload)
+        return
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, payload])
+    except Exception as e:
+        # Events are a convenience, the processing must not fail because of them
+        print("Could not publish event:", e)
+
+
+def publish_batch(batch_id):
+    """
+    Publishes the current status of a batch as a "batch" event.
+
+    Args:
+        batch_id (int): PK of the BatchDetails record.
+
+    Returns:
+        None
+    """
+    batch = BatchDetails.objects.filter(id=batch_id).values(*BATCH_STATUS_FIELDS).first()
+    if batch:
+        publish("batch", batch_id=batch_id, batch=batch_status_row(batch, timezone.now()))
+
+
+def _dispatch(payload):
+    """
+    Hands an event to the streams of this process, from any thread.
+    """
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        return
+
+    with _subscribers_lock:
+        subscribers = list(_subscribers)
+
+    for loop, queue, batch_id in subscribers:
+        if batch_id is not None and data.get("batch_id") != batch_id:
+            continue
+        try:
+            loop.call_soon_threadsafe(_offer, queue, data)
+        except RuntimeError:
+            pass # The loop closed, the stream unsubscribes itself
+
+
+def _offer(queue, data):
+    """
+    Queues an event for a stream, a stream that stopped reading loses it instead of growing.
+    """
+    if not queue.full():
+        queue.put_nowait(data)
+
+
+def _listen():
+    """
+    Listener thread, LISTENs on CHANNEL with its own connection and reconnects when it drops.
+    """
+    while True:
+        conn = None
+        try:
+            db = connections["default"]
+            conn = db.Database.connect(**db.get_connection_params())
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL}")
+
+            while True:
+                # Wakes up now and then to notice a dead connection
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    _dispatch(conn.notifies.pop(0).payload)
+
+        except Exception as e:
+            print("Event listener lost its connection:", e)
+            time.sleep(settings.EVENTS_RECONNECT_SECONDS)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def _start_listener():
+    """
+    Starts the listener thread of this process. Calling it again is a no-op.
+    """
+    global _listener
+    if connection.vendor != "postgresql":
+        return
+    with _subscribers_lock:
+        if _listener is None:
+            _listener = threading.Thread(target=_listen, name="events-listener", daemon=True)
+            _listener.start()
+
+
+async def events(request):
+    """
+    Server-sent events of the processing, for the view page.
+
+    Events (the "data" of each is JSON):
+        image: {"batch_id", "image_id", "ok"} an image finished (ok False if the model failed on it)
+        batch: {"batch_id", "batch"} new status of a batch, "batch" has the fields of batch_status
+
+    Args:
+        request: GET request with optional query param:
+            - batch_id (int): Only stream the events of this batch
+
+    Returns:
+        StreamingHttpResponse: text/event-stream, open until the browser leaves
+        HttpResponse: Status 204 when not served through ASGI, EventSource then stops reconnecting
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    try:
+        batch_id = int(request.GET["batch_id"]) if request.GET.get("batch_id") else None
+    except ValueError:
+        return JsonResponse({"error": "Invalid batch_id"}, status=400)
+
+    response = StreamingHttpResponse(_stream(batch_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no" # Proxies must not hold the events back
+    return response
+
+
+async def _stream(batch_id):
+    """
+    Body of an /events/ stream, a comment is sent when idle so proxies keep the connection open.
+    """
+    _start_listener()
+    subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE), batch_id)
+    with _subscribers_lock:
+        _subscribers.add(subscriber)
+
+    try:
+        yield f"retry: {settings.EVENTS_RECONNECT_SECONDS * 1000}\n\n"
+        while True:
+            try:
+                data = await asyncio.wait_for(subscriber[1].get(), timeout=settings.EVENTS_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            # The same dict goes to every stream of the process, it is read, never changed
+            fields = {key: value for key, value in data.items() if key != "event"}
+            yield f"event: {data['event']}\ndata: {json.dumps(fields)}\n\n"
+    finally:
+        with _subscribers_lock:
+            _subscribers.discard(subscriber)
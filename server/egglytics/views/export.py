@@ -9,6 +9,8 @@
 #
 
 from ._imports import *
+from .annotations import live_points, point_summary
+from . import storage
 
 
 def export(request):
@@ -122,9 +124,8 @@ def export_image_count(request):
         if parsed_to:
             qs = qs.filter(date_uploaded__date__lte=parsed_to)
 
-    total_points = AnnotationPoints.objects.filter(
-        image__in=qs
-    ).count()
+    # Every AnnotationPoints row, packed original points counted as rows (see annotations.point_summary)
+    total_points = sum(counts["rows"] for counts in point_summary(qs).values())
 
     total_rect = AnnotationRect.objects.filter(
         image__in=qs
@@ -173,7 +174,7 @@ def export_dataset(request):
     annotation_id = 1
 
     for image in qs:
-        image_path = os.path.join(settings.MEDIA_ROOT, "uploads", image.file_path)
+        image_path = storage.upload_path(image.file_path)
         if not os.path.exists(image_path):
             continue
 
@@ -182,7 +183,7 @@ def export_dataset(request):
         with Image.open(image_path) as img:
             width, height = img.size
 
-        points = AnnotationPoints.objects.filter(image=image, is_deleted=False)
+        points = live_points(image)
         rects = AnnotationRect.objects.filter(image=image, is_deleted=False)
 
         # ----------------------------
@@ -192,12 +193,12 @@ def export_dataset(request):
             annotation_data = []
 
             # Only include points in custom format
-            for p in points:
+            for x, y in points:
                 annotation_data.append({
                     "label": "Egg",
                     "type": "point",
-                    "x": p.x,
-                    "y": p.y
+                    "x": x,
+                    "y": y
                 })
 
             # Rectangles for all formats
@@ -304,7 +305,8 @@ def export_dataset_csv(request):
     Export a summary CSV of egg and hatch counts per image.
 
     Each row contains the image name, upload date, total egg count
-    (from AnnotationPoints), and total hatched count. The CSV is saved
+    (from AnnotationPoints, packed original points counted as rows, see
+    annotations.point_summary), and total hatched count. The CSV is saved
     to `MEDIA_ROOT/exports/` and a download URL is returned.
 
     Args:
@@ -357,8 +359,9 @@ def export_dataset_csv(request):
         writer = csv.writer(csvfile)
         writer.writerow(["ImageName", "DATE", "total_Eggs", "Total_HATCHED"])
 
+        summary = point_summary(qs)
         for image in qs:
-            total_eggs = AnnotationPoints.objects.filter(image_id=image).count()
+            total_eggs = summary[image.image_id]["rows"]
             writer.writerow([
                 image.image_name,
                 image.date_uploaded.strftime("%Y-%m-%d"),
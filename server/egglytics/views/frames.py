@@ -0,0 +1,193 @@
+#
+#
+# BINARY RESULT FRAMES FOR THE COMPUTE SERVER
+#
+# The binary transport sends the raw image bytes as the request body and receives a frame
+# instead of JSON, so images are never base64 encoded and annotations are packed int32 arrays.
+# This module does not depend on Django so the compute server (and inference_stub.py) can import it.
+#
+# Frame layout (little-endian):
+#   magic             4 bytes    b"EGG1"
+#   header length     uint32
+#   header            JSON       {"status", "egg_count", "points", "rectangles", "polygon_sizes", "image"}
+#   points            int32[points * 2]             x, y
+#   rectangles        int32[rectangles * 4]         x1, y1, x2, y2
+#   polygon vertices  int32[sum(polygon_sizes) * 2] x, y of every polygon, one after the other
+#   final image       bytes[image]
+#
+# Batch requests and responses wrap several parts (raw images or result frames) in one body:
+#   magic             4 bytes    b"EGGB"
+#   count             uint32
+#   parts             count * (uint32 length, bytes[length])
+#
+#
+
+import json
+import struct
+
+import numpy as np
+
+FRAME_MAGIC = b"EGG1"
+BATCH_MAGIC = b"EGGB"
+FRAME_CONTENT_TYPE = "application/x-egglytics-frame"
+
+
+def encode_result_frame(status, egg_count, image_bytes=b"", points=(), rectangles=(), polygons=()):
+    """
+    Packs an inference result into a frame.
+
+    Args:
+        status (str): "complete" or "failed".
+        egg_count (int): Number of eggs found.
+        image_bytes (bytes): Encoded final image (JPEG/PNG), may be empty.
+        points (list[tuple[int, int]] | np.ndarray): [(x1,y1), ...]
+        rectangles (list[list[int]] | np.ndarray): [[x1, y1, x2, y2], ...]
+        polygons (list[list[list[int]]]): [[ [x1,y1], [x2,y2], ... ], ...]
+
+    Returns:
+        bytes: The encoded frame.
+    """
+    points = np.asarray(points, dtype="<i4").reshape(-1, 2)
+    rectangles = np.asarray(rectangles, dtype="<i4").reshape(-1, 4)
+    polygon_sizes = [len(poly) for poly in polygons]
+    vertices = (
+        np.concatenate([np.asarray(poly, dtype="<i4").reshape(-1, 2) for poly in polygons])
+        if polygons else np.empty((0, 2), dtype="<i4")
+    )
+
+    header = json.dumps({
+        "status": status,
+        "egg_count": int(egg_count),
+        "points": len(points),
+        "rectangles": len(rectangles),
+        "polygon_sizes": polygon_sizes,
+        "image": len(image_bytes),
+    }).encode("utf-8")
+
+    return b"".join([
+        FRAME_MAGIC,
+        struct.pack("<I", len(header)),
+        header,
+        points.tobytes(),
+        rectangles.tobytes(),
+        vertices.tobytes(),
+        bytes(image_bytes),
+    ])
+
+
+def decode_result_frame(frame):
+    """
+    Unpacks a frame produced by encode_result_frame.
+
+    Arrays are read in place from the frame (no copy).
+
+    Args:
+        frame (bytes): The response body.
+
+    Returns:
+        dict: {
+            "status" (str),
+            "egg_count" (int),
+            "points" (np.ndarray): shape (n, 2),
+            "rectangles" (np.ndarray): shape (n, 4),
+            "polygons" (list[np.ndarray]): one (k, 2) array per polygon,
+            "image_bytes" (memoryview): The final image, empty if none was sent,
+        }
+
+    Raises:
+        ValueError: If the frame is malformed.
+    """
+    view = memoryview(frame)
+    if bytes(view[:4]) != FRAME_MAGIC:
+        raise ValueError("Not an Egglytics result frame")
+
+    header_length = _read_uint32(view, 4)
+    offset = 8 + header_length
+    header = json.loads(bytes(view[8:offset]))
+    if not isinstance(header, dict) or not {"status", "egg_count", "points", "rectangles", "image"} <= header.keys():
+        raise ValueError("Invalid result frame header")
+
+    def take_int32(count):
+        nonlocal offset
+        array = np.frombuffer(view, dtype="<i4", count=count, offset=offset)
+        offset += count * 4
+        return array
+
+    points = take_int32(header["points"] * 2).reshape(-1, 2)
+    rectangles = take_int32(header["rectangles"] * 4).reshape(-1, 4)
+
+    polygon_sizes = header.get("polygon_sizes", [])
+    vertices = take_int32(sum(polygon_sizes) * 2).reshape(-1, 2)
+    polygons = np.split(vertices, np.cumsum(polygon_sizes)[:-1]) if polygon_sizes else []
+
+    image_bytes = view[offset:offset + header["image"]]
+    if len(image_bytes) != header["image"]:
+        raise ValueError("Truncated result frame")
+
+    return {
+        "status": header["status"],
+        "egg_count": header["egg_count"],
+        "points": points,
+        "rectangles": rectangles,
+        "polygons": polygons,
+        "image_bytes": image_bytes,
+    }
+
+
+def encode_batch_frame(parts):
+    """
+    Wraps several parts (raw images or result frames) in one body.
+
+    Args:
+        parts (list[bytes]): Parts in order.
+
+    Returns:
+        bytes: The encoded batch.
+    """
+    chunks = [BATCH_MAGIC, struct.pack("<I", len(parts))]
+    for part in parts:
+        chunks.append(struct.pack("<I", len(part)))
+        chunks.append(bytes(part))
+    return b"".join(chunks)
+
+
+def decode_batch_frame(body):
+    """
+    Splits a body produced by encode_batch_frame back into its parts (no copy).
+
+    Args:
+        body (bytes): The request or response body.
+
+    Returns:
+        list[memoryview]: Parts in order.
+
+    Raises:
+        ValueError: If the batch is malformed.
+    """
+    view = memoryview(body)
+    if bytes(view[:4]) != BATCH_MAGIC:
+        raise ValueError("Not an Egglytics batch frame")
+
+    count = _read_uint32(view, 4)
+    offset = 8
+    parts = []
+    for _ in range(count):
+        length = _read_uint32(view, offset)
+        offset += 4
+        part = view[offset:offset + length]
+        if len(part) != length:
+            raise ValueError("Truncated batch frame")
+        parts.append(part)
+        offset += length
+    return parts
+
+
+def _read_uint32(view, offset):
+    """
+    Reads a little-endian uint32, raising ValueError (not struct.error) when the data ends before it.
+    """
+    try:
+        (value,) = struct.unpack_from("<I", view, offset)
+    except struct.error as e:
+        raise ValueError("Truncated frame") from e
+    return value
@@ -0,0 +1,205 @@
+#
+#
+# VERIFIED GRID CELLS OF THE EDITOR
+#
+# The editor splits an image into square cells the reviewer marks as verified once checked.
+# They were one VerifiedGrids row per cell, a SELECT and an INSERT or DELETE per click.
+# They are now bits of ImageDetails.grid_bitmap: bit row * grid_cols + col, numbered like
+# Postgres get_bit/set_bit (byte n // 8, bit n % 8 from the least significant one).
+#
+# A toggle is one UPDATE flipping its bit with set_bit. The bitmap only grows (under the row lock of the
+# image) when a cell falls outside grid_cols by grid_rows, in practice once, on the first mark of an image.
+# A range fill locks the image row and writes the bitmap back with all the bits of the range set.
+# Cells and grid sizes sent by the editor are checked with in_grid first: neither side of a grid
+# exceeds GRID_MAX_CELLS, which bounds the bitmap and keeps row * grid_cols within an integer.
+#
+#
+
+from ._imports import *
+from django.db import connection
+
+
+def toggle_cell(image_id, col, row, cols=0, rows=0):
+    """
+    Flips one cell of the grid of an image.
+
+    Args:
+        image_id (int): PK of the ImageDetails record.
+        col (int): Column of the cell.
+        row (int): Row of the cell.
+        cols (int, optional): Columns of the grid of the editor, sizes a new bitmap.
+        rows (int, optional): Rows of the grid of the editor, sizes a new bitmap.
+
+    Returns:
+        bool | None: True if the cell is now verified, None if the image does not exist.
+    """
+    table = ImageDetails._meta.db_table
+    bit = "%(row)s * grid_cols + %(col)s"
+    sql = (
+        f"UPDATE {table} SET grid_bitmap = set_bit(grid_bitmap, {bit}, 1 - get_bit(grid_bitmap, {bit})) "
+        f"WHERE image_id = %(image_id)s AND grid_cols > %(col)s AND grid_rows > %(row)s "
+        f"RETURNING get_bit(grid_bitmap, {bit})"
+    )
+    params = {"image_id": image_id, "col": col, "row": row}
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            result = cursor.fetchone()
+            if result is None:
+                # No bitmap yet or too small for the cell
+                if not _resize_grid(image_id, max(cols, col + 1), max(rows, row + 1)):
+                    return None
+                cursor.execute(sql, params)
+                result = cursor.fetchone()
+
+    return bool(result[0])
+
+
+@transaction.atomic
+def fill_cells(image_id, col1, row1, col2, row2, verified=True, cols=0, rows=0):
+    """
+    Sets every cell of a range of the grid of an image to the same state.
+
+    Args:
+        image_id (int): PK of the ImageDetails record.
+        col1, row1, col2, row2 (int): Opposite corner cells of the range, both included.
+        verified (bool): New state of the cells.
+        cols (int, optional): Columns of the grid of the editor, sizes a new bitmap.
+        rows (int, optional): Rows of the grid of the editor, sizes a new bitmap.
+
+    Returns:
+        int | None: Cells of the range that changed, None if the image does not exist.
+    """
+    col1, col2 = sorted((col1, col2))
+    row1, row2 = sorted((row1, row2))
+
+    image = _lock_grid(image_id)
+    if image is None:
+        return None
+
+    cells = grid_cells(image["grid_bitmap"], image["grid_cols"], image["grid_rows"])
+    cells = _grow(cells, max(cols, col2 + 1), max(rows, row2 + 1))
+
+    area = cells[row1:row2 + 1, col1:col2 + 1]
+    changed = int(np.count_nonzero(area != verified))
+    area[:] = verified
+
+    _store_grid(image_id, cells)
+    return changed
+
+
+def in_grid(col, row, cols=0, rows=0):
+    """
+    Whether a cell and a grid size sent by the editor are within GRID_MAX_CELLS.
+
+    Args:
+        col (int): Column of the cell.
+        row (int): Row of the cell.
+        cols (int, optional): Columns of the grid of the editor.
+        rows (int, optional): Rows of the grid of the editor.
+
+    Returns:
+        bool: True if toggle_cell or fill_cells may be called with them.
+    """
+    limit = settings.GRID_MAX_CELLS
+    return 0 <= col < limit and 0 <= row < limit and 0 <= cols <= limit and 0 <= rows <= limit
+
+
+def grid_cells(bitmap, cols, rows):
+    """
+    Unpacks a grid bitmap.
+
+    Args:
+        bitmap (bytes | memoryview | None): ImageDetails.grid_bitmap
+        cols (int): ImageDetails.grid_cols
+        rows (int): ImageDetails.grid_rows
+
+    Returns:
+        np.ndarray: Booleans of shape (rows, cols), True for the verified cells.
+    """
+    if not bitmap or not cols or not rows:
+        return np.zeros((rows, cols), dtype=bool)
+    bits = np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8), bitorder="little")
+    return bits[:rows * cols].reshape(rows, cols).astype(bool)
+
+
+def pack_cells(cells):
+    """
+    Reverses grid_cells.
+
+    Args:
+        cells (np.ndarray): Booleans of shape (rows, cols).
+
+    Returns:
+        bytes: (rows * cols + 7) // 8 bytes.
+    """
+    return np.packbits(cells.reshape(-1), bitorder="little").tobytes()
+
+
+def grid_state(image):
+    """
+    Grid of an image as sent to the editor.
+
+    Args:
+        image (ImageDetails): The image.
+
+    Returns:
+        dict: {"cols", "rows", "bitmap"} with the bitmap base64 encoded ("" when nothing is verified).
+    """
+    bitmap = bytes(image.grid_bitmap) if image.grid_bitmap else b""
+    return {
+        "cols": image.grid_cols,
+        "rows": image.grid_rows,
+        "bitmap": base64.b64encode(bitmap).decode("ascii"),
+    }
+
+
+def _lock_grid(image_id):
+    """
+    Locks the row of an image and reads its grid, inside a transaction.
+    """
+    return (
+        ImageDetails.objects
+        .select_for_update()
+        .filter(image_id=image_id)
+        .values("grid_bitmap", "grid_cols", "grid_rows")
+        .first()
+    )
+
+
+def _resize_grid(image_id, cols, rows):
+    """
+    Grows the bitmap of an image to at least cols by rows, keeping its cells. Returns False if there is no such image.
+    """
+    image = _lock_grid(image_id)
+    if image is None:
+        return False
+
+    cells = grid_cells(image["grid_bitmap"], image["grid_cols"], image["grid_rows"])
+    grown = _grow(cells, cols, rows)
+    if grown is not cells or image["grid_bitmap"] is None:
+        _store_grid(image_id, grown)
+    return True
+
+
+def _grow(cells, cols, rows):
+    """
+    The cells of a grid in a grid of at least cols by rows, cells is returned as is if it is large enough.
+    """
+    old_rows, old_cols = cells.shape
+    if old_cols >= cols and old_rows >= rows:
+        return cells
+    grown = np.zeros((max(rows, old_rows), max(cols, old_cols)), dtype=bool)
+    grown[:old_rows, :old_cols] = cells
+    return grown
+
+
+def _store_grid(image_id, cells):
+    """
+    Writes the cells of a grid to its image.
+    """
+    rows, cols = cells.shape
+    ImageDetails.objects.filter(image_id=image_id).update(
+        grid_bitmap=pack_cells(cells), grid_cols=cols, grid_rows=rows
+    )
@@ -0,0 +1,625 @@
+#
+#
+# STORING PROCESSED IMAGES
+#
+# The compute server returns the final image of every inference. When it already is a JPEG of an
+# acceptable quality its bytes are written to disk as they are. Otherwise it is re-encoded, which
+# for 100-megapixel micro images is the most CPU heavy part of ingest, so it runs in a process pool
+# instead of the GIL-bound threads of process_images.
+#
+# Huge images also get a Deep Zoom (DZI) tile pyramid, so the editor only downloads the tiles in view:
+#   <base>_tiles/v<image_version>/image.dzi
+#   <base>_tiles/v<image_version>/image_files/<level>/<col>_<row>.jpg
+#   <base>_tiles/v<image_version>/manifest.json    hash of the pixels of every tile
+# A new version of the image (recalibration) reuses the tiles whose pixels did not change as hard links.
+#
+# Every version of an image also gets a low quality preview the editor shows while the full image loads:
+#   <base>_preview_v<image_version>.jpg
+#
+# Thumbnails are cached on disk (one file per image, size and version) and evicted least recently used
+# first once the cache grows over its size limit.
+#
+# This module does not depend on Django, the functions run in the pool need nothing from the project.
+# The pool still uses "spawn", which re-imports the main script in every worker (as __mp_main__):
+# under run_waitress.py that loads Django once per worker when the pool starts, its __main__ guard
+# keeps the workers from serving or starting job workers.
+#
+#
+
+import glob
+import hashlib
+import json
+import math
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from multiprocessing import get_context
+
+from PIL import Image
+
+# Disable the DecompressionBombError, micro images are very large
+Image.MAX_IMAGE_PIXELS = None
+
+# Standard luminance quantization table (quality 50) of the JPEG specification, in zigzag order like Pillow's
+_STD_LUMINANCE = [
+    16, 11, 12, 14, 12, 10, 16, 14, 13, 14, 18, 17, 16, 19, 24, 40,
+    26, 24, 22, 22, 24, 49, 35, 37, 29, 40, 58, 51, 61, 60, 57, 51,
+    56, 55, 64, 72, 92, 78, 64, 68, 87, 69, 55, 56, 80, 109, 81, 87,
+    95, 98, 103, 104, 103, 62, 77, 113, 121, 112, 100, 120, 92, 101, 103, 99,
+]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Approximate size of the thumbnail cache of this process, None until the folder was scanned
+_cache_bytes = None
+_cache_lock = threading.Lock()
+
+
+def estimate_jpeg_quality(image):
+    """
+    Estimates the libjpeg quality setting a JPEG was saved with, from its luminance table.
+
+    Args:
+        image (PIL.Image.Image): JPEG opened with Image.open (pixels are not decoded).
+
+    Returns:
+        int | None: Quality between 1 and 100, None if the image has no quantization table.
+    """
+    tables = getattr(image, "quantization", None)
+    if not tables or 0 not in tables:
+        return None
+
+    scale = sum(tables[0]) * 100 / sum(_STD_LUMINANCE)
+    quality = (200 - scale) / 2 if scale <= 100 else 5000 / scale
+    return max(1, min(100, round(quality)))
+
+
+def is_storable_jpeg(data, max_quality):
+    """
+    Whether image bytes can be written to disk without re-encoding.
+
+    Only the header is parsed, the pixels are never decoded.
+
+    Args:
+        data (bytes | memoryview): Encoded image.
+        max_quality (int): Highest accepted JPEG quality, better ones are re-encoded to save disk space.
+
+    Returns:
+        bool: True for an RGB or grayscale JPEG of at most max_quality.
+    """
+    if bytes(data[:3]) != b"\xff\xd8\xff":
+        return False
+
+    try:
+        with Image.open(BytesIO(data)) as image:
+            if image.format != "JPEG" or image.mode not in ("RGB", "L"):
+                return False
+            quality = estimate_jpeg_quality(image)
+    except Exception:
+        return False
+
+    return quality is not None and quality <= max_quality
+
+
+def write_image_file(data, file_path):
+    """
+    Writes encoded image bytes to a file, replacing it only once fully written.
+
+    Args:
+        data (bytes | memoryview): Encoded image.
+        file_path (str): Destination.
+    """
+    temp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, file_path)
+
+
+def encode_jpeg_file(data, file_path, quality, optimize, progressive):
+    """
+    Decodes an image and writes it as JPEG. Runs inside the pool workers (see save_image).
+
+    Args:
+        data (bytes): Encoded image (any format Pillow reads).
+        file_path (str): Destination.
+        quality (int): JPEG quality.
+        optimize (bool): Optimize the Huffman tables.
+        progressive (bool): Write a progressive JPEG.
+
+    Returns:
+        tuple[int, int]: Resolution of the image.
+    """
+    with Image.open(BytesIO(data)) as image:
+        # Convert to RGB if needed (PNG with alpha → JPEG compatible)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        buffer = BytesIO()
+        image.save(
+            buffer,
+            format="JPEG",
+            quality=quality,
+            optimize=optimize,
+            progressive=progressive
+        )
+        write_image_file(buffer.getbuffer(), file_path)
+        return image.size
+
+
+def get_pool(processes):
+    """
+    Returns the process pool shared by every re-encode and tile build of this process.
+
+    Workers are spawned instead of forked, forking a process that runs threads is not safe.
+
+    Args:
+        processes (int): Number of worker processes.
+
+    Returns:
+        ProcessPoolExecutor
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=processes, mp_context=get_context("spawn"))
+        return _pool
+
+
+def run_in_pool(processes, fn, *args):
+    """
+    Runs fn(*args) in the process pool and waits for its result.
+
+    A pool whose worker died (e.g. killed for using too much memory) cannot be used again,
+    it is dropped so the next call starts a new one.
+
+    Args:
+        processes (int): Size of the pool, 0 runs fn in the calling thread.
+        fn (callable): Module level function of this module.
+        *args: Picklable arguments.
+
+    Returns:
+        The return value of fn.
+    """
+    global _pool
+    if processes <= 0:
+        return fn(*args)
+
+    pool = get_pool(processes)
+    try:
+        return pool.submit(fn, *args).result()
+    except BrokenProcessPool:
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        raise
+
+
+def save_image(data, file_path, quality=70, optimize=True, progressive=True, max_stored_quality=90, processes=2):
+    """
+    Stores a final image, as it is when possible, re-encoded otherwise.
+
+    Args:
+        data (bytes | memoryview): Encoded image returned by the compute server.
+        file_path (str): Destination.
+        quality (int): JPEG quality of re-encoded images.
+        optimize (bool): Optimize the Huffman tables of re-encoded images.
+        progressive (bool): Write re-encoded images as progressive JPEGs.
+        max_stored_quality (int): JPEGs up to this quality are stored without re-encoding
+                                  (0 always re-encodes).
+        processes (int): Size of the process pool, 0 re-encodes in the calling thread.
+
+    Returns:
+        bool: True if the bytes were stored as they are.
+    """
+    if max_stored_quality > 0 and is_storable_jpeg(data, max_stored_quality):
+        write_image_file(data, file_path)
+        return True
+
+    size = run_in_pool(processes, encode_jpeg_file, bytes(data), file_path, quality, optimize, progressive)
+
+    print("Resolution:", size)
+    return False
+
+
+def tiles_dir(image_path):
+    """
+    Folder holding every tile pyramid version of an image.
+
+    Args:
+        image_path (str): Path of the stored image.
+
+    Returns:
+        str: <base>_tiles next to the image.
+    """
+    base, _ = os.path.splitext(image_path)
+    return f"{base}_tiles"
+
+
+def tile_version_dir(image_path, version):
+    """
+    Folder of the tile pyramid of one version of an image.
+
+    Args:
+        image_path (str): Path of the stored image.
+        version (int): ImageDetails.image_version
+
+    Returns:
+        str: <base>_tiles/v<version>
+    """
+    return os.path.join(tiles_dir(image_path), f"v{version}")
+
+
+def build_tile_pyramid(image_path, version, tile_size=254, overlap=1, quality=70, previous_image_path=None):
+    """
+    Writes the DZI tile pyramid of an image version. Runs inside the pool workers (see build_tiles).
+
+    Tiles of the newest older version whose pixels are identical are hard linked instead of encoded.
+    The pyramid is built in a temporary folder and renamed once complete, older versions are removed.
+
+    Args:
+        image_path (str): Path of the stored image.
+        version (int): ImageDetails.image_version the pyramid belongs to.
+        tile_size (int): Tile width and height without overlap.
+        overlap (int): Pixels shared by neighbouring tiles.
+        quality (int): JPEG quality of the tiles.
+        previous_image_path (str, optional): Image the older versions belong to, when the new
+                                             version was written to another file.
+
+    Returns:
+        dict: {"tiles": int, "reused": int} number of tiles written and linked.
+    """
+    root = tiles_dir(image_path)
+    target = tile_version_dir(image_path, version)
+    os.makedirs(root, exist_ok=True)
+
+    # Previous version to link unchanged tiles from
+    previous = None
+    previous_root = tiles_dir(previous_image_path or image_path)
+    if os.path.isdir(previous_root):
+        versions = sorted(
+            (int(name[1:]) for name in os.listdir(previous_root) if name.startswith("v") and name[1:].isdigit()),
+            reverse=True
+        )
+        for older in versions:
+            if older != version and os.path.exists(os.path.join(previous_root, f"v{older}", "manifest.json")):
+                previous = os.path.join(previous_root, f"v{older}")
+                break
+
+    previous_manifest = {}
+    if previous:
+        with open(os.path.join(previous, "manifest.json")) as f:
+            previous_manifest = json.load(f)
+
+    building = os.path.join(root, f".v{version}.{uuid.uuid4().hex}")
+    manifest = {}
+    written = 0
+    reused = 0
+
+    try:
+        with Image.open(image_path) as image:
+            level_image = image.convert("RGB") if image.mode not in ("RGB", "L") else image.copy()
+
+        width, height = level_image.size
+        max_level = math.ceil(math.log2(max(width, height, 1)))
+
+        for level in range(max_level, -1, -1):
+            scale = 2 ** (max_level - level)
+            level_size = (max(1, math.ceil(width / scale)), max(1, math.ceil(height / scale)))
+            if level_image.size != level_size:
+                # Every level is halved from the one above it
+                level_image = level_image.resize(level_size, Image.BILINEAR)
+
+            level_dir = os.path.join(building, "image_files", str(level))
+            os.makedirs(level_dir)
+
+            columns = math.ceil(level_size[0] / tile_size)
+            rows = math.ceil(level_size[1] / tile_size)
+            for col in range(columns):
+                for row in range(rows):
+                    box = (
+                        max(col * tile_size - overlap, 0),
+                        max(row * tile_size - overlap, 0),
+                        min((col + 1) * tile_size + overlap, level_size[0]),
+                        min((row + 1) * tile_size + overlap, level_size[1]),
+                    )
+                    tile = level_image.crop(box)
+                    key = f"{level}/{col}_{row}"
+                    digest = hashlib.blake2b(tile.tobytes(), digest_size=16).hexdigest()
+                    manifest[key] = digest
+
+                    tile_path = os.path.join(level_dir, f"{col}_{row}.jpg")
+                    if previous_manifest.get(key) == digest:
+                        try:
+                            os.link(os.path.join(previous, "image_files", str(level), f"{col}_{row}.jpg"), tile_path)
+                            reused += 1
+                            continue
+                        except OSError:
+                            pass # Missing tile or no hard links on this file system, encode it
+
+                    tile.save(tile_path, format="JPEG", quality=quality)
+                    written += 1
+
+        with open(os.path.join(building, "image.dzi"), "w") as f:
+            f.write(
+                '<?xml version="1.0" encoding="UTF-8"?>'
+                f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{tile_size}" '
+                f'Overlap="{overlap}" Format="jpg"><Size Width="{width}" Height="{height}"/></Image>'
+            )
+        with open(os.path.join(building, "manifest.json"), "w") as f:
+            json.dump(manifest, f)
+
+        if os.path.exists(target):
+            shutil.rmtree(target)
+        os.rename(building, target)
+
+    finally:
+        if os.path.exists(building):
+            shutil.rmtree(building, ignore_errors=True)
+
+    # Only the current version is served
+    for name in os.listdir(root):
+        if name != f"v{version}" and not name.startswith("."):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+    return {"tiles": written, "reused": reused}
+
+
+def build_tiles(image_path, version, tile_size=254, overlap=1, quality=70, previous_image_path=None, processes=2):
+    """
+    Builds the tile pyramid of an image version in the process pool (see build_tile_pyramid).
+
+    Args:
+        image_path (str): Path of the stored image.
+        version (int): ImageDetails.image_version
+        tile_size (int): Tile width and height without overlap.
+        overlap (int): Pixels shared by neighbouring tiles.
+        quality (int): JPEG quality of the tiles.
+        previous_image_path (str, optional): See build_tile_pyramid.
+        processes (int): Size of the process pool, 0 builds in the calling thread.
+
+    Returns:
+        dict: {"tiles": int, "reused": int}
+    """
+    return run_in_pool(
+        processes, build_tile_pyramid, image_path, version, tile_size, overlap, quality, previous_image_path
+    )
+
+
+def preview_path(image_path, version):
+    """
+    Preview of one version of an image.
+
+    Args:
+        image_path (str): Path of the stored image.
+        version (int): ImageDetails.image_version
+
+    Returns:
+        str: <base>_preview_v<version>.jpg next to the image.
+    """
+    base, _ = os.path.splitext(image_path)
+    return f"{base}_preview_v{version}.jpg"
+
+
+def encode_preview(image_path, version, quality=20):
+    """
+    Writes the preview of an image version and removes the previews of other versions.
+    Runs inside the pool workers (see build_preview).
+
+    Args:
+        image_path (str): Path of the stored image.
+        version (int): ImageDetails.image_version
+        quality (int): JPEG quality of the preview.
+
+    Returns:
+        int: Size of the preview in bytes.
+    """
+    destination = preview_path(image_path, version)
+
+    with Image.open(image_path) as image:
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+        write_image_file(buffer.getbuffer(), destination)
+
+    for path in preview_files(image_path):
+        if path != destination:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    return os.path.getsize(destination)
+
+
+def build_preview(image_path, version, quality=20, processes=2):
+    """
+    Builds the preview of an image version in the process pool (see encode_preview).
+
+    Args:
+        image_path (str): Path of the stored image.
+        version (int): ImageDetails.image_version
+        quality (int): JPEG quality of the preview.
+        processes (int): Size of the process pool, 0 builds in the calling thread.
+
+    Returns:
+        int: Size of the preview in bytes.
+    """
+    return run_in_pool(processes, encode_preview, image_path, version, quality)
+
+
+def preview_files(image_path):
+    """
+    Every preview of an image, including the unversioned <base>_preview<ext> of older releases.
+
+    Args:
+        image_path (str): Path of the stored image.
+
+    Returns:
+        list[str]: Existing preview files.
+    """
+    base, ext = os.path.splitext(image_path)
+    paths = glob.glob(f"{glob.escape(base)}_preview_v*.jpg")
+    if os.path.exists(f"{base}_preview{ext}"):
+        paths.append(f"{base}_preview{ext}")
+    return paths
+
+
+def image_pixels(image_path):
+    """
+    Number of pixels of an image, read from its header only.
+
+    Args:
+        image_path (str): Path of the image.
+
+    Returns:
+        int: width * height
+    """
+    with Image.open(image_path) as image:
+        width, height = image.size
+    return width * height
+
+
+def thumbnail_cache_path(cache_dir, image_path, width, height, version):
+    """
+    File of a cached thumbnail.
+
+    Args:
+        cache_dir (str): Folder of the thumbnail cache.
+        image_path (str): Path of the image relative to the uploads folder.
+        width (int): Requested width.
+        height (int): Requested height.
+        version (int): ImageDetails.image_version, a new version never hits an old thumbnail.
+
+    Returns:
+        str: <cache_dir>/<ab>/<hash>.jpg
+    """
+    key = hashlib.sha1(f"{image_path}|{width}|{height}|{version}".encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, key[:2], f"{key}.jpg")
+
+
+def render_thumbnail(source_path, width, height, quality=80):
+    """
+    Encodes a thumbnail fitting in width x height (aspect ratio kept).
+
+    JPEGs are decoded at a reduced scale (draft) close to the requested size, so the
+    full resolution is never decoded.
+
+    Args:
+        source_path (str): Path of the image.
+        width (int): Max width.
+        height (int): Max height.
+        quality (int): JPEG quality of the thumbnail.
+
+    Returns:
+        bytes: The thumbnail as JPEG.
+    """
+    with Image.open(source_path) as image:
+        if image.format == "JPEG":
+            image.draft("RGB", (width, height))
+        image.thumbnail((width, height), Image.LANCZOS)
+
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+        return buffer.getvalue()
+
+
+def read_cached(cache_path):
+    """
+    Reads a cached file and marks it as recently used.
+
+    Args:
+        cache_path (str): File in the cache.
+
+    Returns:
+        bytes | None: The content, None on a cache miss.
+    """
+    try:
+        with open(cache_path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    # The modification time is the LRU clock (access times are often disabled)
+    try:
+        os.utime(cache_path)
+    except OSError:
+        pass
+    return data
+
+
+def store_cached(cache_dir, cache_path, data, max_bytes):
+    """
+    Adds a file to the cache, evicting the least recently used files if it gets too large.
+
+    Args:
+        cache_dir (str): Folder of the cache.
+        cache_path (str): File to write.
+        data (bytes): Content.
+        max_bytes (int): Size limit of the cache.
+    """
+    global _cache_bytes
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    write_image_file(data, cache_path)
+
+    with _cache_lock:
+        if _cache_bytes is None:
+            _cache_bytes = _cache_size(cache_dir)
+        else:
+            _cache_bytes += len(data)
+
+        if _cache_bytes > max_bytes:
+            _cache_bytes = evict_lru(cache_dir, int(max_bytes * 0.9))
+
+
+def evict_lru(cache_dir, target_bytes):
+    """
+    Deletes the least recently used files of a cache until it is at most target_bytes.
+
+    Args:
+        cache_dir (str): Folder of the cache.
+        target_bytes (int): Size to get down to.
+
+    Returns:
+        int: Size of the cache afterwards.
+    """
+    entries = []
+    for folder, _, files in os.walk(cache_dir):
+        for name in files:
+            path = os.path.join(folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= target_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+    return total
+
+
+def _cache_size(cache_dir):
+    total = 0
+    for folder, _, files in os.walk(cache_dir):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(folder, name))
+            except OSError:
+                pass
+    return total
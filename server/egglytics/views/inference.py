@@ -0,0 +1,330 @@
+#
+#
+# COMMUNICATION WITH THE COMPUTE (INFERENCE) SERVER
+#
+# Every request to the compute server goes through one shared requests.Session so
+# connections to the server are kept alive and reused instead of opening a new TCP
+# connection per image. The pool is sized from INFERENCE_WORKERS so parallel requests
+# made by process_images never wait for a free connection.
+#
+# Models with a batch route receive up to INFERENCE_BATCH_SIZE images of the same mode per
+# request (see infer_batch) so the compute server can run them through the model together.
+#
+#
+
+from ._imports import *
+from requests.adapters import HTTPAdapter
+
+from .frames import FRAME_CONTENT_TYPE, decode_result_frame, encode_batch_frame, decode_batch_frame
+
+
+_session = None
+_session_lock = threading.Lock()
+
+# One semaphore per model, caps the requests in flight for that model across the whole process
+_model_slots = {}
+_model_slots_lock = threading.Lock()
+
+# Batch routes the compute server answered with 404, they are not tried again by this process
+_missing_batch_routes = set()
+
+
+def get_session():
+    """
+    Returns the keep-alive session shared by every inference request of this process.
+
+    Returns:
+        requests.Session: Session with a connection pool as large as the sum of INFERENCE_WORKERS.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = max(sum(settings.INFERENCE_WORKERS.values()), 1)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def workers_for(model):
+    """
+    Number of images of a model that may be sent to the compute server at the same time.
+
+    Args:
+        model (str): Model name (the "value" in ModelConfig.js).
+
+    Returns:
+        int: INFERENCE_WORKERS[model], or INFERENCE_WORKERS["default"] if the model is not listed.
+    """
+    workers = settings.INFERENCE_WORKERS.get(model, settings.INFERENCE_WORKERS.get("default", 1))
+    return max(int(workers), 1)
+
+
+def model_slot(model):
+    """
+    Semaphore limiting the concurrent requests for a model (see workers_for).
+
+    Args:
+        model (str): Model name.
+
+    Returns:
+        threading.BoundedSemaphore: Use it as a context manager around the request.
+    """
+    with _model_slots_lock:
+        if model not in _model_slots:
+            _model_slots[model] = threading.BoundedSemaphore(workers_for(model))
+        return _model_slots[model]
+
+
+def post_json(method, payload, timeout=300):
+    """
+    Sends a JSON payload to a method of the compute server.
+
+    Args:
+        method (str): Route on the compute server (e.g. "upload_base64").
+        payload (dict): JSON body.
+        timeout (int): Seconds before the request is abandoned.
+
+    Returns:
+        tuple[int, dict]: HTTP status code and decoded JSON response.
+    """
+    response = get_session().post(
+        f"{settings.INFERENCE_URL}/{method}",
+        json=payload,
+        timeout=timeout
+    )
+    return response.status_code, response.json()
+
+
+def post_binary(method, image_path, params, timeout=300):
+    """
+    Sends an image file to a method of the compute server using the binary transport.
+
+    The file is streamed from disk as the request body, the other arguments go in the query string.
+
+    Args:
+        method (str): Route on the compute server (e.g. "upload_binary").
+        image_path (str): Absolute path of the image to send.
+        params (dict): Extra arguments (e.g. {"mode": "micro"}).
+        timeout (int): Seconds before the request is abandoned.
+
+    Returns:
+        tuple[int, dict | None]: HTTP status code and the decoded frame (see decode_result_frame),
+                                 None if the server did not answer with a frame.
+    """
+    with open(image_path, "rb") as f:
+        response = get_session().post(
+            f"{settings.INFERENCE_URL}/{method}",
+            data=f,
+            params=params,
+            headers={"Content-Type": "application/octet-stream", "Accept": FRAME_CONTENT_TYPE},
+            timeout=timeout
+        )
+
+    if not response.headers.get("Content-Type", "").startswith(FRAME_CONTENT_TYPE):
+        return response.status_code, None
+    return response.status_code, decode_result_frame(response.content)
+
+
+def infer(json_method, binary_method, image_path, params):
+    """
+    Runs inference on an image file with the configured transport.
+
+    The binary transport is used when INFERENCE_TRANSPORT is "binary" and the model has a
+    binary method, otherwise the image is sent as base64 JSON to json_method.
+
+    Args:
+        json_method (str): Route accepting {"image": base64, **params}.
+        binary_method (str | None): Route accepting the raw image (None if the model has none).
+        image_path (str): Absolute path of the image to send.
+        params (dict): Extra arguments sent with the image (e.g. {"mode": "micro"}).
+
+    Returns:
+        tuple[int, dict | None]: HTTP status code and the result (see parse_json_result),
+                                 None if the response could not be read.
+    """
+    if settings.INFERENCE_TRANSPORT == "binary" and binary_method:
+        status_code, frame = post_binary(binary_method, image_path, params)
+        if frame is None:
+            return status_code, None
+        return status_code, parse_frame_result(frame)
+
+    with open(image_path, "rb") as f:
+        encoded = base64.b64encode(f.read()).decode("utf-8")
+
+    status_code, data = post_json(json_method, {"image": encoded, **params})
+    return status_code, parse_json_result(data)
+
+
+def batch_available(json_method, binary_method):
+    """
+    Whether the batch route used by infer_batch exists on the compute server.
+
+    Args:
+        json_method (str): Batch route of the JSON transport.
+        binary_method (str | None): Batch route of the binary transport.
+
+    Returns:
+        bool: False if batching is disabled (INFERENCE_BATCH_SIZE <= 1) or the route answered 404 before.
+    """
+    if settings.INFERENCE_BATCH_SIZE <= 1:
+        return False
+    return _batch_method(json_method, binary_method) not in _missing_batch_routes
+
+
+def _batch_method(json_method, binary_method):
+    if settings.INFERENCE_TRANSPORT == "binary" and binary_method:
+        return binary_method
+    return json_method
+
+
+def infer_batch(json_method, binary_method, image_paths, params, timeout=600):
+    """
+    Runs inference on several image files in a single request.
+
+    JSON transport: {"images": [base64, ...], **params} -> {"results": [result, ...]}
+    Binary transport: batch frame of raw images (params in the query string) -> batch frame of result frames.
+    Results are matched to the images by position.
+
+    Args:
+        json_method (str): Batch route of the JSON transport (e.g. "upload_batch_base64").
+        binary_method (str | None): Batch route of the binary transport (e.g. "upload_batch_binary").
+        image_paths (list[str]): Absolute paths of the images to send.
+        params (dict): Extra arguments shared by every image (e.g. {"mode": "micro"}).
+        timeout (int): Seconds before the request is abandoned.
+
+    Returns:
+        tuple[int, list[dict | None] | None]: HTTP status code and one result per image (see parse_json_result),
+                                              an entry is None if the server sent nothing usable for that image.
+                                              The list is None if the response could not be read or
+                                              does not hold one result per image.
+    """
+    method = _batch_method(json_method, binary_method)
+
+    if method == binary_method:
+        parts = []
+        for image_path in image_paths:
+            with open(image_path, "rb") as f:
+                parts.append(f.read())
+
+        response = get_session().post(
+            f"{settings.INFERENCE_URL}/{method}",
+            data=encode_batch_frame(parts),
+            params=params,
+            headers={"Content-Type": "application/octet-stream", "Accept": FRAME_CONTENT_TYPE},
+            timeout=timeout
+        )
+        del parts
+
+        if response.status_code == 404:
+            _missing_batch_routes.add(method)
+        if not response.headers.get("Content-Type", "").startswith(FRAME_CONTENT_TYPE):
+            return response.status_code, None
+
+        results = []
+        for part in decode_batch_frame(response.content):
+            try:
+                results.append(parse_frame_result(decode_result_frame(part)))
+            except ValueError:
+                results.append(None)
+
+    else:
+        images = []
+        for image_path in image_paths:
+            with open(image_path, "rb") as f:
+                images.append(base64.b64encode(f.read()).decode("utf-8"))
+
+        response = get_session().post(
+            f"{settings.INFERENCE_URL}/{method}",
+            json={"images": images, **params},
+            timeout=timeout
+        )
+        del images
+
+        if response.status_code == 404:
+            _missing_batch_routes.add(method)
+        if response.status_code != 200:
+            return response.status_code, None
+
+        results = [
+            parse_json_result(data) if isinstance(data, dict) else None
+            for data in response.json().get("results", [])
+        ]
+
+    if len(results) != len(image_paths):
+        print(f"Batch route {method} returned {len(results)} results for {len(image_paths)} images")
+        return response.status_code, None
+    return response.status_code, results
+
+
+def parse_frame_result(frame):
+    """
+    Converts a decoded result frame to the result format of infer.
+
+    Args:
+        frame (dict): Output of decode_result_frame.
+
+    Returns:
+        dict: {"status", "egg_count", "points", "rectangles", "polygons", "image_bytes"}
+    """
+    return {
+        "status": frame["status"],
+        "egg_count": frame["egg_count"],
+        "points": frame["points"].tolist(),
+        "rectangles": frame["rectangles"].tolist(),
+        "polygons": [poly.tolist() for poly in frame["polygons"]],
+        "image_bytes": frame["image_bytes"],
+    }
+
+
+def parse_json_result(data):
+    """
+    Converts a JSON response of the compute server to the result format of infer.
+
+    Args:
+        data (dict): Response with status, egg_count, final_image (base64) and points/rectangles/polygons.
+
+    Returns:
+        dict: {"status", "egg_count", "points", "rectangles", "polygons", "image_bytes"}
+              where image_bytes is the decoded final_image (empty if none was sent).
+    """
+    image_b64 = data.get("final_image") or ""
+
+    # Remove header if present
+    if "," in image_b64:
+        image_b64 = image_b64.split(",")[1]
+
+    return {
+        "status": data.get("status"),
+        "egg_count": data.get("egg_count", 0),
+        "points": data.get("points", []),
+        "rectangles": data.get("rectangles", []),
+        "polygons": data.get("polygons", []),
+        "image_bytes": base64.b64decode(image_b64),
+    }
+
+
+def fallback_result(image_path):
+    """
+    Result used when the model fails or is not called, keeps the uploaded image without annotations.
+
+    Args:
+        image_path (str): Absolute path of the image.
+
+    Returns:
+        dict: Result in the format of infer.
+    """
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+
+    return {
+        "status": "complete",
+        "egg_count": 0,
+        "points": [],
+        "rectangles": [],
+        "polygons": [],
+        "image_bytes": image_bytes,
+    }
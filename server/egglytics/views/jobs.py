@@ -0,0 +1,311 @@
+#
+#
+# BACKGROUND PROCESSING QUEUE
+#
+# Uploads and recalibrations are stored as ProcessingJob rows instead of being thrown to a bare thread.
+# Every server process runs a small pool of worker threads that claim jobs with
+# SELECT ... FOR UPDATE SKIP LOCKED, so several processes can share the same queue without
+# taking the same job twice. A job that was running when its process died is claimed again
+# once its lease runs out, failed jobs are retried with an exponential backoff.
+#
+#
+
+from ._imports import *
+from . import events
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.db import close_old_connections, connection
+from django.db.models import Q
+
+
+# Worker threads started in this process (see start_workers)
+_workers = []
+_workers_lock = threading.Lock()
+
+# Jobs currently held by this process, their lease is refreshed by the heartbeat thread
+_held_jobs = set()
+_held_jobs_lock = threading.Lock()
+
+
+def enqueue_job(kind, payload, max_attempts=None):
+    """
+    Stores a new job in the queue and makes sure this process has workers to run it.
+
+    Args:
+        kind (str): One of ProcessingJob.KIND_CHOICES (e.g. "PROCESS_BATCH").
+        payload (dict): JSON serializable arguments of the job handler.
+        max_attempts (int, optional): Overrides PROCESSING_JOB_MAX_ATTEMPTS.
+
+    Returns:
+        ProcessingJob: The created job.
+    """
+    job = ProcessingJob.objects.create(
+        kind=kind,
+        payload=payload,
+        max_attempts=max_attempts or settings.PROCESSING_JOB_MAX_ATTEMPTS,
+    )
+    start_workers()
+    return job
+
+
+def start_workers():
+    """
+    Starts the worker pool of this process. Calling it again is a no-op.
+
+    Starts PROCESSING_WORKERS worker threads and a single heartbeat thread. Threads are
+    daemons, when the server stops the jobs they held are picked up again after their lease.
+
+    Returns:
+        None
+    """
+    with _workers_lock:
+        if _workers:
+            return
+
+        for i in range(settings.PROCESSING_WORKERS):
+            name = f"{socket.gethostname()}:{os.getpid()}:{i}"
+            t = threading.Thread(target=_worker_loop, args=(name,), name=f"egglytics-worker-{i}", daemon=True)
+            t.start()
+            _workers.append(t)
+
+        heartbeat = threading.Thread(target=_heartbeat_loop, name="egglytics-heartbeat", daemon=True)
+        heartbeat.start()
+        _workers.append(heartbeat)
+
+    print(f"[Jobs] Started {settings.PROCESSING_WORKERS} workers")
+
+
+def claim_job(worker_name):
+    """
+    Claims the next runnable job.
+
+    A job is runnable if it is pending and its backoff has passed, or if it is marked as running
+    but its lease expired (the process that held it died). Rows locked by other workers are skipped.
+
+    Args:
+        worker_name (str): Identifier written to ProcessingJob.locked_by.
+
+    Returns:
+        ProcessingJob | None: The claimed job, None if the queue is empty.
+    """
+    while True:
+        with transaction.atomic():
+            current = timezone.now()
+            stale = current - timedelta(seconds=settings.PROCESSING_JOB_LEASE)
+
+            job = (
+                ProcessingJob.objects
+                .select_for_update(skip_locked=True)
+                .filter(
+                    Q(status="PENDING", run_after__lte=current) |
+                    Q(status="RUNNING", locked_at__lt=stale)
+                )
+                .order_by("run_after", "job_id")
+                .first()
+            )
+
+            if job is None:
+                return None
+
+            # A job that keeps killing its process must not be claimed forever
+            if job.status == "RUNNING" and job.attempts >= job.max_attempts:
+                job.status = "FAILED"
+                job.last_error = f"Lease expired on attempt {job.attempts} (held by {job.locked_by})"
+                job.locked_at = None
+                job.save()
+                _give_up(job)
+                continue
+
+            job.status = "RUNNING"
+            job.attempts += 1
+            job.locked_at = current
+            job.locked_by = worker_name
+            job.save()
+            return job
+
+
+def run_job(job):
+    """
+    Runs the handler of a claimed job and records the outcome.
+
+    On failure the job goes back to pending with a backoff of
+    PROCESSING_JOB_RETRY_BACKOFF * 2^(attempts - 1) seconds, unless it ran out of attempts.
+
+    Args:
+        job (ProcessingJob): Job returned by claim_job.
+
+    Returns:
+        bool: True if the handler finished without raising.
+    """
+    with _held_jobs_lock:
+        _held_jobs.add(job.job_id)
+
+    try:
+        handler = JOB_HANDLERS[job.kind]
+        handler(job.payload)
+
+        ProcessingJob.objects.filter(job_id=job.job_id).update(
+            status="DONE", locked_at=None, last_update=timezone.now()
+        )
+        return True
+
+    except Exception:
+        error = traceback.format_exc()
+        print(f"[Jobs] Job {job.job_id} ({job.kind}) failed on attempt {job.attempts}:", error)
+
+        # The connection may be the reason the job failed
+        connection.close()
+
+        if job.attempts < job.max_attempts:
+            backoff = settings.PROCESSING_JOB_RETRY_BACKOFF * (2 ** (job.attempts - 1))
+            ProcessingJob.objects.filter(job_id=job.job_id).update(
+                status="PENDING",
+                run_after=timezone.now() + timedelta(seconds=backoff),
+                locked_at=None,
+                last_error=error,
+                last_update=timezone.now(),
+            )
+        else:
+            ProcessingJob.objects.filter(job_id=job.job_id).update(
+                status="FAILED", locked_at=None, last_error=error, last_update=timezone.now()
+            )
+            _give_up(job)
+        return False
+
+    finally:
+        with _held_jobs_lock:
+            _held_jobs.discard(job.job_id)
+
+
+def _worker_loop(worker_name):
+    """
+    Body of a worker thread, claims and runs jobs until the process exits.
+
+    Args:
+        worker_name (str): Identifier of this worker.
+    """
+    while True:
+        try:
+            close_old_connections()
+            job = claim_job(worker_name)
+
+            if job is None:
+                time.sleep(settings.PROCESSING_POLL_INTERVAL)
+                continue
+
+            print(f"[Jobs] {worker_name} took job {job.job_id} ({job.kind}), attempt {job.attempts}")
+            run_job(job)
+
+        except Exception as e:
+            # Usually the database is unreachable, wait and try again.
+            print("[Jobs] Worker error:", e)
+            connection.close()
+            time.sleep(settings.PROCESSING_POLL_INTERVAL)
+
+
+def _heartbeat_loop():
+    """
+    Refreshes the lease of every job held by this process.
+    """
+    interval = max(1, settings.PROCESSING_JOB_LEASE // 3)
+    while True:
+        time.sleep(interval)
+        try:
+            with _held_jobs_lock:
+                held = list(_held_jobs)
+
+            if held:
+                close_old_connections()
+                ProcessingJob.objects.filter(job_id__in=held, status="RUNNING").update(locked_at=timezone.now())
+
+        except Exception as e:
+            print("[Jobs] Heartbeat error:", e)
+            connection.close()
+
+
+# ---------------- JOB HANDLERS ----------------
+
+def _process_batch(payload):
+    """
+    Handler of PROCESS_BATCH jobs (see upload.upload).
+
+    Args:
+        payload (dict): {"batch_id": int, "files": list[dict], "header": str}
+    """
+    from .upload import discard_staged, process_images
+
+    try:
+        batch = BatchDetails.objects.get(id=payload["batch_id"])
+    except BatchDetails.DoesNotExist:
+        print("Batch deleted before processing:", payload["batch_id"])
+        for file_dict in payload["files"]:
+            discard_staged(file_dict["path"])
+        return
+
+    process_images(batch, payload["files"], payload["header"])
+
+
+def _recalibrate(payload):
+    """
+    Handler of RECALIBRATE jobs (see upload.recalibrate).
+
+    Args:
+        payload (dict): {"image_id": int, "avg_pixels": float, "model": str, "mode": str}
+    """
+    from .upload import recalibrate_image
+
+    recalibrate_image(payload["image_id"], payload["avg_pixels"], payload["model"], payload["mode"])
+
+
+def _build_derivatives(payload):
+    """
+    Handler of BUILD_DERIVATIVES jobs (see view.request_derivatives).
+
+    Args:
+        payload (dict): {"image_id": int}
+    """
+    from .upload import build_image_derivatives
+
+    image = ImageDetails.objects.filter(image_id=payload["image_id"]).first()
+    if image is None:
+        print("Image deleted before building its derivatives:", payload["image_id"])
+        return
+
+    build_image_derivatives(image)
+
+
+def _give_up(job):
+    """
+    Flags the records of a job that ran out of attempts so they do not look in process forever.
+
+    Args:
+        job (ProcessingJob): The failed job.
+    """
+    try:
+        if job.kind == "PROCESS_BATCH":
+            # date_updated set by hand, update() skips auto_now and batch_status looks for changed batches with it
+            BatchDetails.objects.filter(id=job.payload["batch_id"]).update(
+                has_fail_present=True, is_complete=True, date_updated=timezone.now()
+            )
+            events.publish_batch(job.payload["batch_id"])
+
+        elif job.kind == "RECALIBRATE":
+            image = ImageDetails.objects.filter(image_id=job.payload["image_id"]).first()
+            if image:
+                ImageDetails.objects.filter(image_id=image.image_id).update(is_processed=True, last_update=timezone.now())
+                BatchDetails.objects.filter(id=image.batch_id).update(has_fail_present=True, date_updated=timezone.now())
+                events.publish("image", batch_id=image.batch_id, image_id=image.image_id, ok=False)
+                events.publish_batch(image.batch_id)
+
+    except Exception as e:
+        print("[Jobs] Could not flag failed job:", e)
+
+
+JOB_HANDLERS = {
+    "PROCESS_BATCH": _process_batch,
+    "RECALIBRATE": _recalibrate,
+    "BUILD_DERIVATIVES": _build_derivatives,
+}
@@ -9,6 +9,7 @@
 #
 
 from ._imports import *
+from .annotations import point_summary
 
 def metric(request):
     """
@@ -50,6 +51,7 @@ def get_model_stats(model_name):
         - TP: original points kept by the reviewer (is_original=True, is_deleted=False)
         - FP: original points deleted by the reviewer (is_original=True, is_deleted=True)
         - FN: points added by the reviewer (is_original=False)
+    Packed original points are counted as rows would be (see annotations.point_summary).
 
     Args:
         model_name (str): The model_used value to filter ImageDetails by
@@ -82,22 +84,11 @@ def get_model_stats(model_name):
     total_images = validated_images.count()
 
     # Point-level classification
-    TP = AnnotationPoints.objects.filter(
-        image_id__in=validated_images,
-        is_original=True,
-        is_deleted=False
-    ).count()
-
-    FP = AnnotationPoints.objects.filter(
-        image_id__in=validated_images,
-        is_original=True,
-        is_deleted=True
-    ).count()
-
-    FN = AnnotationPoints.objects.filter(
-        image_id__in=validated_images,
-        is_original=False
-    ).count()
+    summary = point_summary(validated_images)
+
+    TP = sum(counts["kept"] for counts in summary.values())
+    FP = sum(counts["deleted"] for counts in summary.values())
+    FN = sum(counts["added"] + counts["added_deleted"] for counts in summary.values())
 
     total_model_predictions = TP + FP
     total_ground_truth = TP + FN
@@ -111,9 +102,9 @@ def get_model_stats(model_name):
     total_abs_error = 0
     valid_image_count = 0
 
-    for image in validated_images:
-        pred = AnnotationPoints.objects.filter(image_id=image, is_original=True, is_deleted=False).count()
-        added = AnnotationPoints.objects.filter(image_id=image, is_original=False).count()
+    for counts in summary.values():
+        pred = counts["kept"]
+        added = counts["added"] + counts["added_deleted"]
         true_count = pred + added
         
         if true_count > 0:
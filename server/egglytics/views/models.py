@@ -1,6 +1,9 @@
 # models.py
 from django.db import models
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.utils import timezone
+import uuid
 
 class BatchDetails(models.Model):
     batch_name = models.CharField(max_length=255)
@@ -11,10 +14,23 @@ class BatchDetails(models.Model):
     total_hatched = models.IntegerField()
     is_complete = models.BooleanField()
     has_fail_present = models.BooleanField(default = False)
+    # Live progress of process_images, updated with F() after every image (see upload.record_progress)
+    images_processed = models.IntegerField(default=0)
+    images_failed = models.IntegerField(default=0)
+    processing_started = models.DateTimeField(null=True, blank=True)
     
 
     class Meta:
         db_table = "batch_details"   # TABLE NAME.
+        # One per sort of the view page (see view.batch_list), id last like the keyset cursors
+        indexes = [
+            models.Index(fields=["date_updated", "id"], name="batch_date_updated_idx"),
+            models.Index(fields=["batch_name", "id"], name="batch_name_idx"),
+            models.Index(fields=["owner", "id"], name="batch_owner_idx"),
+            models.Index(fields=["total_images", "id"], name="batch_total_images_idx"),
+            models.Index(fields=["total_eggs", "id"], name="batch_total_eggs_idx"),
+            models.Index(fields=["is_complete", "has_fail_present", "id"], name="batch_status_idx"),
+        ]
 
 class ImageDetails(models.Model):
     image_id = models.AutoField(primary_key=True)
@@ -25,7 +41,8 @@ class ImageDetails(models.Model):
         db_column="batch_id"   # link to batch_details table
     )
     image_name = models.CharField(max_length=255)
-    file_path = models.CharField(max_length=255)
+    # Several records may share a file (see content_hash), the file is removed with the last of them
+    file_path = models.CharField(max_length=255, db_index=True)
     total_eggs = models.IntegerField()
     total_hatched = models.IntegerField()
     date_uploaded = models.DateTimeField(auto_now_add=True)
@@ -39,26 +56,31 @@ class ImageDetails(models.Model):
     is_validated = models.BooleanField()
     model_used = models.CharField(max_length = 255)
     image_version = models.IntegerField(default=1)
+    # SHA-256 of the uploaded bytes, only set once the model processed the image successfully.
+    # An upload with the same hash, model_used and img_type reuses this image instead of calling the model.
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    # Original (model) points of dense images, packed as little-endian int32 x, y pairs instead of
+    # one AnnotationPoints row each (see annotations.py). Reviewer edits are still rows, deleting a
+    # packed point adds an is_original=True, is_deleted=True row at its coordinates.
+    packed_points = models.BinaryField(null=True, blank=True)
+    packed_point_count = models.IntegerField(default=0)
+    # Grid cells the reviewer marked as verified, one bit per cell (bit row * grid_cols + col in the order of
+    # Postgres get_bit/set_bit) for a grid of grid_cols by grid_rows cells, see grids.py
+    grid_bitmap = models.BinaryField(null=True, blank=True)
+    grid_cols = models.IntegerField(default=0)
+    grid_rows = models.IntegerField(default=0)
     
 
     class Meta:
         db_table = "image_details"  # TABLE NAME.
 
-class VerifiedGrids(models.Model):
-    grid_id = models.AutoField(primary_key=True)
+# Side in pixels of the grid cells of the bucket columns below, the editor finds the annotation
+# nearest to a click by looking at the cell of the click and its neighbours (see annotations.find_point_near)
+ANNOTATION_BUCKET_SIZE = 32
 
-    image = models.ForeignKey(
-        ImageDetails,
-        on_delete=models.CASCADE,
-        db_column="image_id"
-    )
-
-    x = models.PositiveIntegerField()
-    y = models.PositiveIntegerField()
-
-    class Meta:
-        db_table = "verified_grids"
-        unique_together = ("image", "x", "y")  # prevents duplicate grids
+def bucket_expression(x, y):
+    # Cell of (x, y) as one integer, integer division truncates like annotations.bucket_of
+    return (F(x) / ANNOTATION_BUCKET_SIZE) * 65536 + F(y) / ANNOTATION_BUCKET_SIZE
 
 class AnnotationPoints(models.Model):
     point_id = models.AutoField(primary_key=True)
@@ -71,9 +93,18 @@ class AnnotationPoints(models.Model):
     y = models.IntegerField()
     is_original = models.BooleanField(default=True)   # model’s first output
     is_deleted = models.BooleanField(default=False)
+    # Computed by the database, so bulk_create and COPY fill it too
+    bucket = models.GeneratedField(
+        expression=bucket_expression("x", "y"),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
 
     class Meta:
         db_table = "annotation_points"
+        indexes = [
+            models.Index(fields=["image", "bucket"], name="annotation_point_bucket_idx"),
+        ]
 
 class AnnotationRect(models.Model):
     rect_id = models.AutoField(primary_key=True)
@@ -91,8 +122,17 @@ class AnnotationRect(models.Model):
     y_end = models.IntegerField()
     is_original = models.BooleanField(default=True)
     is_deleted = models.BooleanField(default=False)
+    # Cell of the (x_init, y_init) corner, rects are stored normalized (see editor.normalize_rect)
+    bucket = models.GeneratedField(
+        expression=bucket_expression("x_init", "y_init"),
+        output_field=models.IntegerField(),
+        db_persist=True,
+    )
     class Meta:
         db_table = "annotation_rects"
+        indexes = [
+            models.Index(fields=["image", "bucket"], name="annotation_rect_bucket_idx"),
+        ]
 
 # -------------------------------
 # POLYGON SUPPORT (NEW)
@@ -133,3 +173,118 @@ class AnnotationPolygonPoint(models.Model):
         db_table = "annotation_polygon_points"
         ordering = ["order_index"]
 
+
+
+# -------------------------------
+# BACKGROUND PROCESSING QUEUE
+# -------------------------------
+
+class ProcessingJob(models.Model):
+    # Work that used to be thrown to a bare thread (see jobs.py).
+    # Rows survive a restart, a job that was running when the server died is claimed again once its lease expires.
+    job_id = models.BigAutoField(primary_key=True)
+
+    KIND_CHOICES = [
+        ("PROCESS_BATCH", "Process Batch"),
+        ("RECALIBRATE", "Recalibrate"),
+        ("BUILD_DERIVATIVES", "Build Derivatives"),
+    ]
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    payload = models.JSONField(default=dict)
+
+    STATUS_CHOICES = [
+        ("PENDING", "Pending"),
+        ("RUNNING", "Running"),
+        ("DONE", "Done"),
+        ("FAILED", "Failed"),
+    ]
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="PENDING")
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)   # used for retry backoff
+    locked_at = models.DateTimeField(null=True, blank=True)  # refreshed by the worker heartbeat
+    locked_by = models.CharField(max_length=255, blank=True, default="")
+    last_error = models.TextField(blank=True, default="")
+    date_created = models.DateTimeField(auto_now_add=True)
+    last_update = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "processing_jobs"
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="processing_job_claim_idx"),
+        ]
+
+
+# -------------------------------
+# CHUNKED (RESUMABLE) UPLOADS
+# -------------------------------
+
+class UploadSession(models.Model):
+    # A batch uploaded in numbered chunks (see chunked_upload.py). The BatchDetails and the
+    # PROCESS_BATCH job are only created when the session is finalized.
+    upload_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    batch_name = models.CharField(max_length=255)
+    owner = models.CharField(max_length=150, default="Incognito")
+    # [{"name", "size", "model", "mode", "share"}, ...] in upload order
+    files = models.JSONField(default=list)
+    chunk_size = models.IntegerField()
+
+    STATUS_CHOICES = [
+        ("OPEN", "Open"),
+        ("FINALIZED", "Finalized"),
+    ]
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="OPEN")
+    batch = models.ForeignKey(
+        BatchDetails,
+        on_delete=models.SET_NULL,
+        db_column="batch_id",
+        null=True,
+        blank=True
+    )
+    date_created = models.DateTimeField(auto_now_add=True)
+    last_update = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "upload_sessions"
+
+
+class UploadChunk(models.Model):
+    # One confirmed chunk, its bytes are already written at their offset in the staged file
+    chunk_id = models.BigAutoField(primary_key=True)
+    session = models.ForeignKey(
+        UploadSession,
+        on_delete=models.CASCADE,
+        db_column="upload_id",
+        related_name="chunks"
+    )
+    file_index = models.IntegerField()
+    chunk_index = models.IntegerField()
+    size = models.IntegerField()
+    checksum = models.CharField(max_length=80)   # "sha256=<hex>" or "crc32=<hex>" as sent by the client
+
+    class Meta:
+        db_table = "upload_chunks"
+        unique_together = ("session", "file_index", "chunk_index")
+
+
+# -------------------------------
+# RUNNING TOTALS
+# -------------------------------
+
+class Totals(models.Model):
+    # Sums shown on the view page, kept up to date by every change of the counts (see totals.py).
+    # ("all", "") and ("owner", <owner>) rows sum BatchDetails, ("model", <model>) rows sum ImageDetails.
+    SCOPE_CHOICES = [
+        ("all", "All"),
+        ("owner", "Owner"),
+        ("model", "Model"),
+    ]
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    key = models.CharField(max_length=255, blank=True, default="")
+    batches = models.BigIntegerField(default=0)
+    images = models.BigIntegerField(default=0)
+    eggs = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = "totals"
+        unique_together = ("scope", "key")
@@ -0,0 +1,161 @@
+#
+#
+# LAYOUT OF THE STORED IMAGES
+#
+# Processed images used to be written flat to MEDIA_ROOT/uploads/image_<batch>_<uuid>.jpg, a single folder
+# with hundreds of thousands of files (and their previews). Every image now gets its own folder,
+# sharded by the first characters of its random key so no folder holds more than a few hundred entries:
+#   MEDIA_ROOT/uploads/<ab>/<cd>/<key>/image.jpg
+#   MEDIA_ROOT/uploads/<ab>/<cd>/<key>/image_preview_v<version>.jpg
+#   MEDIA_ROOT/uploads/<ab>/<cd>/<key>/image_tiles/...
+# ImageDetails.file_path stays relative to MEDIA_ROOT/uploads (and is used in URLs), so both layouts are
+# served the same way. Older records are moved with "python manage.py migrate_media_layout".
+#
+#
+
+from ._imports import *
+from . import imaging
+import re
+import shutil
+
+# <ab>/<cd>/<32 hex key>/<name>
+SHARDED_PATH = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}/[^/]+$")
+
+
+def uploads_dir():
+    """
+    Root of the stored images.
+
+    Returns:
+        str: MEDIA_ROOT/uploads
+    """
+    return os.path.join(settings.MEDIA_ROOT, "uploads")
+
+
+def upload_path(file_path):
+    """
+    Absolute path of a stored image.
+
+    Args:
+        file_path (str): ImageDetails.file_path
+
+    Returns:
+        str: MEDIA_ROOT/uploads/<file_path>
+    """
+    return os.path.join(uploads_dir(), file_path)
+
+
+def prepare_upload_path(file_path):
+    """
+    Absolute path of a stored image, its folder is created if needed.
+
+    Args:
+        file_path (str): ImageDetails.file_path
+
+    Returns:
+        str: MEDIA_ROOT/uploads/<file_path>
+    """
+    path = upload_path(file_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def new_file_path(ext=".jpg"):
+    """
+    Allocates the file_path of a new stored image (or of a new file for an existing image).
+
+    Args:
+        ext (str): Extension of the file.
+
+    Returns:
+        str: <ab>/<cd>/<key>/image<ext>, always with forward slashes since it is used in URLs.
+    """
+    key = uuid.uuid4().hex
+    return f"{key[:2]}/{key[2:4]}/{key}/image{ext}"
+
+
+def is_sharded(file_path):
+    """
+    Whether a file_path already uses the sharded layout.
+
+    Args:
+        file_path (str): ImageDetails.file_path
+
+    Returns:
+        bool: False for the flat paths of older records.
+    """
+    return bool(SHARDED_PATH.match(file_path))
+
+
+def remove_stored_file(file_path):
+    """
+    Deletes a stored image with its previews and tiles, then the folders left empty.
+
+    Does not check whether a record still uses the file (see view.remove_image_file).
+
+    Args:
+        file_path (str): ImageDetails.file_path
+
+    Returns:
+        bool: True if the image file existed.
+    """
+    image_path = upload_path(file_path)
+    shutil.rmtree(imaging.tiles_dir(image_path), ignore_errors=True)
+    for preview in imaging.preview_files(image_path):
+        os.remove(preview)
+
+    existed = os.path.exists(image_path)
+    if existed:
+        os.remove(image_path)
+
+    # <key>, <cd> and <ab> folders of the sharded layout, never uploads itself
+    root = os.path.abspath(uploads_dir())
+    folder = os.path.dirname(os.path.abspath(image_path))
+    while folder != root and folder.startswith(root):
+        try:
+            os.rmdir(folder)
+        except OSError:
+            break # Not empty
+        folder = os.path.dirname(folder)
+
+    return existed
+
+
+def relocate(file_path):
+    """
+    Moves a stored image of the flat layout (with its previews and tiles) to the sharded layout.
+
+    The image is linked (or copied) to its new path first, so it can be read from either path until
+    the records are updated. Call remove_stored_file on the old path once no record uses it.
+
+    Args:
+        file_path (str): Flat ImageDetails.file_path
+
+    Returns:
+        str | None: The new file_path, None if the image file does not exist.
+    """
+    old_path = upload_path(file_path)
+    if not os.path.exists(old_path):
+        return None
+
+    _, ext = os.path.splitext(file_path)
+    new_relative = new_file_path(ext.lower() or ".jpg")
+    new_path = prepare_upload_path(new_relative)
+
+    try:
+        os.link(old_path, new_path)
+    except OSError:
+        shutil.copy2(old_path, new_path)
+
+    # Derivatives move along, the editor falls back to the full image for a moment if it opens in between
+    if os.path.isdir(imaging.tiles_dir(old_path)):
+        os.replace(imaging.tiles_dir(old_path), imaging.tiles_dir(new_path))
+
+    old_base, _ = os.path.splitext(old_path)
+    new_base, _ = os.path.splitext(new_path)
+    for preview in imaging.preview_files(old_path):
+        suffix = preview[len(old_base):]
+        if suffix.startswith("_preview_v"):
+            os.replace(preview, new_base + suffix)
+
+    return new_relative
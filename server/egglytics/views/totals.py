@@ -0,0 +1,192 @@
+#
+#
+# RUNNING TOTALS OF THE VIEW PAGE
+#
+# The header of the view page showed sums over every batch, recomputed with an aggregate on each load.
+# They are kept in the totals table instead, one row for everything, one per owner and one per model:
+#   ("all", "")         batches, images, eggs   sums of BatchDetails
+#   ("owner", <owner>)  batches, images, eggs   sums of the BatchDetails of the owner
+#   ("model", <model>)  images, eggs            count and sum of the ImageDetails of the model
+# Every change of those counts calls add (or remove_batch) in the same transaction, so the totals
+# move with the counts or not at all. "python manage.py rebuild_totals" recomputes them from scratch.
+#
+#
+
+from ._imports import *
+from .models import Totals
+from django.db import connection
+from django.db.models import Count
+
+TOTAL_FIELDS = ("batches", "images", "eggs")
+
+
+def add(owner=None, model=None, batches=0, images=0, eggs=0):
+    """
+    Adds to the running totals, call it inside the transaction that changes the counts.
+
+    Args:
+        owner (str, optional): Owner of the batch, updates the "all" and "owner" rows.
+        model (str, optional): model_used of the image, updates the "model" row (its batches stay 0).
+        batches (int): Change of the number of batches.
+        images (int): Change of the number of images (BatchDetails.total_images or ImageDetails rows).
+        eggs (int): Change of the number of eggs.
+
+    Returns:
+        None
+    """
+    if not (batches or images or eggs):
+        return
+
+    rows = []
+    if owner is not None:
+        rows.append(("all", "", batches, images, eggs))
+        rows.append(("owner", owner, batches, images, eggs))
+    if model is not None:
+        rows.append(("model", model, 0, images, eggs))
+
+    # Always locked in the same order ("all", "model", "owner"), two transactions never wait on each other
+    rows.sort(key=lambda row: (row[0], row[1]))
+
+    # One statement, a missing row is created with the change as its value
+    values = ", ".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+    sql = (
+        f"INSERT INTO {Totals._meta.db_table} (scope, key, batches, images, eggs) VALUES {values} "
+        "ON CONFLICT (scope, key) DO UPDATE SET "
+        + ", ".join(f"{field} = {Totals._meta.db_table}.{field} + EXCLUDED.{field}" for field in TOTAL_FIELDS)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row])
+
+
+def remove_batch(batch):
+    """
+    Subtracts a batch and its images from the running totals, call it before deleting them.
+
+    Args:
+        batch (BatchDetails): The batch, freshly read (or locked) so its counts are the stored ones.
+
+    Returns:
+        None
+    """
+    per_model = (
+        ImageDetails.objects
+        .filter(batch=batch)
+        .values("model_used")
+        .annotate(images=Count("image_id"), eggs=Sum("total_eggs"))
+        .order_by("model_used")
+    )
+    add(owner=batch.owner, batches=-1, images=-batch.total_images, eggs=-batch.total_eggs)
+    for row in per_model:
+        add(model=row["model_used"], images=-row["images"], eggs=-(row["eggs"] or 0))
+
+
+def get_totals(scope="all", key=""):
+    """
+    One row of the running totals.
+
+    Args:
+        scope (str): "all", "owner" or "model".
+        key (str): Owner or model name, "" for "all".
+
+    Returns:
+        dict: {"batches", "images", "eggs"}, zeros if nothing was counted yet.
+    """
+    row = Totals.objects.filter(scope=scope, key=key).values(*TOTAL_FIELDS).first()
+    return row or dict.fromkeys(TOTAL_FIELDS, 0)
+
+
+def compute_totals():
+    """
+    Computes every row of the running totals from BatchDetails and ImageDetails.
+
+    Returns:
+        dict: {(scope, key): (batches, images, eggs)}
+    """
+    computed = {}
+
+    summary = BatchDetails.objects.aggregate(batches=Count("id"), images=Sum("total_images"), eggs=Sum("total_eggs"))
+    computed[("all", "")] = (summary["batches"], summary["images"] or 0, summary["eggs"] or 0)
+
+    per_owner = (
+        BatchDetails.objects
+        .values("owner")
+        .annotate(batches=Count("id"), images=Sum("total_images"), eggs=Sum("total_eggs"))
+        .order_by()
+    )
+    for row in per_owner:
+        computed[("owner", row["owner"])] = (row["batches"], row["images"] or 0, row["eggs"] or 0)
+
+    per_model = (
+        ImageDetails.objects
+        .values("model_used")
+        .annotate(images=Count("image_id"), eggs=Sum("total_eggs"))
+        .order_by()
+    )
+    for row in per_model:
+        computed[("model", row["model_used"])] = (0, row["images"], row["eggs"] or 0)
+
+    return computed
+
+
+def stored_totals():
+    """
+    Every row of the running totals as stored.
+
+    Returns:
+        dict: {(scope, key): (batches, images, eggs)}
+    """
+    return {
+        (row[0], row[1]): tuple(row[2:])
+        for row in Totals.objects.values_list("scope", "key", *TOTAL_FIELDS)
+    }
+
+
+def find_drift(stored, computed):
+    """
+    Rows whose stored totals differ from the computed ones, rows of zeros count as missing.
+
+    Args:
+        stored (dict): See stored_totals.
+        computed (dict): See compute_totals.
+
+    Returns:
+        list[tuple]: (scope, key, stored, computed) sorted by scope and key.
+    """
+    zero = (0, 0, 0)
+    drift = []
+    for scope_key in sorted(set(stored) | set(computed)):
+        was = stored.get(scope_key, zero)
+        should = computed.get(scope_key, zero)
+        if was != should:
+            drift.append((*scope_key, was, should))
+    return drift
+
+
+@transaction.atomic
+def rebuild_totals(check=False):
+    """
+    Recomputes the running totals from scratch.
+
+    The table is locked first, so the counts changed meanwhile are committed after the rebuild
+    (their add waits for the lock) and never counted twice.
+
+    Args:
+        check (bool): Only compare, the stored totals are left as they are.
+
+    Returns:
+        list[tuple]: The drift found before the rebuild (see find_drift).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {Totals._meta.db_table} IN EXCLUSIVE MODE")
+
+    computed = compute_totals()
+    drift = find_drift(stored_totals(), computed)
+
+    if drift and not check:
+        Totals.objects.all().delete()
+        Totals.objects.bulk_create([
+            Totals(scope=scope, key=key, **dict(zip(TOTAL_FIELDS, values)))
+            for (scope, key), values in computed.items()
+        ])
+
+    return drift
@@ -2,13 +2,23 @@
 #
 # This is where the image is initially send after clicking the submit button in the upload.html.
 # It basically saves the image on the backend, then fires a redirect to the user to the view page once saved.
-# To do this, it creates a separate thread on compute such that the user does not need to wait for the images
+# To do this, it queues a processing job (see jobs.py) such that the user does not need to wait for the images
 # To be processed, only uploaded to the server.
 #
 #
 #
 
 from ._imports import *
+from .jobs import enqueue_job
+from . import inference
+from . import imaging
+from . import storage
+from . import totals
+from . import events
+from .annotations import bulk_create_annotations, model_points
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.db import connection
+import hashlib
 import warnings
 
 # Disable the DecompressionBombError and Warning
@@ -25,8 +35,8 @@ def upload(request):
     Workflow:
     1. Validates that the request is POST and contains files.
     2. Creates a BatchDetails entry in the database.
-    3. Encodes uploaded files in base64 and collects per-file metadata.
-    4. Launches a separate thread to process images asynchronously.
+    3. Streams each uploaded file to the staging area and collects per-file metadata.
+    4. Queues a PROCESS_BATCH job so the images are processed by a background worker.
     5. Returns a JSON response immediately confirming upload receipt.
 
     Args:
@@ -57,24 +67,26 @@ def upload(request):
         # This is the total images
         total_images = len(request.FILES.getlist('myfiles'))
 
-        # Create a batch entry on the DB
-        batch = BatchDetails.objects.create(
-            batch_name=batch_name,
-            owner=owner,
-            total_images=total_images,
-            total_eggs=0,
-            total_hatched=0,
-            date_updated=date,
-            is_complete=False,
-            has_fail_present=False,
-        )
+        # Create a batch entry on the DB, counted in the running totals right away
+        with transaction.atomic():
+            batch = BatchDetails.objects.create(
+                batch_name=batch_name,
+                owner=owner,
+                total_images=total_images,
+                total_eggs=0,
+                total_hatched=0,
+                date_updated=date,
+                is_complete=False,
+                has_fail_present=False,
+            )
+            totals.add(owner=owner, batches=1, images=total_images)
 
-        # Read files into memory BEFORE starting thread (No images are saved at this point, only on memory)
+        # Write files to the staging area BEFORE queueing the job, the job only receives file references.
+        # This keeps the worker memory flat regardless of how large the batch is.
         files = request.FILES.getlist("myfiles")
         files_data = [] # Store as Array of JSON
         for i, f in enumerate(files):
-            file_bytes = f.read()
-            encoded = base64.b64encode(file_bytes).decode("utf-8")
+            staged_path, content_hash = stage_upload(f, batch.id)
 
             # Retrieve per-file metadata
             # The model defined here is the variable "value" in ModelConfig
@@ -84,33 +96,99 @@ def upload(request):
 
             files_data.append({
                 "name": f.name,
-                "data": encoded,
+                "path": staged_path,
+                "hash": content_hash,
                 "model": model,
                 "mode": mode,
                 "share": share,
             })
 
-        # Throw to thread and forget
-        t = threading.Thread(
-                target=process_images,
-                args=(batch, files_data, batch_name)
-            )
-        t.start()
-        # Send that upload was completed to the user, while thread is running.
+        # Queue the batch, a worker picks it up (and again after a restart if it did not finish)
+        enqueue_job("PROCESS_BATCH", {
+            "batch_id": batch.id,
+            "files": files_data,
+            "header": batch_name,
+        })
+        # Send that upload was completed to the user, while the job is running.
         return JsonResponse({'message': "Upload received! Processing in background.", 'batch_id': batch.id})
 
     return render(request, "base.html", {'included_template': 'upload.html'})
 
+def stage_upload(uploaded_file, batch_id):
+    """
+    Writes an uploaded file to the staging area chunk by chunk.
+
+    The file is never fully read into memory, Django hands over the upload in chunks
+    which are appended to MEDIA_ROOT/staging/<batch_id>/. The staged copy is removed
+    by process_images once the image has been handled. The SHA-256 of the file is
+    computed on the same pass (see reuse_processed_image).
+
+    Args:
+        uploaded_file (UploadedFile): File taken from request.FILES.
+        batch_id (int): ID of the batch the file belongs to.
+
+    Returns:
+        tuple[str, str]: Path of the staged file relative to MEDIA_ROOT, and the hex SHA-256 of its bytes.
+    """
+    _, ext = os.path.splitext(uploaded_file.name)
+    staged_path = os.path.join("staging", str(batch_id), f"{uuid.uuid4().hex}{ext.lower()}")
+
+    full_path = os.path.join(settings.MEDIA_ROOT, staged_path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+    digest = hashlib.sha256()
+    with open(full_path, "wb") as destination:
+        for chunk in uploaded_file.chunks():
+            digest.update(chunk)
+            destination.write(chunk)
+
+    return staged_path, digest.hexdigest()
+
+def hash_staged(staged_path):
+    """
+    SHA-256 of a staged upload, read in chunks.
+
+    Args:
+        staged_path (str): Path of the staged file, relative to MEDIA_ROOT.
+
+    Returns:
+        str | None: Hex digest, None if the file cannot be read.
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(os.path.join(settings.MEDIA_ROOT, staged_path), "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    except OSError as e:
+        print("Could not hash staged upload:", e)
+        return None
+    return digest.hexdigest()
+
+def discard_staged(staged_path):
+    """
+    Removes a staged upload, and its batch folder once it is empty.
+
+    Args:
+        staged_path (str): Path of the staged file, relative to MEDIA_ROOT.
+    """
+    full_path = os.path.join(settings.MEDIA_ROOT, staged_path)
+    if os.path.exists(full_path):
+        os.remove(full_path)
+
+    try:
+        os.rmdir(os.path.dirname(full_path))
+    except OSError:
+        pass # Other files of the batch are still staged
+
 def recalibrate(request):
     """
-    Recalibrates an uploaded image by processing it in a background thread.
+    Recalibrates an uploaded image by processing it in a background job.
 
     Workflow:
     1. Accepts a POST request with JSON payload containing imageId and averagePixels.
     2. Retrieves the image record from the database.
-    3. Loads the image file from disk and encodes it as base64.
-    4. Launches a background thread to perform recalibration using the specified model and mode.
-    5. Returns a JSON response immediately.
+    3. Queues a RECALIBRATE job using the specified model and mode.
+    4. Returns a JSON response immediately.
 
     Args:
         request (HttpRequest): Django request object containing JSON body.
@@ -121,7 +199,7 @@ def recalibrate(request):
 
     Returns:
         JsonResponse: 
-            - {"status": "success"} if recalibration thread started successfully.
+            - {"status": "success"} if the recalibration job was queued.
             - {"error": "Image not found"} with 404 status if image ID is invalid.
             - {"error": "<message>"} with 400 status for other errors.
             - {"error": "Invalid request"} with 405 status if request method is not POST.
@@ -139,30 +217,16 @@ def recalibrate(request):
             # Get image record
             image_obj = ImageDetails.objects.get(image_id=image_id)
 
-            image_path = os.path.join(
-                settings.MEDIA_ROOT,      # /full/system/path/media
-                "uploads",                # your folder
-                image_obj.file_path      # filename from DB
-            )
-
             model = image_obj.model_used
             mode = "macro"
 
-            print("Resolved path:", image_path)
-
-            # Load image as base64
-            with open(image_path, "rb") as f:
-                image_bytes = f.read()
-                image_base64 = base64.b64encode(image_bytes).decode("utf-8")
-
-            print("Image loaded. Size:", len(image_base64))
-
-            # Throw to thread and forget
-            t = threading.Thread(
-                    target=recalibrate_image,
-                    args=(image_base64,avg_pixels,model,mode,image_id)
-                )
-            t.start()
+            # The image is loaded by the worker, only the reference is queued
+            enqueue_job("RECALIBRATE", {
+                "image_id": image_obj.image_id,
+                "avg_pixels": avg_pixels,
+                "model": model,
+                "mode": mode,
+            })
             return JsonResponse({"status": "success"})
 
         except ImageDetails.DoesNotExist:
@@ -173,13 +237,13 @@ def recalibrate(request):
 
     return JsonResponse({"error": "Invalid request"}, status=405)
 
-def recalibrate_image(image, avg_pixels, model, mode, image_id):
+def recalibrate_image(image_id, avg_pixels, model, mode):
     """
     Recalibrates a single image using the specified AI model, updates annotations,
     and saves a compressed version of the processed image to disk.
 
     Workflow:
-    1. Retrieves the existing ImageDetails record from the database.
+    1. Retrieves the existing ImageDetails record from the database and loads its file.
     2. Sends the image to the AI model for recalibration.
     3. Falls back to the original image if the AI fails.
     4. Updates annotation points in AnnotationPoints (deletes old, inserts new).
@@ -188,11 +252,10 @@ def recalibrate_image(image, avg_pixels, model, mode, image_id):
     6. Updates egg count and processing flags in the database.
 
     Args:
-        image (str): Base64-encoded image string.
+        image_id (int): ID of the image record in the database.
         avg_pixels (float): Average pixel value used for recalibration (Given by the user).
         model (str): Name of the AI model to use (e.g., "polyegg_heatmap").
         mode (str): Processing mode ("micro" or "macro").
-        image_id (int): ID of the image record in the database.
 
     Returns:
         None
@@ -204,127 +267,102 @@ def recalibrate_image(image, avg_pixels, model, mode, image_id):
         - Updates parent BatchDetails with new total egg count.
     """
 
-    payload = {
-        "image": image,
-        "avg_pixels": avg_pixels,
-        "mode": mode
-    }
-
-    response = None
     data = None
     status_code = None
 
         # --------------- GET EXISTING IMAGE RECORD ---------------
+    # Marked unprocessed before file_path is read: migrate_media_layout only moves the files of
+    # processed images, so the path read here is not moved while the image is recalibrated
+    ImageDetails.objects.filter(image_id=image_id).update(is_processed=False, last_update=timezone.now())
     try:
         image_record = ImageDetails.objects.get(image_id=image_id)
     except ImageDetails.DoesNotExist:
         print("Image record missing during recalibration")
         return
-    
-    image_record.is_processed = False
-    image_record.save()
+
+    image_path = storage.upload_path(image_record.file_path)
+    print("Resolved path:", image_path)
+
+    params = {
+        "avg_pixels": avg_pixels,
+        "mode": mode
+    }
 
     # ---------------- AI CALL ----------------
     try:
         match model:
             case "polyegg_heatmap":
-                response = requests.post(
-                    "http://127.0.0.1:5000/recalibrate_base64",
-                    json=payload,
-                    timeout=300
-                )
-                status_code = response.status_code
-                print("Flask raw:", response.text[:300])
-                data = response.json()
+                with inference.model_slot(model):
+                    status_code, data = inference.infer("recalibrate_base64", "recalibrate_binary", image_path, params)
 
             case "RESERVED_":
                 print("RESERVED")
                 return
 
     except Exception as e:
+        # Raised so the job is retried, the image stays unprocessed until then
         print("Flask request failed:", e)
-        return
+        raise
 
     # --------------- FAIL SAFE ---------------
-    if status_code != 200 or data.get("status") != "complete":
+    if status_code != 200 or not data or data["status"] != "complete":
         print("AI failed, using fallback")
-        data = {
-            "status": "complete",
-            "points": [],
-            "final_image": image,
-            "egg_count": 0
-        }
+        data = inference.fallback_result(image_path)
 
     # --------------- EXTRACT DATA ---------------
-    points = data.get("points", [])
-    image_b64 = data.get("final_image")
-    egg_count = data.get("egg_count", 0)
+    points = data["points"]
+    img_data = data["image_bytes"]
+    egg_count = data["egg_count"]
 
     print(f"[Recalibrate] Points: {len(points)}, Eggs: {egg_count}")
 
-    # ------------- GET BATCH ID FROM IMAGE RECORD
-    batch = image_record.batch
-    batch.total_eggs = max(0, batch.total_eggs - image_record.total_eggs + egg_count)
-    batch.save()
-
-    # --------------- PURGE OLD ANNOTATIONS ---------------
-    AnnotationPoints.objects.filter(image=image_record).delete()
-    print("Old annotations deleted")
-
-    # --------------- INSERT NEW ANNOTATIONS ---------------
-    for p in points:
-        AnnotationPoints.objects.create(
-            image=image_record,
-            x=p[0],
-            y=p[1],
-            is_original=True # recalibrated result remains true since it is the machine predictions..
-        )
-
-    print("New annotations saved")
-
-
     # --------------- UPDATE IMAGE FILE ---------------
-    if image_b64:
-    # Remove header if present
-        if "," in image_b64:
-            image_b64 = image_b64.split(",")[1]
-
-        # Decode base64
-        img_data = base64.b64decode(image_b64)
-
-        # Open with Pillow
-        image = Image.open(BytesIO(img_data))
-
-        # Keep original resolution
-        print("Resolution:", image.size)
-
-        # Convert to RGB if needed (PNG with alpha → JPEG compatible)
-        if image.mode in ("RGBA", "P"):
-            image = image.convert("RGB")
-
-        # Prepare folder
-        upload_dir = os.path.join(settings.MEDIA_ROOT, "uploads")
-        os.makedirs(upload_dir, exist_ok=True)
-
-        file_path = os.path.join(upload_dir, image_record.file_path)
-
-        # SAVE WITH COMPRESSION (quality=75)
-        image.save(
-            file_path,
-            format="JPEG",
-            quality=70,       # slightly higher than 65
-            optimize=True,
-            progressive=True
-        )
-
-        print("Saved:", file_path)
-        print("New size (KB):", os.path.getsize(file_path) / 1024)
+    previous_file_path = image_record.file_path
+    if img_data:
+        # The file may be shared with uploads of the same image (see reuse_processed_image), give this image its own
+        if ImageDetails.objects.filter(file_path=image_record.file_path).exclude(image_id=image_record.image_id).exists():
+            image_record.file_path = storage.new_file_path()
+
+        file_path = storage.prepare_upload_path(image_record.file_path)
+        save_final_image(img_data, file_path)
+
+    # The old annotations are replaced and the counts updated together, a failure leaves the image as it was
+    with transaction.atomic():
+        # ------------- GET BATCH ID FROM IMAGE RECORD
+        batch = BatchDetails.objects.select_for_update().get(id=image_record.batch_id)
+        batch_eggs = max(0, batch.total_eggs - image_record.total_eggs + egg_count)
+        totals.add(owner=batch.owner, eggs=batch_eggs - batch.total_eggs)
+        totals.add(model=image_record.model_used, eggs=egg_count - image_record.total_eggs)
+        batch.total_eggs = batch_eggs
+        batch.save()
 
-    # --------------- UPDATE COUNTS ---------------
-    image_record.total_eggs = egg_count
-    image_record.is_processed = True
-    image_record.image_version += 1
-    image_record.save()
+        # --------------- PURGE OLD ANNOTATIONS ---------------
+        AnnotationPoints.objects.filter(image=image_record).delete()
+        image_record.packed_points = None
+        image_record.packed_point_count = 0
+        print("Old annotations deleted")
+
+        # --------------- INSERT NEW ANNOTATIONS ---------------
+        # recalibrated result remains original since it is the machine predictions..
+        bulk_create_annotations(image_record, points=points)
+        print("New annotations saved")
+
+        # --------------- UPDATE COUNTS ---------------
+        # The annotations no longer match the ones of the upload, other uploads must not copy them
+        image_record.content_hash = None
+        image_record.total_eggs = egg_count
+        image_record.is_processed = True
+        image_record.image_version += 1
+        fields = [
+            "packed_points", "packed_point_count", "content_hash", "total_eggs",
+            "is_processed", "image_version", "last_update",
+        ]
+        if image_record.file_path != previous_file_path:
+            fields.append("file_path")
+        image_record.save(update_fields=fields)
+
+    # Preview and tiles of the new version, the tiles that did not change are linked from the previous version
+    build_image_derivatives(image_record, previous_file_path)
     
     # --------------- UPDATE BATCH PROCESSING FLAG ---------------
     # Update batch processing flag
@@ -337,6 +375,9 @@ def recalibrate_image(image, avg_pixels, model, mode, image_id):
         batch.save()
         print(f"Batch '{batch.batch_name}' updated: all images processed")
 
+    events.publish("image", batch_id=batch.id, image_id=image_record.image_id, ok=True)
+    events.publish_batch(batch.id)
+
     print("Recalibration complete for image:", image_id)
 
 # HELPER FUNCTION TO PROCESS IMAGES
@@ -346,9 +387,15 @@ def process_images(batch, files_data, header):
     saving results to the database, and writing processed images to disk.
 
     Workflow:
-    1. Iterates through each uploaded file and creates a DB record.
-    2. Sends the image to the specified model (e.g., 'polyegg_heatmap') or uses
-       a fallback annotation method.
+    1. Iterates through each uploaded file and creates a DB record (or reuses the record
+       left by an interrupted run, images that were already processed are skipped).
+       Images already processed by the same model and mode in any batch are not sent to
+       the model again, their annotations and file are reused (see reuse_processed_image).
+    2. Sends the images to the specified model (e.g., 'polyegg_heatmap') or uses
+       a fallback annotation method. Up to INFERENCE_WORKERS requests per model are
+       made in parallel. Images of a model with a batch route are grouped by mode and sent
+       INFERENCE_BATCH_SIZE per request (see process_image_group), the others are sent
+       one per request (see process_single_image).
     3. Extracts results (egg counts, final image, annotation points) from the model response.
     4. Saves processed images locally with compression.
     5. Records annotation points in the database.
@@ -358,7 +405,7 @@ def process_images(batch, files_data, header):
         batch (BatchDetails): The database record representing this batch.
         files_data (list[dict]): List of dictionaries containing per-file metadata:
             - name (str): Original filename
-            - data (str): Base64-encoded image
+            - path (str): Staged file path relative to MEDIA_ROOT (see stage_upload)
             - model (str): Model to use for processing
             - mode (str): "micro" or "macro"
             - share (bool): Whether to share results (optional)
@@ -372,181 +419,563 @@ def process_images(batch, files_data, header):
         - Writes processed images to MEDIA_ROOT/uploads.
         - Saves annotation points to AnnotationPoints table.
         - Updates BatchDetails with total eggs, completion status, and fail flags.
+        - Removes each staged file once its image has been handled.
+
+    Notes:
+        - The function is safe to run again on the same batch (see jobs.py), file names
+          are derived from the staged file so the record of a previous run is found again.
+          Images handled by a previous run (processed, or failed with their staged file
+          removed) are skipped, so each image is counted once by record_progress.
     """
-    total_eggs = 0
     total_hatched = 0
     # bucket_name = "egglytics"
 
-    for i, file_dict in enumerate(files_data, start=0):
+    # Start of the first run, the ETA of batch_status is based on it
+    BatchDetails.objects.filter(id=batch.id, processing_started__isnull=True).update(processing_started=timezone.now())
+
+    # Create (or find again) every record first, in upload order, so the batch lists
+    # its images in the order they were uploaded no matter when each one finishes.
+    pending = []
+    for file_dict in files_data:
         try:
+            image_record = get_image_record(batch, file_dict, header)
+        except Exception as e:
+            batch.has_fail_present = True
+            print("Error while creating image record:", e)
+            discard_staged(file_dict["path"])
+            continue
+
+        if image_record.is_processed:
+            print("Already processed, skipping:", image_record.file_path)
+            discard_staged(file_dict["path"])
+            continue
+
+        # The staged file is removed once the image was handled and counted (see process_single_image),
+        # an unprocessed image without it failed in a previous run and is not counted again
+        if not os.path.exists(os.path.join(settings.MEDIA_ROOT, file_dict["path"])):
+            print("Failed in a previous run, skipping:", image_record.image_name)
+            batch.has_fail_present = True
+            continue
+
+        # Chunked uploads (see chunked_upload.finalize_upload) are hashed here instead of in the request
+        if not file_dict.get("hash"):
+            file_dict["hash"] = hash_staged(file_dict["path"])
+
+        if reuse_processed_image(image_record, file_dict):
+            record_progress(image_record, True)
+            continue
+
+        pending.append((image_record, file_dict))
+
+    # The same image uploaded twice in this batch only goes to the model once,
+    # the copies reuse its result once it is processed
+    first_seen = set()
+    copies = []
+    unique = []
+    for image_record, file_dict in pending:
+        key = (file_dict.get("hash"), file_dict["model"], file_dict["mode"])
+        if key[0] and key in first_seen:
+            copies.append((image_record, file_dict))
+        else:
+            first_seen.add(key)
+            unique.append((image_record, file_dict))
+    pending = unique
+
+    # Group images that can share a request, same model and mode, upload order kept inside a group
+    groups = {}
+    singles = []
+    for image_record, file_dict in pending:
+        routes = batch_routes(file_dict["model"])
+        if routes and inference.batch_available(*routes):
+            groups.setdefault((file_dict["model"], file_dict["mode"]), []).append((image_record, file_dict))
+        else:
+            singles.append((image_record, file_dict))
+
+    size = settings.INFERENCE_BATCH_SIZE
+    chunks = [
+        items[i:i + size]
+        for items in groups.values()
+        for i in range(0, len(items), size)
+    ]
+
+    # Requests are sent to the compute server in parallel, at most workers_for(model) per model at a time.
+    models = {file_dict["model"] for _, file_dict in pending}
+    max_workers = max(sum(inference.workers_for(m) for m in models), 1)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"batch-{batch.id}") as executor:
+        futures = [executor.submit(run_in_pool_thread, process_image_group, items) for items in chunks]
+        futures += [
+            executor.submit(run_in_pool_thread, process_single_image, image_record, file_dict)
+            for image_record, file_dict in singles
+        ]
+        for future in as_completed(futures):
+            if not future.result():
+                batch.has_fail_present = True
 
-            # Params:
-            # File name (STRING) ->  The name of the file saved on media/uploads\
-            # image_name (STRING) -> The name of the image 
-            # encoded (STRING) -> Image in base64
-            # mode (Binary STRING) -> If Micro or Macro
-                # Force JPEG output (smaller)
-            file_name = f"{header}_{uuid.uuid4().hex}"
-            image_name = f"image_{file_name}.jpg"
-            encoded = file_dict["data"]
-
-            model = file_dict["model"]
-            mode = file_dict["mode"]
-
-            # Create DB record
-            image_record = ImageDetails.objects.create(
-                batch = batch,
-                image_name = image_name,
-                file_path = image_name,
-                total_eggs = 0,
-                total_hatched = 0,
-                img_type = mode,
-                is_processed = False,
-                is_validated = False,
-                model_used = model
-            )
+    # Copies whose original failed are processed on their own
+    for image_record, file_dict in copies:
+        if reuse_processed_image(image_record, file_dict):
+            record_progress(image_record, True)
+        elif not process_single_image(image_record, file_dict):
+            batch.has_fail_present = True
 
-            payload = {'image': encoded,'mode': mode}
-
-            response = None
-            data = None
-            status_code = None
-
-            match model:
-                case "polyegg_heatmap":
-                    response = requests.post(
-                        "http://127.0.0.1:5000/upload_base64",
-                        json=payload,
-                        timeout=300
-                    )
-                    data = response.json()
-                    status_code = response.status_code
-
-                case "free_annotate":
-                    data = {
-                        "status": "complete",
-                        "points": [],
-                        "final_image": encoded,
-                        "egg_count": 0
-                    }
-                    status_code = 200
-                case "my_model":
-                    response = requests.post(
-                        "http://127.0.0.1:5000/my_method_name",
-                        json=payload,
-                        timeout=300
-                    )
-                    data = response.json()
-                    status_code = response.status_code
-
-            # Extract result data
-            # Just put has fail present if something goes wrong
-            if status_code != 200 or data.get("status") != "complete":
-                batch.has_fail_present = True
-                data = {
-                    "status": "complete",
-                    "points": [],
-                    "final_image": encoded,
-                    "egg_count": 0
-                }
-
-            points = data.get("points", [])
-            rects = data.get("rectangles", [])
-            polygons = data.get("polygons", [])
-
-            image_b64 = data.get("final_image")
-            temp_eggs = data.get("egg_count", 0)
-            
-            total_eggs += temp_eggs
-            image_record.total_eggs = temp_eggs
-            image_record.is_processed = True
-            image_record.save()
-            
-            if image_b64:
-                # Remove header if present
-                if "," in image_b64:
-                    image_b64 = image_b64.split(",")[1]
-
-                # Decode base64
-                img_data = base64.b64decode(image_b64)
-
-                # Open with Pillow
-                image = Image.open(BytesIO(img_data))
-
-                # Keep original resolution
-                print("Resolution:", image.size)
-
-                # Convert to RGB if needed (PNG with alpha → JPEG compatible)
-                if image.mode in ("RGBA", "P"):
-                    image = image.convert("RGB")
-
-                # Prepare folder
-                upload_dir = os.path.join(settings.MEDIA_ROOT, "uploads")
-                os.makedirs(upload_dir, exist_ok=True)
-
-                file_path = os.path.join(upload_dir, image_name)
-
-                # SAVE WITH COMPRESSION
-                image.save(
-                    file_path,
-                    format="JPEG",
-                    quality=70,       # sweet spot
-                    optimize=True,
-                    progressive=True
-                )
-
-                print("Saved:", file_path)
-                print("New size (KB):", os.path.getsize(file_path) / 1024)
-
-            #  Save annotation points to DB
-            if points:
-                print(f"[DEBUGGER] Saving {len(points)} annotation points...")
-                for p in points:
-                    AnnotationPoints.objects.create(
-                        image=image_record,
-                        x=p[0],
-                        y=p[1],
-                        is_original=True
-                    )
-
-            if rects:
-                for r in rects:
-                    AnnotationRect.objects.create(
-                        image=image_record,
-                        x_init=r[0],
-                        y_init=r[1],
-                        x_end=r[2],
-                        y_end=r[3],
-                        is_original=True
-                    )
-
-            if polygons:
-                for poly in polygons:
-
-                    polygon_record = AnnotationPolygon.objects.create(
-                        image=image_record,
-                        is_original=True
-                    )
-
-                    points_to_create = [
-                        AnnotationPolygonPoint(
-                            polygon=polygon_record,
-                            x=p[0],
-                            y=p[1],
-                            order_index=i
-                        )
-                        for i, p in enumerate(poly)
-                    ]
-
-                    AnnotationPolygonPoint.objects.bulk_create(points_to_create)
-            
+    # Update batch summary
+    with transaction.atomic():
+        # Summed from the records so images of an interrupted run are counted too,
+        # the running totals move by whatever record_progress did not count
+        counted_eggs = BatchDetails.objects.select_for_update().values_list("total_eggs", flat=True).get(id=batch.id)
+        total_eggs = ImageDetails.objects.filter(batch=batch).aggregate(total=Sum("total_eggs"))["total"] or 0
+        totals.add(owner=batch.owner, eggs=total_eggs - counted_eggs)
+
+        batch.total_eggs = total_eggs
+        batch.total_hatched = total_hatched
+        batch.is_complete = True
+        # images_processed and images_failed are only ever changed with F() (see record_progress),
+        # they count every handled image, failures included, the copies held here are stale
+        batch.save(update_fields=[
+            "total_eggs", "total_hatched", "is_complete", "has_fail_present", "date_updated"
+        ])
+
+    events.publish_batch(batch.id)
+
+def record_progress(image_record, ok):
+    """
+    Counts a finished image on its batch, so batch_status can report progress while the batch runs.
+
+    Uses F() expressions, images finishing in parallel threads never overwrite each other.
+
+    Args:
+        image_record (ImageDetails): The image that was just handled.
+        ok (bool): False if the model failed on it (fallback stored or not processed at all).
+
+    Returns:
+        None
+    """
+    eggs = image_record.total_eggs if image_record.is_processed else 0
+    owner = image_record.batch.owner if eggs else None
+    with transaction.atomic():
+        BatchDetails.objects.filter(id=image_record.batch_id).update(
+            images_processed=F("images_processed") + 1,
+            images_failed=F("images_failed") + (0 if ok else 1),
+            total_eggs=F("total_eggs") + eggs,
+            date_updated=timezone.now()
+        )
+        totals.add(owner=owner, eggs=eggs)
+
+    events.publish("image", batch_id=image_record.batch_id, image_id=image_record.image_id, ok=ok)
+    events.publish_batch(image_record.batch_id)
+
+def get_image_record(batch, file_dict, header):
+    """
+    Returns the ImageDetails record of an uploaded file, creating it if needed.
+
+    The image name is derived from the staged file, so running process_images again on the
+    same batch finds the record created by the previous run instead of creating a duplicate.
+    The file_path of a new record is a fresh folder of the sharded layout (see storage.py).
+
+    Args:
+        batch (BatchDetails): Batch of the file.
+        file_dict (dict): Per-file metadata (see process_images).
+        header (str): Prefix to use for generated filenames.
+
+    Returns:
+        ImageDetails: The existing or newly created record.
+    """
+    # Params:
+    # image_name (STRING) -> The name of the image (the file itself goes to its own folder, see storage.py)
+    # mode (Binary STRING) -> If Micro or Macro
+        # Force JPEG output (smaller)
+    staged_key = os.path.splitext(os.path.basename(file_dict["path"]))[0]
+    file_name = f"{header}_{staged_key}"
+    image_name = f"image_{file_name}.jpg"
+
+    # Reuse the record of an interrupted run (file_path changes when the image reused another upload)
+    image_record = ImageDetails.objects.filter(batch=batch, image_name=image_name).first()
+    if image_record:
+        return image_record
+
+    with transaction.atomic():
+        image_record = ImageDetails.objects.create(
+            batch = batch,
+            image_name = image_name,
+            file_path = storage.new_file_path(),
+            total_eggs = 0,
+            total_hatched = 0,
+            img_type = file_dict["mode"],
+            is_processed = False,
+            is_validated = False,
+            model_used = file_dict["model"]
+        )
+        totals.add(model=image_record.model_used, images=1)
+    return image_record
+
+def run_in_pool_thread(fn, *args):
+    """
+    Runs fn on a thread of the pool of process_images, then closes the database connection
+    that thread opened. The job worker's own connection is left open.
+
+    Args:
+        fn (callable): process_single_image or process_image_group.
+        *args: Arguments of fn.
+
+    Returns:
+        The result of fn.
+    """
+    try:
+        return fn(*args)
+    finally:
+        connection.close()
+
+def process_single_image(image_record, file_dict):
+    """
+    Runs inference on one staged image and stores its results.
+
+    Called from the thread pool of process_images, so it only writes to its own image
+    record and reports failures through its return value instead of touching the batch.
+
+    Args:
+        image_record (ImageDetails): Record created by get_image_record.
+        file_dict (dict): Per-file metadata (see process_images).
+
+    Returns:
+        bool: False if the model failed and the fallback (no annotations) was stored,
+              or if the image could not be processed at all.
+    """
+    ok = True
+    try:
+        # staged_path (STRING) -> Image on disk, only read by the transport (one image per worker in memory)
+        model = file_dict["model"]
+        mode = file_dict["mode"]
+        staged_path = os.path.join(settings.MEDIA_ROOT, file_dict["path"])
+
+        params = {'mode': mode}
 
+        data = None
+        status_code = None
+
+        # json method -> image as base64 inside JSON, binary method -> raw image bytes (see INFERENCE_TRANSPORT)
+        match model:
+            case "polyegg_heatmap":
+                with inference.model_slot(model):
+                    status_code, data = inference.infer("upload_base64", "upload_binary", staged_path, params)
+
+            case "free_annotate":
+                data = inference.fallback_result(staged_path)
+                status_code = 200
+            case "my_model":
+                with inference.model_slot(model):
+                    status_code, data = inference.infer("my_method_name", None, staged_path, params)
+
+        # Extract result data
+        # Just put has fail present if something goes wrong
+        if status_code != 200 or not data or data["status"] != "complete":
+            ok = False
+            data = inference.fallback_result(staged_path)
+
+        store_result(image_record, data, file_dict.get("hash") if ok else None)
+
+    except Exception as e:
+        ok = False
+        print("Error while processing image:", e)
+
+    finally:
+        discard_staged(file_dict["path"])
+        try:
+            record_progress(image_record, ok)
         except Exception as e:
-            batch.has_fail_present = True
+            print("Could not record progress:", e)
+
+    return ok
+
+def batch_routes(model):
+    """
+    Batch routes of a model on the compute server (see inference.infer_batch).
+
+    Args:
+        model (str): Model name (the "value" in ModelConfig.js).
+
+    Returns:
+        tuple[str, str | None] | None: (JSON route, binary route), None if the model
+                                       only takes one image per request.
+    """
+    match model:
+        case "polyegg_heatmap":
+            return ("upload_batch_base64", "upload_batch_binary")
+    return None
+
+def process_image_group(items):
+    """
+    Runs inference on several staged images of the same model and mode in one request
+    and stores the result of each image.
+
+    If the whole request fails, every image is sent again on its own (see process_single_image),
+    so only the images the model really fails on end up with the fallback.
+
+    Args:
+        items (list[tuple[ImageDetails, dict]]): Records and per-file metadata (see process_images),
+                                                 all with the same model and mode.
+
+    Returns:
+        bool: False if at least one image of the group failed.
+    """
+    model = items[0][1]["model"]
+    mode = items[0][1]["mode"]
+    staged_paths = [os.path.join(settings.MEDIA_ROOT, file_dict["path"]) for _, file_dict in items]
+
+    status_code = None
+    results = None
+    try:
+        with inference.model_slot(model):
+            status_code, results = inference.infer_batch(*batch_routes(model), staged_paths, {'mode': mode})
+    except Exception as e:
+        print("Error while sending image group:", e)
+
+    if status_code != 200 or results is None:
+        print(f"Group of {len(items)} images failed ({status_code}), sending them one by one")
+        ok = True
+        for image_record, file_dict in items:
+            if not process_single_image(image_record, file_dict):
+                ok = False
+        return ok
+
+    ok = True
+    for (image_record, file_dict), staged_path, data in zip(items, staged_paths, results):
+        image_ok = True
+        try:
+            if not data or data["status"] != "complete":
+                image_ok = False
+                store_result(image_record, inference.fallback_result(staged_path))
+            else:
+                store_result(image_record, data, file_dict.get("hash"))
+
+        except Exception as e:
+            image_ok = False
             print("Error while processing image:", e)
 
-    # Update batch summary
-    batch.total_eggs = total_eggs
-    batch.total_hatched = total_hatched
-    batch.is_complete = True
-    batch.save()
\ No newline at end of file
+        finally:
+            discard_staged(file_dict["path"])
+            try:
+                record_progress(image_record, image_ok)
+            except Exception as e:
+                print("Could not record progress:", e)
+
+        ok = ok and image_ok
+
+    return ok
+
+def store_result(image_record, data, content_hash=None):
+    """
+    Writes the final image of an inference result to disk and its annotations to the database,
+    then marks the image as processed.
+
+    Args:
+        image_record (ImageDetails): Record created by get_image_record.
+        data (dict): Result in the format of inference.infer.
+        content_hash (str, optional): SHA-256 of the upload, only given when the model succeeded
+                                      so later uploads of the same image can reuse this result.
+
+    Returns:
+        None
+    """
+    image_name = image_record.file_path
+
+    points = data["points"]
+    rects = data["rectangles"]
+    polygons = data["polygons"]
+
+    img_data = data["image_bytes"]
+    temp_eggs = data["egg_count"]
+
+    if img_data:
+        file_path = storage.prepare_upload_path(image_name)
+        save_final_image(img_data, file_path)
+
+    # Annotations and the processed flag are committed together, an interrupted image
+    # has no annotations left behind and is processed again on resume
+    with transaction.atomic():
+        #  Save annotation points to DB
+        bulk_create_annotations(image_record, points=points, rects=rects, polygons=polygons)
+
+        # The batch side is counted by record_progress
+        totals.add(model=image_record.model_used, eggs=temp_eggs - image_record.total_eggs)
+        image_record.total_eggs = temp_eggs
+        image_record.content_hash = content_hash
+        image_record.is_processed = True
+        image_record.save()
+
+    build_image_derivatives(image_record)
+
+def build_image_derivatives(image_record, previous_file_path=None):
+    """
+    Builds everything the editor shows for the current version of an image: its preview and,
+    for huge images, its tile pyramid. Runs after the image is stored or recalibrated, so
+    opening the editor never decodes the image.
+
+    Args:
+        image_record (ImageDetails): The image, with its final file_path and image_version.
+        previous_file_path (str, optional): See build_image_tiles.
+
+    Returns:
+        None
+    """
+    build_image_preview(image_record)
+    build_image_tiles(image_record, previous_file_path)
+
+def build_image_preview(image_record):
+    """
+    Builds the low quality preview of the current version of an image (see imaging.build_preview).
+
+    A failure is only logged, the editor then loads the full image directly.
+
+    Args:
+        image_record (ImageDetails): The image, with its final file_path and image_version.
+
+    Returns:
+        None
+    """
+    image_path = storage.upload_path(image_record.file_path)
+    if os.path.exists(imaging.preview_path(image_path, image_record.image_version)):
+        return
+
+    try:
+        size = imaging.build_preview(
+            image_path,
+            image_record.image_version,
+            quality=settings.PREVIEW_JPEG_QUALITY,
+            processes=settings.IMAGE_ENCODE_PROCESSES,
+        )
+        print(f"Preview of {image_record.file_path} v{image_record.image_version}: {size / 1024:.0f} KB")
+
+    except Exception as e:
+        print("Could not build preview:", e)
+
+def build_image_tiles(image_record, previous_file_path=None):
+    """
+    Builds the Deep Zoom tile pyramid of the current version of a huge image (see imaging.build_tiles).
+
+    Images smaller than TILE_MIN_PIXELS are skipped, the editor loads them whole.
+    A failure is only logged, the editor then falls back to the preview image.
+
+    Args:
+        image_record (ImageDetails): The image, with its final file_path and image_version.
+        previous_file_path (str, optional): file_path of the previous version when it changed
+                                            (see recalibrate_image), its tiles are reused.
+
+    Returns:
+        None
+    """
+    if settings.TILE_MIN_PIXELS <= 0:
+        return
+
+    image_path = storage.upload_path(image_record.file_path)
+    previous_image_path = None
+    if previous_file_path and previous_file_path != image_record.file_path:
+        previous_image_path = storage.upload_path(previous_file_path)
+
+    try:
+        if imaging.image_pixels(image_path) < settings.TILE_MIN_PIXELS:
+            return
+
+        result = imaging.build_tiles(
+            image_path,
+            image_record.image_version,
+            tile_size=settings.TILE_SIZE,
+            overlap=settings.TILE_OVERLAP,
+            quality=settings.TILE_JPEG_QUALITY,
+            previous_image_path=previous_image_path,
+            processes=settings.IMAGE_ENCODE_PROCESSES,
+        )
+        print(f"Tiles of {image_record.file_path} v{image_record.image_version}: {result['tiles']} written, {result['reused']} reused")
+
+    except Exception as e:
+        print("Could not build tiles:", e)
+
+def save_final_image(img_data, file_path):
+    """
+    Writes the final image of an inference to disk (see imaging.save_image).
+
+    JPEGs of an acceptable quality are written as they are, other images are re-encoded
+    with the IMAGE_JPEG_* settings in the process pool.
+
+    Args:
+        img_data (bytes | memoryview): Encoded image returned by the compute server.
+        file_path (str): Absolute destination path.
+
+    Returns:
+        None
+    """
+    stored_as_is = imaging.save_image(
+        img_data,
+        file_path,
+        quality=settings.IMAGE_JPEG_QUALITY,
+        optimize=settings.IMAGE_JPEG_OPTIMIZE,
+        progressive=settings.IMAGE_JPEG_PROGRESSIVE,
+        max_stored_quality=settings.IMAGE_STORE_MAX_QUALITY,
+        processes=settings.IMAGE_ENCODE_PROCESSES,
+    )
+
+    print("Saved:", file_path, "(as is)" if stored_as_is else "(re-encoded)")
+    print("New size (KB):", os.path.getsize(file_path) / 1024)
+
+def reuse_processed_image(image_record, file_dict):
+    """
+    Completes an image from an earlier upload of the same bytes instead of calling the model.
+
+    The earlier image must have been processed successfully with the same model and mode.
+    Its original (model) annotations are copied and its file on disk is shared, reviewer
+    edits of the earlier image are not copied.
+
+    Args:
+        image_record (ImageDetails): Record created by get_image_record.
+        file_dict (dict): Per-file metadata (see process_images).
+
+    Returns:
+        bool: True if the image was completed, False if it must go to the model.
+    """
+    content_hash = file_dict.get("hash")
+    if not content_hash:
+        return False
+
+    with transaction.atomic():
+        # Locked so the source cannot be deleted (with its file) before this record references the file
+        source = (
+            ImageDetails.objects
+            .select_for_update()
+            .filter(
+                content_hash=content_hash,
+                model_used=file_dict["model"],
+                img_type=file_dict["mode"],
+                is_processed=True,
+            )
+            .exclude(image_id=image_record.image_id)
+            .order_by("image_id")
+            .first()
+        )
+        if source is None:
+            return False
+
+        if not os.path.exists(storage.upload_path(source.file_path)):
+            return False
+
+        points = model_points(source)
+        rects = list(
+            AnnotationRect.objects.filter(image=source, is_original=True)
+            .values_list("x_init", "y_init", "x_end", "y_end")
+        )
+        polygons = [
+            [(v.x, v.y) for v in poly.points.all()]
+            for poly in AnnotationPolygon.objects.filter(image=source, is_original=True).prefetch_related("points")
+        ]
+        bulk_create_annotations(image_record, points=points, rects=rects, polygons=polygons)
+
+        image_record.file_path = source.file_path
+        # The count of the source (the egg_count of the model), not the number of annotations copied
+        totals.add(model=image_record.model_used, eggs=source.total_eggs - image_record.total_eggs)
+        image_record.total_eggs = source.total_eggs
+        image_record.content_hash = content_hash
+        image_record.is_processed = True
+        image_record.save()
+
+    print(f"Reused image {source.image_id} for {image_record.image_name}")
+    discard_staged(file_dict["path"])
+    return True
@@ -9,102 +9,402 @@
 #
 
 from ._imports import *
+from . import imaging
+from . import storage
+from . import totals
+from . import events
+from . import grids
+from .jobs import enqueue_job
+from datetime import timezone as dt_timezone
+from django.views.decorators.http import condition
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Q
+from django.http import HttpResponseNotModified
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags, quote_etag
+from django.urls import reverse
+from datetime import timedelta
+import hashlib
 
 # This is where user can see what was uploaded..
 def view(request):
     """
     Render the main batch overview page.
 
-    Displays all batches sorted by most recently updated, along with
-    aggregate totals across all batches.
+    The batches themselves are loaded one page at a time from batch_list.
 
     Args:
         request: GET request
 
     Returns:
-        Rendered response with template "view.html" and context:
-            - batches (QuerySet): All BatchDetails with prefetched images, newest first
-            - total_images (int): Sum of total_images across all batches
-            - total_eggs (int): Sum of total_eggs across all batches
-    """
-    # Get batches, sorted by date_updated descending
-    batches = (
-        BatchDetails.objects
-        .prefetch_related("imagedetails_set")
-        .order_by("-date_updated")
-    )
-
-    totals = BatchDetails.objects.aggregate(
-        total_images=Sum("total_images"),
-        total_eggs=Sum("total_eggs"),
-    )
-
-
+        Rendered response with template "view.html"
+    """
     return render(
         request,
         "base.html",
         {
             "included_template": "view.html",
-            "batches": batches,
             "MEDIA_URL": settings.MEDIA_URL,
-            "total_images": totals["total_images"] or 0,
-            "total_eggs": totals["total_eggs"] or 0,
+            "page_sizes": BATCH_PAGE_SIZES,
         }
     )
 
+# Columns batch_list can sort by, each followed by id so the order (and the cursor) is unique
+BATCH_SORTS = {
+    "batch_name": ["batch_name"],
+    "owner": ["owner"],
+    "date_updated": ["date_updated"],
+    "total_images": ["total_images"],
+    "total_eggs": ["total_eggs"],
+    "status": ["is_complete", "has_fail_present"],
+}
+BATCH_PAGE_SIZES = [5, 10, 25, 50]
+BATCH_LIST_FIELDS = (
+    "id", "batch_name", "date_updated", "owner", "total_images", "total_eggs",
+    "is_complete", "has_fail_present", "images_processed", "images_failed",
+)
+# Query params of filter_batches, without any of them the sums come from the running totals
+BATCH_FILTER_PARAMS = (
+    "name", "owner", "date_from", "date_to", "images_min", "images_max", "eggs_min", "eggs_max", "status",
+)
+
+def batch_list(request):
+    """
+    Return one page of batches as JSON, filtered and sorted on the server.
+
+    Pages are addressed with keyset cursors instead of offsets, so every page costs
+    the same no matter how deep it is.
+
+    Args:
+        request: GET request with optional query params:
+            - sort (str): One of BATCH_SORTS (default: date_updated)
+            - order (str): "asc" or "desc" (default: desc)
+            - limit (int): Rows per page, one of BATCH_PAGE_SIZES (default: 5)
+            - after (str): next_cursor of the previous response, loads the next page
+            - before (str): prev_cursor of the previous response, loads the previous page
+            - name (str): Batch name contains (case insensitive)
+            - owner (str): Owner contains (case insensitive)
+            - date_from, date_to (str): YYYY-MM-DD bounds of date_updated (inclusive)
+            - images_min, images_max (int): Bounds of total_images
+            - eggs_min, eggs_max (int): Bounds of total_eggs
+            - status (str): "complete", "failed" or "processing"
+
+    Returns:
+        JsonResponse: {
+            "batches" (list[dict]): Rows of the page,
+            "next_cursor" (str | None): None on the last page,
+            "prev_cursor" (str | None): None on the first page,
+            "count" (int): Batches matching the filters,
+            "total_images" (int), "total_eggs" (int): Sums over the batches matching the filters,
+        }
+        Without filters, count and sums are read from the running totals (see totals.py).
+        JsonResponse: {"error": str} with status 400 for an invalid sort or cursor
+    """
+    sort = request.GET.get("sort", "date_updated")
+    if sort not in BATCH_SORTS:
+        return JsonResponse({"error": f"Cannot sort by {sort}"}, status=400)
+    descending = request.GET.get("order", "desc") != "asc"
+
+    try:
+        limit = int(request.GET.get("limit", BATCH_PAGE_SIZES[0]))
+    except ValueError:
+        limit = BATCH_PAGE_SIZES[0]
+    limit = min(max(limit, 1), BATCH_PAGE_SIZES[-1])
+
+    batches = filter_batches(BatchDetails.objects.all(), request.GET)
+    if any(request.GET.get(param) for param in BATCH_FILTER_PARAMS):
+        summary = batches.aggregate(count=Count("id"), total_images=Sum("total_images"), total_eggs=Sum("total_eggs"))
+    else:
+        running = totals.get_totals()
+        summary = {"count": running["batches"], "total_images": running["images"], "total_eggs": running["eggs"]}
+
+    fields = BATCH_SORTS[sort] + ["id"]
+    after = request.GET.get("after")
+    before = request.GET.get("before")
+    try:
+        cursor = decode_cursor(after or before, fields) if (after or before) else None
+    except ValueError:
+        return JsonResponse({"error": "Invalid cursor"}, status=400)
+
+    # A previous page is read backwards from its cursor, then flipped
+    backwards = bool(before) and not after
+    forward = descending != backwards
+    if cursor:
+        batches = batches.filter(keyset_filter(fields, cursor, descending=forward))
+    batches = batches.order_by(*[f"-{f}" if forward else f for f in fields])
+
+    rows = list(batches.values(*BATCH_LIST_FIELDS)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+
+    for row in rows:
+        row["date_display"] = timezone.localtime(row["date_updated"]).strftime("%m/%d/%Y")
+
+    has_next = has_more if not backwards else True
+    has_prev = has_more if backwards else bool(cursor)
+    return JsonResponse({
+        "batches": rows,
+        "next_cursor": encode_cursor(rows[-1], fields) if rows and has_next else None,
+        "prev_cursor": encode_cursor(rows[0], fields) if rows and has_prev else None,
+        "count": summary["count"],
+        "total_images": summary["total_images"] or 0,
+        "total_eggs": summary["total_eggs"] or 0,
+    })
+
+def filter_batches(batches, params):
+    """
+    Apply the filters of batch_list.
+
+    Args:
+        batches (QuerySet[BatchDetails]): Batches to filter.
+        params (QueryDict): Query params of the request (see batch_list).
+
+    Returns:
+        QuerySet[BatchDetails]: The filtered batches.
+    """
+    if params.get("name"):
+        batches = batches.filter(batch_name__icontains=params["name"])
+    if params.get("owner"):
+        batches = batches.filter(owner__icontains=params["owner"])
+
+    # Whole days in the server time zone, as datetime bounds so the date_updated index is used
+    date_from = parse_date(params.get("date_from") or "")
+    date_to = parse_date(params.get("date_to") or "")
+    if date_from:
+        batches = batches.filter(date_updated__gte=timezone.make_aware(datetime.combine(date_from, datetime.min.time())))
+    if date_to:
+        batches = batches.filter(date_updated__lt=timezone.make_aware(datetime.combine(date_to + timedelta(days=1), datetime.min.time())))
+
+    for field, key in (("total_images", "images"), ("total_eggs", "eggs")):
+        for bound, lookup in (("min", "gte"), ("max", "lte")):
+            value = params.get(f"{key}_{bound}")
+            if value not in (None, ""):
+                try:
+                    batches = batches.filter(**{f"{field}__{lookup}": int(float(value))})
+                except ValueError:
+                    pass
+
+    status = params.get("status")
+    if status == "complete":
+        batches = batches.filter(is_complete=True, has_fail_present=False)
+    elif status == "failed":
+        batches = batches.filter(has_fail_present=True)
+    elif status == "processing":
+        batches = batches.filter(is_complete=False, has_fail_present=False)
+
+    return batches
+
+def keyset_filter(fields, values, descending):
+    """
+    Rows strictly after a cursor in the order of fields, i.e. (f1, f2, ...) > (v1, v2, ...)
+    (or < when descending) written as a Q so it works on any database.
+
+    Args:
+        fields (list[str]): Sort fields, the last one unique.
+        values (list): Values of the cursor row for those fields.
+        descending (bool): Direction of the order.
+
+    Returns:
+        Q: The condition.
+    """
+    lookup = "lt" if descending else "gt"
+    condition = Q()
+    for i, field in enumerate(fields):
+        step = Q(**{f"{field}__{lookup}": values[i]})
+        for previous, value in zip(fields[:i], values[:i]):
+            step &= Q(**{previous: value})
+        condition |= step
+    return condition
+
+def encode_cursor(row, fields):
+    """
+    Opaque cursor of a row of batch_list.
+
+    Args:
+        row (dict): The row.
+        fields (list[str]): Sort fields of the page.
+
+    Returns:
+        str: URL safe base64 of the JSON values.
+    """
+    values = [row[f].isoformat() if isinstance(row[f], datetime) else row[f] for f in fields]
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor, fields):
+    """
+    Reverses encode_cursor.
+
+    Args:
+        cursor (str): The cursor.
+        fields (list[str]): Sort fields of the page, the cursor must have one value per field.
+
+    Returns:
+        list: Values converted back to the field types.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise ValueError("Invalid cursor")
+
+    try:
+        return [BatchDetails._meta.get_field(f).to_python(v) for f, v in zip(fields, values)]
+    except ValidationError as e:
+        raise ValueError("Invalid cursor") from e
+
+# Image rows of the batch popup, read one page at a time by image_id
+BATCH_IMAGES_PAGE_SIZE = 50
+BATCH_IMAGES_MAX_PAGE_SIZE = 200
+BATCH_IMAGES_FIELDS = (
+    "image_id", "image_name", "file_path", "total_eggs", "img_type", "total_hatched", "is_processed",
+)
+# Size of the preview shown next to the image list of the popup
+POPUP_THUMBNAIL_SIZE = (800, 600)
+
+def _batch_images_summary(request, batch_id):
+    """
+    Count, egg sums and latest last_update of the images of a batch, read once per request.
+    """
+    if not hasattr(request, "_batch_images_summary"):
+        request._batch_images_summary = ImageDetails.objects.filter(batch_id=batch_id).aggregate(
+            count=Count("image_id"),
+            total_eggs=Sum("total_eggs"),
+            total_hatched=Sum("total_hatched"),
+            latest=Max("last_update"),
+        )
+    return request._batch_images_summary
+
+
+def _batch_images_etag(request, batch_id):
+    # Any change of an image moves its last_update, a deletion changes the count
+    summary = _batch_images_summary(request, batch_id)
+    latest = summary["latest"].timestamp() if summary["latest"] else 0
+    page = f"{request.GET.get('after', '')}-{request.GET.get('limit', '')}"
+    return f'"{batch_id}-{summary["count"]}-{latest}-{page}"'
+
+
+@condition(etag_func=_batch_images_etag)
 def batch_images(request, batch_id):
     """
-    Return all images belonging to a batch as JSON.
+    Return one page of the images of a batch as JSON, for the batch popup.
+
+    The browser revalidates the page with its ETag (derived from the latest last_update
+    of the batch's images), reopening an unchanged batch costs a 304.
 
     Args:
-        request: GET request
+        request: GET request with optional query params:
+            - after (int): next_after of the previous page, loads the next page
+            - limit (int): Images per page (default: 50, at most 200)
         batch_id (int): PK of the target BatchDetails record
 
     Returns:
-        JsonResponse: List of image dicts, each containing:
-            - image_id, image_name, image_path, image_url,
-              total_eggs, img_type, total_hatched, is_processed
+        JsonResponse: {
+            "images" (list[dict]): image_id, image_name, image_path, thumbnail_url,
+                                   total_eggs, img_type, total_hatched, is_processed,
+            "next_after" (int | None): None on the last page,
+            "count" (int), "total_eggs" (int), "total_hatched" (int): Over every image of the batch,
+        }
+        HttpResponse: status 304 if the browser copy is current
     """
-    images = ImageDetails.objects.filter(batch_id=batch_id)
+    try:
+        limit = int(request.GET.get("limit", BATCH_IMAGES_PAGE_SIZE))
+    except ValueError:
+        limit = BATCH_IMAGES_PAGE_SIZE
+    limit = min(max(limit, 1), BATCH_IMAGES_MAX_PAGE_SIZE)
 
-    data = []
-
-    for img in images:
-        # If using ImageField:
-        # image_url = img.image.url
-        
-        # If using just a filename (string) stored in path:
-        image_url = f"{settings.MEDIA_URL}uploads/{img.file_path}"
-        print(image_url)
-
-        data.append({
-            "image_id": img.image_id,
-            "image_name": img.image_name,
-            "image_path": img.file_path,
-            "image_url": image_url,
-            "total_eggs": img.total_eggs,
-            "img_type": img.img_type,
-            "total_hatched": img.total_hatched,
-            "is_processed": img.is_processed
-        })
-
-    return JsonResponse(data, safe=False)
+    images = ImageDetails.objects.filter(batch_id=batch_id)
+    try:
+        if request.GET.get("after"):
+            images = images.filter(image_id__gt=int(request.GET["after"]))
+    except ValueError:
+        return JsonResponse({"error": "Invalid after"}, status=400)
+
+    rows = list(images.order_by("image_id").values(*BATCH_IMAGES_FIELDS)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    width, height = POPUP_THUMBNAIL_SIZE
+    for row in rows:
+        row["image_path"] = row.pop("file_path")
+        row["thumbnail_url"] = f"{reverse('serve_thumbnail', args=[row['image_path']])}?w={width}&h={height}"
+
+    summary = _batch_images_summary(request, batch_id)
+    response = JsonResponse({
+        "images": rows,
+        "next_after": rows[-1]["image_id"] if has_more else None,
+        "count": summary["count"],
+        "total_eggs": summary["total_eggs"] or 0,
+        "total_hatched": summary["total_hatched"] or 0,
+    })
+    response["Cache-Control"] = "private, no-cache"
+    return response
 
 def batch_status(request):
     """
-    Return status fields for all batches as JSON.
+    Return status fields of the batches still processing, and of the ones that changed since the last call.
+
+    Completed batches are only sent once, in the first response after they changed.
+    The response carries an ETag, a poll that would return the same payload gets a 304.
 
     Args:
-        request: GET request
+        request: GET request with optional query param:
+            - since (str): "since" of the previous response, without it only batches in flight are returned
 
     Returns:
-        JsonResponse: List of dicts with fields:
-            id, total_eggs, total_images, is_complete, has_fail_present
+        JsonResponse: {
+            "batches" (list[dict]): Dicts with fields
+                id, total_eggs, total_images, is_complete, has_fail_present,
+                images_processed, images_failed,
+                eta_seconds (int | None): Estimated seconds left, None if the batch is complete
+                                          or no image finished yet
+            "since" (str | None): Cursor for the next call (ISO date_updated of the latest change seen),
+                                  None while there are no batches
+        }
+        HttpResponseNotModified: If-None-Match matches the ETag of the payload
     """
-    batches = BatchDetails.objects.values(
-        "id", "total_eggs", "total_images", "is_complete","has_fail_present"
-    )
-    return JsonResponse(list(batches), safe=False)
+    since = parse_datetime(request.GET.get("since") or "")
+    if since and timezone.is_naive(since):
+        since = timezone.make_aware(since)
+
+    in_flight = Q(is_complete=False)
+    if since:
+        # date_updated is set before the transaction commits, changes committed a little late are caught by the overlap
+        overlap = timedelta(seconds=settings.BATCH_STATUS_OVERLAP_SECONDS)
+        in_flight |= Q(date_updated__gt=since - overlap)
+
+    batches = list(BatchDetails.objects.filter(in_flight).order_by("id").values(
+        *events.BATCH_STATUS_FIELDS, "date_updated"
+    ))
+
+    current = timezone.now()
+    # The first call starts the cursor at the latest change, so an idle table keeps the same payload (and ETag)
+    latest = since or BatchDetails.objects.aggregate(latest=Max("date_updated"))["latest"]
+    for batch in batches:
+        updated = batch.pop("date_updated")
+        events.batch_status_row(batch, current)
+        if latest is None or updated > latest:
+            latest = updated
+
+    body = json.dumps({
+        "batches": batches,
+        "since": latest.isoformat() if latest else None,
+    })
+
+    etag = quote_etag(hashlib.md5(body.encode()).hexdigest())
+    if etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
+    return response
 
 def batch_status_latest(request):
     """
@@ -134,22 +434,26 @@ def edit(request, image_id):
 
     if not image.is_validated:
         image.is_validated = True
-        image.save()
+        # Only the flag, a full save would write back a grid bitmap the editor may be changing
+        image.save(update_fields=["is_validated", "last_update"])
 
-    annotations = AnnotationPoints.objects.filter(image=image, is_deleted=False).values(
-        "point_id", "x", "y"
-    )
-    rectangles = AnnotationRect.objects.filter(image=image, is_deleted=False).values(
-        "rect_id", "x_init", "y_init", "x_end", "y_end"
-    )
-    grids = VerifiedGrids.objects.filter(image=image).values(
-        "x", "y"
-    )
-
-    generate_preview_image(os.path.join(settings.MEDIA_ROOT, 'uploads', image.file_path))
+    # Annotations are not part of the page, the editor requests the ones in view (see editor.annotations_in_view)
 
     base, ext = os.path.splitext(image.file_path)
-    preview_relative = f"uploads/{base}_preview{ext}"
+    image_path = storage.upload_path(image.file_path)
+
+    # Huge images are served as a tile pyramid (see upload.build_image_tiles), the viewer only loads the tiles in view
+    dzi_relative = None
+    if os.path.exists(os.path.join(imaging.tile_version_dir(image_path, image.image_version), "image.dzi")):
+        dzi_relative = f"uploads/{base}_tiles/v{image.image_version}/image.dzi"
+
+    # The preview is built when the image is stored (see upload.build_image_derivatives), this page never decodes the image
+    preview_relative = None
+    if os.path.exists(imaging.preview_path(image_path, image.image_version)):
+        preview_relative = f"uploads/{base}_preview_v{image.image_version}.jpg"
+    elif image.is_processed and os.path.exists(image_path):
+        # Images stored before previews were part of processing, the viewer loads the full image this time
+        request_derivatives(image)
 
     return render(
         request,
@@ -158,11 +462,10 @@ def edit(request, image_id):
             "included_template": "editor.html",
             "image_name": image.file_path,  # full res
             "image_preview": preview_relative,   # compressed preview
+            "image_dzi": dzi_relative,   # tile pyramid, None if the image has none
             "image_version": image.image_version,
-            "points_json": json.dumps(list(annotations)),
-            "rects_json": json.dumps(list(rectangles)),
             "total_eggs": json.dumps(image.total_eggs),
-            "grids_json": json.dumps(list(grids)),
+            "grid_json": json.dumps(grids.grid_state(image)),
             "img_id": json.dumps(image_id),
             "MEDIA_URL": settings.MEDIA_URL,
         }
@@ -203,7 +506,8 @@ def delete_batch(request, batch_id):
     """
     Permanently delete a batch, all its images, annotations, and image files on disk.
 
-    Deletes in order: image files → AnnotationPoints → ImageDetails → BatchDetails.
+    Deletes in order: AnnotationPoints → ImageDetails → BatchDetails → image files.
+    Files still used by images of other batches are kept (see remove_image_file).
 
     Args:
         request: POST request
@@ -220,24 +524,25 @@ def delete_batch(request, batch_id):
     """
     if request.method == "POST":
         try:
-            batch = BatchDetails.objects.get(id=batch_id)
-            images = ImageDetails.objects.filter(batch=batch)
+            with transaction.atomic():
+                batch = BatchDetails.objects.select_for_update().get(id=batch_id)
+                images = ImageDetails.objects.filter(batch=batch)
+                file_paths = set(images.values_list("file_path", flat=True))
+                totals.remove_batch(batch)
 
-            # DELETE IMAGE FILES FROM DISK FIRST
-            for image in images:
-                if image.file_path:  # make sure path exists in DB
-                    image_path = os.path.join(settings.MEDIA_ROOT, 'uploads', image.file_path)
-                    if os.path.exists(image_path):
-                        os.remove(image_path)
+                # Delete annotations
+                AnnotationPoints.objects.filter(image__in=images).delete()
 
-            # Delete annotations
-            AnnotationPoints.objects.filter(image__in=images).delete()
+                # Delete image records
+                images.delete()
 
-            # Delete image records
-            images.delete()
+                # Delete batch
+                batch.delete()
 
-            # Delete batch
-            batch.delete()
+            # DELETE IMAGE FILES FROM DISK LAST, once the records no longer reference them
+            for file_path in file_paths:
+                if file_path:  # make sure path exists in DB
+                    remove_image_file(file_path)
 
             return JsonResponse({"success": True})
 
@@ -270,36 +575,43 @@ def delete_image(request, image_id):
     """
     if request.method == "POST":
         try:
-            # Get the image
-            image = ImageDetails.objects.get(image_id=image_id)
-            batch = image.batch 
+            with transaction.atomic():
+                # Get the image
+                image = ImageDetails.objects.select_for_update().get(image_id=image_id)
+                batch = BatchDetails.objects.select_for_update().get(id=image.batch_id)
 
-            # Delete related annotations
-            AnnotationPoints.objects.filter(image=image).delete()
+                # Delete related annotations
+                AnnotationPoints.objects.filter(image=image).delete()
 
-            # Subtract the image's eggs from batch total
-            batch.total_eggs -= image.total_eggs
-            
-            # Delete the actual file from MEDIA_ROOT/uploads/
-            image_path = os.path.join(settings.MEDIA_ROOT, 'uploads', image.file_path)
-            if os.path.exists(image_path):
-                os.remove(image_path)
+                # Subtract the image's eggs from batch total
+                batch.total_eggs -= image.total_eggs
 
-            # Delete image
-            image.delete()
+                # Delete image
+                file_path = image.file_path
+                image.delete()
 
-            # Decrement total_images
-            batch.total_images -= 1
+                # Decrement total_images
+                batch.total_images -= 1
+                totals.add(owner=batch.owner, model=image.model_used, images=-1, eggs=-image.total_eggs)
 
-            if batch.total_images <= 0:
-                batch.delete()
+                batch_deleted = batch.total_images <= 0
+                if batch_deleted:
+                    # Whatever the batch still counted leaves the totals with it
+                    totals.remove_batch(batch)
+                    batch.delete()
+                else:
+                    batch.save()
+
+            # Delete the actual file from MEDIA_ROOT/uploads/ (unless another image shares it)
+            remove_image_file(file_path)
+
+            if batch_deleted:
                 return JsonResponse({
                     "success": True,
                     "message": "Image deleted. Batch removed because no images left.",
                     "batch_deleted": True
                 })
             else:
-                batch.save()
                 return JsonResponse({
                     "success": True,
                     "message": "Image deleted successfully.",
@@ -315,6 +627,24 @@ def delete_image(request, image_id):
     else:
         return JsonResponse({"success": False, "message": "Invalid request method."}, status=400)
     
+def remove_image_file(file_path):
+    """
+    Deletes an image file from MEDIA_ROOT/uploads/ (with its preview and tiles) once no image record references it.
+
+    Uploads of the same image share one file (see upload.reuse_processed_image),
+    so the file is only removed with the last record using it.
+
+    Args:
+        file_path (str): ImageDetails.file_path of a deleted record.
+
+    Returns:
+        bool: True if the file was removed.
+    """
+    if ImageDetails.objects.filter(file_path=file_path).exists():
+        return False
+
+    return storage.remove_stored_file(file_path)
+
 def update_hatched(request, image_id):
     """
     Update the total_hatched count for an image.
@@ -336,7 +666,7 @@ def update_hatched(request, image_id):
 
             image = ImageDetails.objects.get(image_id=image_id)
             image.total_hatched = new_value
-            image.save()
+            image.save(update_fields=["total_hatched", "last_update"])
 
             return JsonResponse({"success": True})
         except Exception as e:
@@ -369,7 +699,7 @@ def update_image_name(request, image_id):
 
             image = ImageDetails.objects.get(image_id=image_id)  # ✅ SAME MODEL
             image.image_name = new_name
-            image.save()
+            image.save(update_fields=["image_name", "last_update"])
 
             return JsonResponse({"success": True})
         except Exception as e:
@@ -378,65 +708,127 @@ def update_image_name(request, image_id):
     return JsonResponse({"success": False}, status=405)
 
 
+# Requested thumbnail sizes are clamped so arbitrary sizes cannot fill the cache
+THUMBNAIL_MIN_SIZE = 16
+THUMBNAIL_MAX_SIZE = 2048
+
+
+def _thumbnail_source(request, image_path):
+    """
+    Finds what a thumbnail is made of, once per request (used by the ETag, Last-Modified and the view).
+
+    Args:
+        request: GET request with optional query params w, h.
+        image_path (str): Relative path within MEDIA_ROOT/uploads/
+
+    Returns:
+        dict | None: {"path", "width", "height", "version", "mtime", "etag"}, None if the file does not exist.
+    """
+    if not hasattr(request, "_thumbnail_source"):
+        def size(name, default):
+            try:
+                value = int(request.GET.get(name, default))
+            except (TypeError, ValueError):
+                value = default
+            return min(max(value, THUMBNAIL_MIN_SIZE), THUMBNAIL_MAX_SIZE)
+
+        full_path = storage.upload_path(image_path)
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            source = None
+        else:
+            width = size('w', 800)
+            height = size('h', 600)
+            version = (
+                ImageDetails.objects.filter(file_path=image_path)
+                .aggregate(version=Max('image_version'))['version'] or 0
+            )
+            source = {
+                "path": full_path,
+                "width": width,
+                "height": height,
+                "version": version,
+                "mtime": datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc),
+                "etag": f'"{width}x{height}-v{version}-{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+            }
+        request._thumbnail_source = source
+    return request._thumbnail_source
+
+
+def _thumbnail_etag(request, image_path):
+    source = _thumbnail_source(request, image_path)
+    return source["etag"] if source else None
+
+
+def _thumbnail_last_modified(request, image_path):
+    source = _thumbnail_source(request, image_path)
+    return source["mtime"] if source else None
+
+
+@condition(etag_func=_thumbnail_etag, last_modified_func=_thumbnail_last_modified)
 def serve_thumbnail(request, image_path):
     """
     Serve a resized thumbnail of an uploaded image.
 
     Resizes the image to fit within the requested dimensions while
     preserving aspect ratio (LANCZOS resampling). Always returns JPEG.
+    Thumbnails are cached in THUMBNAIL_CACHE_DIR per path, size and image version,
+    and the browser revalidates them with ETag / Last-Modified (304 if unchanged).
 
     Args:
         request: GET request with optional query params:
-            - w (int): Max width in pixels (default: 800)
-            - h (int): Max height in pixels (default: 600)
+            - w (int): Max width in pixels (default: 800, clamped to 16-2048)
+            - h (int): Max height in pixels (default: 600, clamped to 16-2048)
         image_path (str): Relative path within MEDIA_ROOT/uploads/
 
     Returns:
         HttpResponse: JPEG image at quality=80
+        HttpResponse: status 304 if the browser copy is current
         HttpResponse: status 404 if file not found
         HttpResponse: status 500 on any other error
     """
-    width = int(request.GET.get('w', 800))
-    height = int(request.GET.get('h', 600))
-    
-    full_path = os.path.join(settings.MEDIA_ROOT, 'uploads', image_path)
-    
+    source = _thumbnail_source(request, image_path)
+    if source is None:
+        print(f"File not found: {image_path}")  # Debug
+        return HttpResponse(status=404)
+
+    cache_path = imaging.thumbnail_cache_path(
+        settings.THUMBNAIL_CACHE_DIR, image_path, source["width"], source["height"], source["version"]
+    )
+
     try:
-        img = Image.open(full_path)
-        img.thumbnail((width, height), Image.LANCZOS)
-        
-        buffer = BytesIO()
-        img.save(buffer, format='JPEG', quality=80, optimize=True)
-        buffer.seek(0)
-        
-        return HttpResponse(buffer, content_type='image/jpeg')
+        data = imaging.read_cached(cache_path)
+        if data is None:
+            data = imaging.render_thumbnail(source["path"], source["width"], source["height"], quality=80)
+            imaging.store_cached(settings.THUMBNAIL_CACHE_DIR, cache_path, data, settings.THUMBNAIL_CACHE_MAX_BYTES)
     except FileNotFoundError:
-        print(f"File not found: {full_path}")  # Debug
+        print(f"File not found: {source['path']}")  # Debug
         return HttpResponse(status=404)
     except Exception as e:
         print(f"Error serving thumbnail: {e}")  # Debug
         return HttpResponse(status=500)
 
-def generate_preview_image(original_path, quality=20):
+    response = HttpResponse(data, content_type='image/jpeg')
+    # The browser keeps the thumbnail but asks again (cheap 304) in case the image was recalibrated
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+def request_derivatives(image):
     """
-    Create a compressed preview image for fast loading.
+    Queues a BUILD_DERIVATIVES job for an image that has no preview for its current version,
+    unless one is already waiting.
 
     Args:
-        original_path (str): Full path to the original image
-        quality (int): JPEG quality for compression (1-95)
+        image (ImageDetails): The image.
 
     Returns:
-        str: Path to the compressed preview image
+        None
     """
-    base, ext = os.path.splitext(original_path)
-    preview_path = f"{base}_preview{ext}"
-
-    if os.path.exists(preview_path):
-        print("This image exist!")
-        return preview_path
-
-    with Image.open(original_path) as img:
-        img.save(preview_path, optimize=True, quality=quality)
-
-    print(preview_path)
-    return preview_path
\ No newline at end of file
+    pending = ProcessingJob.objects.filter(
+        kind="BUILD_DERIVATIVES",
+        status__in=["PENDING", "RUNNING"],
+        payload__image_id=image.image_id,
+    )
+    if not pending.exists():
+        enqueue_job("BUILD_DERIVATIVES", {"image_id": image.image_id})
@@ -0,0 +1,164 @@
+#
+#
+# LOCAL STAND-IN FOR THE COMPUTE SERVER
+#
+# Answers the routes egglytics/views/inference.py calls, without any model, so both transports
+# can be tried end to end on one machine:
+#   upload_binary, recalibrate_binary      raw image -> result frame (see egglytics/views/frames.py)
+#   upload_batch_binary                    batch frame of raw images -> batch frame of result frames
+#   upload_base64, recalibrate_base64      {"image": base64, ...} -> JSON result
+#   upload_batch_base64                    {"images": [base64, ...], ...} -> {"results": [...]}
+#
+# Every image gets the same fake detections: STUB_EGGS points on its diagonal and one rectangle
+# and one polygon around the first point. The image is sent back unchanged as the final image.
+#
+#   python inference_stub.py [--port 5000]
+#   INFERENCE_URL=http://127.0.0.1:5000 INFERENCE_TRANSPORT=binary python run_waitress.py
+#
+#
+
+import argparse
+import base64
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from PIL import Image
+
+from egglytics.views.frames import (
+    FRAME_CONTENT_TYPE, encode_result_frame, encode_batch_frame, decode_batch_frame
+)
+
+# Points found on every image
+STUB_EGGS = 3
+
+
+def fake_result(image_bytes):
+    """
+    Detections of the stub for one image.
+
+    Args:
+        image_bytes (bytes): The image as uploaded.
+
+    Returns:
+        dict: {"status", "egg_count", "points", "rectangles", "polygons"}, status "failed" if the
+              bytes are not an image.
+    """
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            width, height = image.size
+    except Exception:
+        return {"status": "failed", "egg_count": 0, "points": [], "rectangles": [], "polygons": []}
+
+    points = [
+        [width * (i + 1) // (STUB_EGGS + 1), height * (i + 1) // (STUB_EGGS + 1)]
+        for i in range(STUB_EGGS)
+    ]
+    x, y = points[0]
+    return {
+        "status": "complete",
+        "egg_count": len(points),
+        "points": points,
+        "rectangles": [[x - 5, y - 5, x + 5, y + 5]],
+        "polygons": [[[x - 5, y - 5], [x + 5, y - 5], [x, y + 5]]],
+    }
+
+
+def result_frame(image_bytes):
+    """
+    Result frame of the binary routes for one image.
+    """
+    result = fake_result(bytes(image_bytes))
+    return encode_result_frame(
+        result["status"],
+        result["egg_count"],
+        image_bytes=image_bytes if result["status"] == "complete" else b"",
+        points=result["points"],
+        rectangles=result["rectangles"],
+        polygons=result["polygons"],
+    )
+
+
+def json_result(image_b64):
+    """
+    JSON answer of the base64 routes for one image.
+    """
+    result = fake_result(base64.b64decode(image_b64))
+    result["final_image"] = image_b64 if result["status"] == "complete" else ""
+    return result
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        route = urlsplit(self.path).path.strip("/")
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        try:
+            if route in ("upload_binary", "recalibrate_binary"):
+                self.answer(200, result_frame(body), FRAME_CONTENT_TYPE)
+            elif route == "upload_batch_binary":
+                frames = [result_frame(part) for part in decode_batch_frame(body)]
+                self.answer(200, encode_batch_frame(frames), FRAME_CONTENT_TYPE)
+            elif route in ("upload_base64", "recalibrate_base64"):
+                self.answer_json(200, json_result(json.loads(body)["image"]))
+            elif route == "upload_batch_base64":
+                self.answer_json(200, {"results": [json_result(image) for image in json.loads(body)["images"]]})
+            else:
+                self.answer_json(404, {"error": f"Unknown route {route}"})
+        except (ValueError, KeyError) as e:
+            self.answer_json(400, {"error": str(e)})
+
+    def answer_json(self, status, data):
+        self.answer(status, json.dumps(data).encode("utf-8"), "application/json")
+
+    def answer(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            print("inference_stub:", format % args)
+
+
+def make_server(host="127.0.0.1", port=5000, quiet=False):
+    """
+    Creates the stub server, port 0 picks a free port (see server_address).
+
+    Args:
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+        quiet (bool): Do not log the requests.
+
+    Returns:
+        ThreadingHTTPServer: Call serve_forever (or start_in_thread) to answer requests.
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.quiet = quiet
+    return server
+
+
+def start_in_thread(server):
+    """
+    Answers requests from a daemon thread, for tests. Stop it with server.shutdown().
+    """
+    thread = threading.Thread(target=server.serve_forever, name="inference-stub", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the compute server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port)
+    print(f"Inference stub on http://{args.host}:{args.port} ...")
+    server.serve_forever()
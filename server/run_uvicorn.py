@@ -0,0 +1,8 @@
+import uvicorn
+
+# ASGI counterpart of run_waitress.py, needed for the live /events/ stream of the view page.
+# server/asgi.py starts the background workers when uvicorn loads it.
+# Guarded: the image re-encoding pool (egglytics/views/imaging.py) spawns processes that import this file again
+if __name__ == "__main__":
+    print("Starting Uvicorn server on http://0.0.0.0:8000 ...")
+    uvicorn.run("server.asgi:application", host="0.0.0.0", port=8000)
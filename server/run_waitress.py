@@ -16,5 +16,11 @@ if settings.DEBUG:
         }
     )
 
-print("Starting Waitress server on http://0.0.0.0:8000 ...")
-serve(application, host='0.0.0.0', port=8000, threads=16)
+# Guarded: the image re-encoding pool (egglytics/views/imaging.py) spawns processes that import this file again
+if __name__ == "__main__":
+    # Start the background workers right away so jobs left over from a previous run are resumed
+    from egglytics.views.jobs import start_workers
+    start_workers()
+
+    print("Starting Waitress server on http://0.0.0.0:8000 ...")
+    serve(application, host='0.0.0.0', port=8000, threads=16)
@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
 
 application = get_asgi_application()
+
+# Start the background workers with the server (like run_waitress.py) so jobs left over from a previous run are resumed
+from egglytics.views.jobs import start_workers  # noqa: E402
+start_workers()
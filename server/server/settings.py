@@ -146,5 +146,154 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 
+# ----------------------------------------------------------------------
+# Background processing queue (see egglytics/views/jobs.py)
+# ----------------------------------------------------------------------
+
+# Number of worker threads per server process that take jobs from the queue
+PROCESSING_WORKERS = config('PROCESSING_WORKERS', default=2, cast=int)
+
+# How many times a job is attempted before it is marked as failed
+PROCESSING_JOB_MAX_ATTEMPTS = config('PROCESSING_JOB_MAX_ATTEMPTS', default=3, cast=int)
+
+# Seconds to wait before the first retry, doubled on every attempt after
+PROCESSING_JOB_RETRY_BACKOFF = config('PROCESSING_JOB_RETRY_BACKOFF', default=30, cast=int)
+
+# Seconds without a heartbeat before a running job is considered abandoned and claimed again
+PROCESSING_JOB_LEASE = config('PROCESSING_JOB_LEASE', default=300, cast=int)
+
+# Seconds an idle worker waits before looking for new jobs
+PROCESSING_POLL_INTERVAL = config('PROCESSING_POLL_INTERVAL', default=2, cast=float)
+
+
+
+
+# ----------------------------------------------------------------------
+# Compute (inference) server (see egglytics/views/inference.py)
+# ----------------------------------------------------------------------
+
+INFERENCE_URL = config('INFERENCE_URL', default='http://127.0.0.1:5000')
+
+# Images of the same model and mode sent in one request to models with a batch route (1 disables batching)
+INFERENCE_BATCH_SIZE = config('INFERENCE_BATCH_SIZE', default=8, cast=int)
+
+# "json" (base64 images inside JSON) or "binary" (raw image bytes and packed result frames, see frames.py)
+INFERENCE_TRANSPORT = config('INFERENCE_TRANSPORT', default='json')
+
+# Images of the same model sent to the compute server at the same time, models that are not listed use "default"
+# ex. INFERENCE_WORKERS="polyegg_heatmap:4,my_model:2,default:1"
+INFERENCE_WORKERS = config(
+    'INFERENCE_WORKERS',
+    default='default:1',
+    cast=lambda value: {
+        name.strip(): int(count)
+        for name, count in (item.split(':') for item in value.split(',') if item.strip())
+    }
+)
+
+
+
+# ----------------------------------------------------------------------
+# Annotation writes (see egglytics/views/annotations.py)
+# ----------------------------------------------------------------------
+
+# Rows per INSERT statement when annotations are written with bulk_create
+ANNOTATION_BATCH_SIZE = config('ANNOTATION_BATCH_SIZE', default=1000, cast=int)
+
+# Points or rectangles of one image from which Postgres COPY is used instead of INSERT (0 disables COPY)
+ANNOTATION_COPY_THRESHOLD = config('ANNOTATION_COPY_THRESHOLD', default=5000, cast=int)
+
+# Original points of one image from which they are stored packed on the image instead of as rows (0 disables packing)
+COMPACT_POINTS_THRESHOLD = config('COMPACT_POINTS_THRESHOLD', default=1000, cast=int)
 
+# Pixels a removal sent by the editor may be off from the stored annotation (at most ANNOTATION_BUCKET_SIZE, see models.py)
+ANNOTATION_MATCH_RADIUS = config('ANNOTATION_MATCH_RADIUS', default=3, cast=int)
+
+# Points (or rects) in the editor's view above which they are sent as clusters (see editor.annotations_in_view)
+ANNOTATION_VIEW_MAX = config('ANNOTATION_VIEW_MAX', default=3000, cast=int)
+
+# Screen pixels covered by one cluster of the editor
+ANNOTATION_CLUSTER_PIXELS = config('ANNOTATION_CLUSTER_PIXELS', default=48, cast=int)
+
+# Columns (and rows) a verified grid may have, the editor's 512 pixel cells of an image up to 512 * 1024 pixels wide
+GRID_MAX_CELLS = config('GRID_MAX_CELLS', default=1024, cast=int)
+
+
+
+# ----------------------------------------------------------------------
+# Stored images (see egglytics/views/imaging.py)
+# ----------------------------------------------------------------------
+
+# Final images of the compute server that are JPEGs up to this quality are stored without re-encoding (0 always re-encodes)
+IMAGE_STORE_MAX_QUALITY = config('IMAGE_STORE_MAX_QUALITY', default=90, cast=int)
+
+# Encoding of the images that are re-encoded
+IMAGE_JPEG_QUALITY = config('IMAGE_JPEG_QUALITY', default=70, cast=int)
+IMAGE_JPEG_OPTIMIZE = config('IMAGE_JPEG_OPTIMIZE', default=True, cast=bool)
+IMAGE_JPEG_PROGRESSIVE = config('IMAGE_JPEG_PROGRESSIVE', default=True, cast=bool)
+
+# Worker processes that re-encode images, 0 re-encodes in the processing threads
+IMAGE_ENCODE_PROCESSES = config('IMAGE_ENCODE_PROCESSES', default=2, cast=int)
+
+# JPEG quality of the preview the editor shows while the full image loads
+PREVIEW_JPEG_QUALITY = config('PREVIEW_JPEG_QUALITY', default=20, cast=int)
+
+# Images of at least this many pixels get a Deep Zoom tile pyramid for the editor (0 disables tiles)
+TILE_MIN_PIXELS = config('TILE_MIN_PIXELS', default=16_000_000, cast=int)
+TILE_SIZE = config('TILE_SIZE', default=254, cast=int)
+TILE_OVERLAP = config('TILE_OVERLAP', default=1, cast=int)
+TILE_JPEG_QUALITY = config('TILE_JPEG_QUALITY', default=70, cast=int)
+
+# Thumbnails served by serve_thumbnail are cached here, least recently used ones are removed above the size limit
+THUMBNAIL_CACHE_DIR = config('THUMBNAIL_CACHE_DIR', default=str(MEDIA_ROOT / 'cache' / 'thumbnails'))
+THUMBNAIL_CACHE_MAX_BYTES = config('THUMBNAIL_CACHE_MAX_BYTES', default=512 * 1024 * 1024, cast=int)
+
+
+
+# ----------------------------------------------------------------------
+# Chunked uploads (see egglytics/views/chunked_upload.py)
+# ----------------------------------------------------------------------
+
+# Bytes per chunk, every chunk but the last of a file must have exactly this size
+UPLOAD_CHUNK_SIZE = config('UPLOAD_CHUNK_SIZE', default=8 * 1024 * 1024, cast=int)
+
+# Limits of one upload session, the upload page enforces the same ones
+UPLOAD_MAX_FILES = config('UPLOAD_MAX_FILES', default=100, cast=int)
+UPLOAD_MAX_FILE_SIZE = config('UPLOAD_MAX_FILE_SIZE', default=500 * 1024 * 1024, cast=int)
+
+# Seconds an unfinished upload session is kept (and can be resumed) after its last chunk
+UPLOAD_SESSION_TTL = config('UPLOAD_SESSION_TTL', default=24 * 60 * 60, cast=int)
+
+
+
+# ----------------------------------------------------------------------
+# Batch status polling (see egglytics/views/view.py batch_status)
+# ----------------------------------------------------------------------
+
+# Batches updated this many seconds before the "since" cursor are sent again, a change whose
+# transaction committed after the previous poll is never missed
+BATCH_STATUS_OVERLAP_SECONDS = config('BATCH_STATUS_OVERLAP_SECONDS', default=5, cast=int)
+
+
+
+# ----------------------------------------------------------------------
+# Live events (see egglytics/views/events.py), only streamed when served through server/asgi.py
+# ----------------------------------------------------------------------
+
+# Seconds between keepalive comments of an idle stream, below the idle timeout of most proxies
+EVENTS_KEEPALIVE_SECONDS = config('EVENTS_KEEPALIVE_SECONDS', default=15, cast=int)
+
+# Seconds before the browser (and the listener thread) reconnect after losing their connection
+EVENTS_RECONNECT_SECONDS = config('EVENTS_RECONNECT_SECONDS', default=3, cast=int)
+
+# Events waiting for a slow stream, the ones beyond are dropped
+EVENTS_QUEUE_SIZE = config('EVENTS_QUEUE_SIZE', default=1000, cast=int)
+
+
+
+# ----------------------------------------------------------------------
+# Editor (see egglytics/views/editor.py apply_edits)
+# ----------------------------------------------------------------------
 
+# Operations accepted in one request of the editor's edit queue
+EDITOR_MAX_OPS = config('EDITOR_MAX_OPS', default=1000, cast=int)